@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Excerpt benchmark
+    ~~~~~~~~~~~~~~~~~
+
+    Compare the time `TextHighlighter.make_sample` and `ExcerptBuilder`
+    need for the excerpts of a search result page.  The texts are random
+    sentences built from a small vocabulary, some of them contain the
+    query terms.
+
+    Usage::
+
+        bench_excerpts.py [texts per page] [text length] [rounds]
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+import sys
+import random
+from time import time
+from inyoka.utils.highlight import TextHighlighter, ExcerptBuilder, \
+     get_plaintext
+
+
+WORDS = (u'ubuntu paket installieren fehler grafikkarte treiber kernel '
+         u'neustart terminal befehl datei ordner rechte benutzer netzwerk '
+         u'verbindung drucker häuser straße einstellungen problem lösung '
+         u'anleitung system update version partition festplatte').split()
+QUERY = [u'grafikkarte', u'treiber']
+
+
+def make_text(length):
+    words = []
+    chars = 0
+    while chars < length:
+        sentence = u' '.join(random.choice(WORDS) for x in
+                             xrange(random.randint(4, 12)))
+        words.append(u'<p>%s.</p>' % sentence.capitalize())
+        chars += len(sentence) + 8
+    return u'\n'.join(words)
+
+
+def bench(func, texts, rounds):
+    best = None
+    for x in xrange(rounds):
+        start = time()
+        func(texts)
+        duration = time() - start
+        best = best is None and duration or min(best, duration)
+    return best
+
+
+def old_excerpts(texts):
+    for text in texts:
+        TextHighlighter().make_sample(text, QUERY, 250,
+                                      [u'<strong>', u'</strong>'])
+
+
+def new_excerpts(texts):
+    builder = ExcerptBuilder(QUERY)
+    for text in texts:
+        builder.build(text)
+
+
+def new_excerpts_plain(texts):
+    builder = ExcerptBuilder(QUERY)
+    for text in texts:
+        builder.build(text, plain=True)
+
+
+def main(count=25, length=5000, rounds=20):
+    random.seed(0)
+    texts = [make_text(length) for x in xrange(count)]
+    plain = [get_plaintext(text) for text in texts]
+    print 'excerpts for %d texts of %d characters, best of %d rounds' % (
+        count, length, rounds)
+    old = bench(old_excerpts, texts, rounds)
+    print 'make_sample:                 %8.2f ms' % (old * 1000)
+    for name, func, data in (('ExcerptBuilder (html)', new_excerpts, texts),
+                             ('ExcerptBuilder (plaintext)',
+                              new_excerpts_plain, plain)):
+        new = bench(func, data, rounds)
+        print '%-28s %8.2f ms (%.1fx)' % (name + ':', new * 1000, old / new)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Lexer benchmark
+    ~~~~~~~~~~~~~~~
+
+    Measure the tokens per second of the wiki lexer and of the old engine
+    that tried every rule at every position (the reference lexer of the
+    differential test).  The pages are built from the test corpus and from
+    longer paragraphs of plain text like most wiki pages and forum posts.
+
+    Usage::
+
+        bench_lexer.py [pages] [paragraphs per page] [rounds]
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+import os
+import sys
+import imp
+import random
+from time import time
+from inyoka.wiki.parser.lexer import Lexer
+
+# the tests package sets up a test instance on import, load the module alone
+_engine_test = imp.load_source('test_wiki_lexer_engine', os.path.join(
+    os.path.dirname(__file__), '..', 'tests', 'wiki',
+    'test_wiki_lexer_engine.py'))
+ReferenceLexer = _engine_test.ReferenceLexer
+make_corpus = _engine_test.make_corpus
+
+
+WORDS = (u'ubuntu paket installieren fehler grafikkarte treiber kernel '
+         u'neustart terminal befehl datei ordner rechte benutzer netzwerk '
+         u'verbindung drucker häuser straße einstellungen problem lösung '
+         u'anleitung system update version partition festplatte').split()
+
+
+def make_page(snippets, paragraphs):
+    result = []
+    for x in xrange(paragraphs):
+        words = [random.choice(WORDS) for y in xrange(random.randint(30, 80))]
+        for y in xrange(random.randint(0, 3)):
+            words.insert(random.randint(0, len(words)),
+                         random.choice(snippets))
+        result.append(u' '.join(words))
+    return u'\n\n'.join(result)
+
+
+def bench(lexer, pages, rounds):
+    best = None
+    for x in xrange(rounds):
+        start = time()
+        tokens = 0
+        for page in pages:
+            for token in lexer.tokenize(page):
+                tokens += 1
+        duration = time() - start
+        best = best is None and duration or min(best, duration)
+    return tokens, best
+
+
+def main(count=20, paragraphs=30, rounds=5):
+    random.seed(0)
+    snippets = make_corpus()
+    pages = [make_page(snippets, paragraphs) for x in xrange(count)]
+    print '%d pages, %d characters, best of %d rounds' % (
+        count, sum(len(page) for page in pages), rounds)
+    tokens, old = bench(ReferenceLexer(), pages, rounds)
+    print 'old engine: %8.2f ms %10d tokens/sec' % (old * 1000, tokens / old)
+    tokens, new = bench(Lexer(), pages, rounds)
+    print 'scanner:    %8.2f ms %10d tokens/sec (%.1fx)' % (
+        new * 1000, tokens / new, old / new)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Parser benchmark
+    ~~~~~~~~~~~~~~~~
+
+    Measure the time the wiki parser needs for a corpus of pages and posts,
+    the memory of the node trees and the peak memory of the process.  Pass
+    a directory with markup files (for example exported wiki pages and
+    forum posts, one per file) or the benchmark builds pages from the
+    lexer test corpus.  The transformers run without the smilies, they
+    need the database.
+
+    Usage::
+
+        bench_parser.py [directory] [rounds]
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+import os
+import sys
+import imp
+import random
+import resource
+from time import time
+from inyoka.wiki.parser import Parser
+from inyoka.wiki.parser.transformers import DEFAULT_TRANSFORMERS, \
+     SmileyInjector
+
+# the tests package sets up a test instance on import, load the module alone
+_engine_test = imp.load_source('test_wiki_lexer_engine', os.path.join(
+    os.path.dirname(__file__), '..', 'tests', 'wiki',
+    'test_wiki_lexer_engine.py'))
+
+
+WORDS = (u'ubuntu paket installieren fehler grafikkarte treiber kernel '
+         u'neustart terminal befehl datei ordner rechte benutzer netzwerk '
+         u'verbindung drucker häuser straße einstellungen problem lösung '
+         u'anleitung system update version partition festplatte').split()
+BLOCKS = [
+    u"= %s =\n", u"== %s ==\n", u" * %s\n * ''%s''\n  * %s\n",
+    u" 1. %s\n 1. '''%s'''\n", u"||<-2 rowclass=\"kopf\"> %s ||\n"
+    u"|| %s || [:Seite:%s] ||\n", u"{{{\nsudo %s\n}}}\n",
+    u"{{|<title=\"Hinweis\">\n%s ((%s))\n|}}\n", u"> %s\n>> %s\n",
+    u"[color=red]%s[/color] [mark]%s[/mark] `%s`\n"
+]
+
+
+def make_page(snippets, size):
+    result = []
+    length = 0
+    while length < size:
+        if random.random() < 0.3:
+            block = random.choice(BLOCKS)
+            text = block % tuple(random.choice(WORDS) for x in
+                                 xrange(block.count('%s')))
+        else:
+            words = [random.choice(WORDS) for x in
+                     xrange(random.randint(20, 60))]
+            words.insert(random.randint(0, len(words)),
+                         random.choice(snippets))
+            text = u' '.join(words) + u'\n\n'
+        result.append(text)
+        length += len(text)
+    return u''.join(result)
+
+
+def load_corpus(directory):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        f = file(os.path.join(directory, name))
+        try:
+            corpus.append(f.read().decode('utf-8'))
+        finally:
+            f.close()
+    return corpus
+
+
+def tree_size(tree):
+    """The memory of the node objects of a tree in bytes."""
+    size = 0
+    todo = [tree]
+    while todo:
+        node = todo.pop()
+        size += sys.getsizeof(node)
+        if hasattr(node, '__dict__'):
+            size += sys.getsizeof(node.__dict__)
+        if node.is_container:
+            size += sys.getsizeof(node.children)
+            todo.extend(node.children)
+    return size
+
+
+def parse(text):
+    transformers = [x for x in DEFAULT_TRANSFORMERS
+                    if not isinstance(x, SmileyInjector)]
+    return Parser(text, transformers, True).parse()
+
+
+def main(directory=None, rounds=5):
+    random.seed(0)
+    if directory:
+        corpus = load_corpus(directory)
+    else:
+        snippets = [x for x in _engine_test.make_corpus() if
+                    'vorlage' not in x.lower() and '[@' not in x and 'Bild' not in x]
+        corpus = [make_page(snippets, size) for size in
+                  [100000] * 2 + [20000] * 10 + [2000] * 100]
+    print '%d texts, %d characters, best of %d rounds' % (
+        len(corpus), sum(len(x) for x in corpus), int(rounds))
+    best = None
+    for x in xrange(int(rounds)):
+        start = time()
+        for text in corpus:
+            parse(text)
+        duration = time() - start
+        best = best is None and duration or min(best, duration)
+    print 'parse time:   %8.2f ms' % (best * 1000)
+    trees = [parse(text) for text in corpus]
+    print 'node trees:   %8.2f KB' % (sum(tree_size(tree) for tree in
+                                          trees) / 1024.0)
+    print 'peak memory:  %8.2f MB' % (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
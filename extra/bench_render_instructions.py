@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Render instruction benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Compare the size of the stored render instructions of wiki texts and
+    the time to decode and render them in the old format (a base64 encoded
+    pickle of the compiled instructions) and the current one (see
+    `inyoka.wiki.models.dump_instructions`).  The texts are generated
+    from a few markup blocks.
+
+    Usage::
+
+        bench_render_instructions.py [texts] [blocks per text] [rounds]
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+import sys
+import random
+import cPickle as pickle
+from time import time
+from inyoka.wiki import parser
+from inyoka.wiki.models import dump_instructions, load_instructions
+
+
+BLOCKS = [
+    u'= Überschrift %(n)d =\n',
+    u'Ein Absatz mit \'\'\'fettem\'\'\' und \'\'kursivem\'\' Text, der '
+    u'[http://example.com/%(n)d einen Link] enthält.\n\n',
+    u' * erster Punkt\n * zweiter Punkt mit `Code`\n  * eingerückt\n\n',
+    u'{{{\nsudo apt-get install paket-%(n)d\nsudo apt-get update\n}}}\n\n',
+    u'{{{#!code python\ndef foo(x):\n    return x * %(n)d\n}}}\n\n',
+    u'||<-2> Tabelle %(n)d ||\n|| links || rechts ||\n\n',
+    u'[[Inhaltsverzeichnis(2)]]\n\n',
+]
+
+
+def make_text(blocks):
+    return u''.join(random.choice(BLOCKS) % {'n': n} for n in xrange(blocks))
+
+
+def old_dump(instructions):
+    return pickle.dumps(instructions, protocol=0).encode('base64')
+
+
+def old_load(data):
+    return pickle.loads(data.decode('base64'))
+
+
+def bench(load, stored, rounds):
+    best = None
+    for x in xrange(rounds):
+        start = time()
+        for data in stored:
+            parser.render(load(data), parser.RenderContext())
+        duration = time() - start
+        best = best is None and duration or min(best, duration)
+    return best
+
+
+def main(count=50, blocks=40, rounds=10):
+    random.seed(0)
+    compiled = [parser.parse(make_text(blocks)).compile('html')
+                for x in xrange(count)]
+    print 'render %d texts of %d blocks, best of %d rounds' % (
+        count, blocks, rounds)
+    results = []
+    for name, dump, load in (('base64 pickle', old_dump, old_load),
+                             ('dump_instructions', dump_instructions,
+                              load_instructions)):
+        stored = [dump(instructions) for instructions in compiled]
+        size = sum(len(data) for data in stored)
+        results.append(bench(load, stored, rounds))
+        print '%-20s %8d bytes %8.2f ms (%.1fx)' % (name + ':', size,
+            results[-1] * 1000, results[0] / results[-1])
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
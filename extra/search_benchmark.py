@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Search benchmark
+    ~~~~~~~~~~~~~~~~
+
+    Measure indexing and searching with `inyoka.utils.search` on a synthetic
+    corpus.  The script creates forum posts, wiki pages, ikhaya articles and
+    planet entries in the configured database, indexes them with the search
+    adapters into a temporary xapian database and runs a fixed query mix
+    through `SearchSystem.query` as anonymous user.
+
+    It reports the indexed documents per second, the p50/p99 query latency
+    and the time spent building excerpts.  Some documents contain unique
+    phrases that must be among the first results of their query.
+
+    Usage::
+
+        search_benchmark.py [--scale=1] [--rounds=5] [--save=FILE]
+                            [--baseline=FILE] [--tolerance=0.2]
+
+    ``--save`` stores the results as baseline, ``--baseline`` compares them
+    with a stored baseline and exits with status 1 on a regression.
+
+    Only run this against a test database, the created objects are not
+    removed.
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+import sys
+import shutil
+import random
+import tempfile
+import simplejson
+from time import time
+from datetime import datetime, timedelta
+from optparse import OptionParser
+from inyoka.conf import settings
+settings.DEBUG = settings.DATABASE_DEBUG = False
+
+import inyoka.application
+import inyoka.utils.search
+from inyoka.portal.user import User
+from inyoka.forum.models import Forum, Topic, Post, Privilege
+from inyoka.forum.acl import PRIVILEGES_BITS
+from inyoka.wiki.models import Page
+from inyoka.ikhaya.models import Category, Article
+from inyoka.planet.models import Blog, Entry
+from inyoka.utils.database import session
+from inyoka.utils.highlight import ExcerptBuilder
+from inyoka.utils.search import search
+
+# register the adapters
+import inyoka.forum.search
+import inyoka.wiki.search
+
+
+WORDS = (u'ubuntu paket installieren fehler grafikkarte treiber kernel '
+         u'neustart terminal befehl datei ordner rechte benutzer netzwerk '
+         u'verbindung drucker einstellungen problem lösung anleitung system '
+         u'aktualisierung version partition festplatte bootloader grub '
+         u'desktop fenster maus tastatur sound lautsprecher mikrofon wlan '
+         u'router firewall server dienst konfiguration quelle abhängigkeit '
+         u'archiv sicherung programm browser firefox thunderbird kompilieren '
+         u'bibliothek modul speicher prozessor laptop akku bildschirm '
+         u'auflösung schrift sprache übersetzung repository schlüssel').split()
+
+#: (component, title, text) of documents that must be found by their query
+NEEDLES = [
+    ('f', u'Zebrafisch-Treiber startet nicht', u'zebrafisch kalibrierung'),
+    ('f', u'Quokka Backup bricht ab', u'quokka inkrementell'),
+    ('w', u'Okapi', u'okapi paketquelle einrichten'),
+    ('w', u'Pangolin Firewall', u'pangolin portfreigabe'),
+    ('i', u'Axolotl-Release erschienen', u'axolotl veröffentlichung'),
+    ('p', u'Mein Wombat-Desktop', u'wombat bildschirmfoto'),
+]
+
+#: the query mix, (query, area, sort)
+QUERIES = [
+    (u'grafikkarte', 'all', 'date'),
+    (u'grafikkarte treiber', 'all', 'relevance'),
+    (u'drucker OR scanner', 'all', 'magic'),
+    (u'kernel UND NICHT grub', 'all', 'date'),
+    (u'title:paket', 'all', 'relevance'),
+    (u'"netzwerk verbindung"', 'all', 'relevance'),
+    (u'festplatte', 'forum', 'date'),
+    (u'anleitung', 'wiki', 'relevance'),
+    (u'version', 'ikhaya', 'date'),
+    (u'desktop', 'planet', 'date'),
+    (u'nichtvorhanden', 'all', 'date'),
+] + [(text, 'all', 'relevance') for c, title, text in NEEDLES]
+
+AREAS = {'all': None, 'forum': 'f', 'wiki': 'w', 'ikhaya': 'i',
+         'planet': 'p'}
+
+
+class Corpus(object):
+    """Creates the synthetic documents, the ids are kept per component."""
+
+    def __init__(self, scale, seed=42):
+        self.random = random.Random(seed)
+        self.scale = scale
+        self.ids = dict((c, []) for c in 'fwip')
+        # zipf like distribution, the first words are the most common
+        self.weights = [1.0 / (idx + 1) for idx in xrange(len(WORDS))]
+        self.total = sum(self.weights)
+        self.now = datetime.utcnow()
+        # keeps the names unique if the benchmark runs more than once
+        self.stamp = int(time())
+
+    def word(self):
+        point = self.random.uniform(0, self.total)
+        for word, weight in zip(WORDS, self.weights):
+            point -= weight
+            if point <= 0:
+                return word
+        return WORDS[-1]
+
+    def sentences(self, count):
+        return u'\n\n'.join(
+            u' '.join(self.word() for x in xrange(self.random.randint(5, 15)))
+            .capitalize() + u'.' for x in xrange(count))
+
+    def title(self):
+        return u' '.join(self.word() for x in xrange(3)).capitalize()
+
+    def date(self):
+        return self.now - timedelta(minutes=self.random.randint(10, 10 ** 6))
+
+    def needles(self, component):
+        return [(t, s) for c, t, s in NEEDLES if c == component]
+
+    def create(self):
+        self.user = User.objects.get_system_user()
+        self.create_forum(50 * self.scale, 10)
+        self.create_wiki(200 * self.scale)
+        self.create_ikhaya(100 * self.scale)
+        self.create_planet(100 * self.scale)
+
+    def create_forum(self, topics, posts):
+        category = Forum(name=u'Benchmark %d' % self.stamp, parent=None)
+        forum = Forum(name=u'Benchmark Forum %d' % self.stamp,
+                      parent=category)
+        session.commit()
+        Privilege(forum, user=User.objects.get_anonymous_user(),
+                  positive=PRIVILEGES_BITS['read'], negative=0)
+        session.commit()
+        texts = [(self.title(), None) for x in xrange(topics)]
+        texts[:len(self.needles('f'))] = self.needles('f')
+        for title, needle in texts:
+            topic = Topic(title=title, author_id=self.user.id, forum=forum)
+            created = []
+            for idx in xrange(self.random.randint(1, posts)):
+                text = self.sentences(self.random.randint(1, 8))
+                if needle and idx == 0:
+                    text += u'\n\n' + needle
+                created.append(Post(topic=topic, text=text,
+                                    author_id=self.user.id,
+                                    pub_date=self.date()))
+            session.commit()
+            self.ids['f'].extend(post.id for post in created)
+
+    def create_wiki(self, count):
+        prefix = u'Benchmark/%d/' % self.stamp
+        texts = [(u'%s%d/%s' % (prefix, idx, self.title()), None)
+                 for idx in xrange(count)]
+        texts[:len(self.needles('w'))] = [(prefix + t, n) for t, n
+                                          in self.needles('w')]
+        for name, needle in texts:
+            text = self.sentences(self.random.randint(5, 30))
+            if needle:
+                text += u'\n\n' + needle
+            page = Page.objects.create(name.replace(u' ', u'_'), text,
+                                       self.user, note=u'benchmark')
+            self.ids['w'].append(page.id)
+
+    def create_ikhaya(self, count):
+        category = Category(name=u'Benchmark %d' % self.stamp)
+        category.save()
+        texts = [(self.title(), None) for x in xrange(count)]
+        texts[:len(self.needles('i'))] = self.needles('i')
+        for subject, needle in texts:
+            date = self.date()
+            article = Article(pub_date=date.date(), pub_time=date.time(),
+                              author_id=self.user.id, subject=subject,
+                              category_id=category.id,
+                              intro=self.sentences(2),
+                              text=self.sentences(10) + u'\n\n' +
+                                   (needle or u''),
+                              public=True, is_xhtml=False)
+            article.save()
+            self.ids['i'].append(article.id)
+
+    def create_planet(self, count):
+        blog = Blog(name=u'Benchmark', blog_url=u'http://example.com/',
+                    feed_url=u'http://example.com/feed')
+        blog.save()
+        texts = [(self.title(), None) for x in xrange(count)]
+        texts[:len(self.needles('p'))] = self.needles('p')
+        for idx, (title, needle) in enumerate(texts):
+            date = self.date()
+            text = u'<p>%s</p>' % self.sentences(8).replace(u'\n\n',
+                                                            u'</p><p>')
+            entry = Entry(blog=blog,
+                          guid=u'benchmark-%d-%d' % (self.stamp, idx),
+                          title=title, url=u'http://example.com/%d' % idx,
+                          text=text + (needle or u''), pub_date=date,
+                          updated=date, author=u'Benchmark')
+            entry.save()
+            self.ids['p'].append(entry.id)
+
+
+class TimedExcerptBuilder(ExcerptBuilder):
+    duration = 0
+
+    def build(self, text, plain=False):
+        start = time()
+        try:
+            return ExcerptBuilder.build(self, text, plain)
+        finally:
+            TimedExcerptBuilder.duration += time() - start
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def index(corpus):
+    count = 0
+    start = time()
+    for component, ids in sorted(corpus.ids.iteritems()):
+        if search.adapters[component].support_multi:
+            search.index_multi(component, ids)
+        else:
+            for id in ids:
+                search.index(component, id)
+        count += len(ids)
+    search.flush()
+    return count / (time() - start)
+
+
+def run_queries(rounds):
+    user = User.objects.get_anonymous_user()
+    inyoka.utils.search.ExcerptBuilder = TimedExcerptBuilder
+    TimedExcerptBuilder.duration = 0
+    latencies = []
+    top_titles = {}
+    try:
+        for query, area, sort in QUERIES:
+            for x in xrange(rounds):
+                start = time()
+                result = search.query(user, query, component=AREAS[area],
+                                      sort=sort)
+                latencies.append(time() - start)
+            top_titles[query] = [doc['title'] for doc in result.results[:10]]
+    finally:
+        inyoka.utils.search.ExcerptBuilder = ExcerptBuilder
+    pages = len(QUERIES) * rounds
+    return {
+        'query_p50_ms':     percentile(latencies, 50) * 1000,
+        'query_p99_ms':     percentile(latencies, 99) * 1000,
+        'excerpt_ms':       TimedExcerptBuilder.duration / pages * 1000,
+        'top_titles':       top_titles,
+    }
+
+
+def check(results, baseline, tolerance):
+    """Return a list of regressions."""
+    errors = []
+    for component, title, text in NEEDLES:
+        # wiki titles are page names
+        top = [t.replace(u'_', u' ') for t in results['top_titles'][text][:3]]
+        if not [t for t in top if t.endswith(title)]:
+            errors.append(u'%r not found by %r' % (title, text))
+    if baseline is None:
+        return errors
+    if results['index_docs_per_sec'] < \
+       baseline['index_docs_per_sec'] * (1 - tolerance):
+        errors.append('indexing got slower')
+    for key in ('query_p50_ms', 'query_p99_ms', 'excerpt_ms'):
+        if results[key] > baseline[key] * (1 + tolerance):
+            errors.append('%s got slower' % key)
+    for query, titles in baseline['top_titles'].iteritems():
+        current = results['top_titles'].get(query, [])
+        if titles and len(set(titles) & set(current)) < 0.8 * len(titles):
+            errors.append(u'the results of %r changed' % query)
+    return errors
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--scale', type='int', default=1)
+    parser.add_option('--rounds', type='int', default=5)
+    parser.add_option('--save', metavar='FILE')
+    parser.add_option('--baseline', metavar='FILE')
+    parser.add_option('--tolerance', type='float', default=0.2)
+    options, args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix='inyoka-search-benchmark-')
+    settings.XAPIAN_DATABASE = path
+    settings.XAPIAN_READ_DATABASES = []
+    settings.SEARCH_RESULT_CACHE_TIMEOUT = 0
+    search.close()
+    search._readers = None
+    try:
+        print 'Creating the corpus'
+        corpus = Corpus(options.scale)
+        corpus.create()
+        print 'Indexing %d documents' % sum(map(len, corpus.ids.values()))
+        results = {'index_docs_per_sec': index(corpus)}
+        print 'Running %d queries %d times' % (len(QUERIES), options.rounds)
+        results.update(run_queries(options.rounds))
+    finally:
+        search.close()
+        search._readers = None
+        shutil.rmtree(path)
+
+    print 'indexing:  %8.1f documents/s' % results['index_docs_per_sec']
+    print 'query p50: %8.2f ms' % results['query_p50_ms']
+    print 'query p99: %8.2f ms' % results['query_p99_ms']
+    print 'excerpts:  %8.2f ms per result page' % results['excerpt_ms']
+
+    baseline = None
+    if options.baseline:
+        f = open(options.baseline)
+        try:
+            baseline = simplejson.load(f)
+        finally:
+            f.close()
+    errors = check(results, baseline, options.tolerance)
+    if options.save:
+        f = open(options.save, 'w')
+        try:
+            simplejson.dump(results, f, indent=2)
+        finally:
+            f.close()
+    for error in errors:
+        print (u'REGRESSION: %s' % error).encode('utf-8')
+    return errors and 1 or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
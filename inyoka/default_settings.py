@@ -38,6 +38,19 @@ DATABASE_NAME = DATABASE_USER = DATABASE_HOST = DATABASE_PORT = ''
 # mysql only
 DATABASE_ENGINE = 'mysql'
 
+# connection pooling.  If disabled every request opens a new connection
+# to the database server (NullPool).  The pool settings are per worker
+# process.
+DATABASE_POOLING = True
+DATABASE_POOL_SIZE = 5
+DATABASE_POOL_MAX_OVERFLOW = 10
+DATABASE_POOL_TIMEOUT = 10
+# seconds after that a connection is recycled, should be lower than the
+# `wait_timeout` of the database server.
+DATABASE_POOL_RECYCLE = 25
+# ping connections on checkout to detect connections the server killed
+DATABASE_POOL_PRE_PING = True
+
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
 # although not all choices may be avilable on all operating systems.
@@ -94,16 +107,68 @@ USE_ETAGS = True
 # prefix for the system mails
 EMAIL_SUBJECT_PREFIX = u'ubuntuusers: '
 
+# how mails are sent: 'sendmail', 'smtp' (using EMAIL_HOST, EMAIL_PORT,
+# EMAIL_HOST_USER, EMAIL_HOST_PASSWORD and EMAIL_USE_TLS) or 'file'
+MAIL_BACKEND = 'sendmail'
+# number of idle smtp connections kept per process
+MAIL_SMTP_POOL_SIZE = 2
+# the directory the file backend writes the mails to
+MAIL_FILE_PATH = join(BASE_PATH, 'mails')
+
+# send notifications from `scripts/send_notifications.py` instead of
+# within the request
+NOTIFICATIONS_QUEUED = True
+# give up delivering a queued notification after that many tries
+NOTIFICATION_MAX_ATTEMPTS = 5
+
 # path to the xapian database
 # Examples: /path/to/inyoka.xapdb, or tcpsrv://localhost:3000/
 XAPIAN_DATABASE = join(BASE_PATH, 'inyoka.xapdb')
 
+# databases used for searching, e.g. replicas of XAPIAN_DATABASE at
+# tcpsrv:// urls.  Connections are opened round-robin.  Defaults to
+# XAPIAN_DATABASE.
+XAPIAN_READ_DATABASES = []
+# number of idle search connections kept per process
+SEARCH_READER_POOL_SIZE = 4
+# seconds a failed search database is not used
+SEARCH_REPLICA_RETRY_INTERVAL = 30
+# seconds between reopens of remote search databases, local ones are
+# only reopened if they changed
+SEARCH_REOPEN_INTERVAL = 1
+# attempts to run a search if the database changes while reading
+SEARCH_QUERY_ATTEMPTS = 4
+
+# number of search queue entries the indexer claims at once
+SEARCH_INDEX_BLOCK_SIZE = 1000
+# the indexer flushes the search index after that many documents or seconds
+SEARCH_FLUSH_DOCUMENTS = 1000
+SEARCH_FLUSH_INTERVAL = 30
+# time in seconds the indexer daemon waits if the queue is empty
+SEARCH_DAEMON_INTERVAL = 5
+# give up indexing a queued document after that many tries
+SEARCH_MAX_ATTEMPTS = 5
+# seconds after which queue entries claimed by an indexer that did not
+# store them (because it was killed) are indexed again
+SEARCH_CLAIM_TIMEOUT = 3600
+# seconds a search result page is cached (per index revision), 0 disables
+SEARCH_RESULT_CACHE_TIMEOUT = 300
+# maximal length of the text stored in the search index for excerpts
+SEARCH_DISPLAY_TEXT_LENGTH = 2000
+# number of documents indexed into one shard by `scripts/search_rebuild.py`
+SEARCH_REBUILD_SHARD_SIZE = 50000
+# the xapian-compact binary used to merge the shards
+XAPIAN_COMPACT = 'xapian-compact'
+
 # imagemagick path. leave empty for auto detection
 IMAGEMAGICK_PATH = ''
 
 # forum settings
 FORUM_LIMIT_UNREAD = 100
 FORUM_TOPIC_CACHE = 100
+# time in seconds after which the materialized topic list of a forum's first
+# pages is built again from the database
+FORUM_TOPIC_LIST_TIMEOUT = 300
 FORUM_THUMBNAIL_SIZE = (64, 64)
 # time in seconds after posting a user is allowed to edit/delete his own posts,
 # for posts (without, with) replies. -1 for infinitely, 0 for never
@@ -128,6 +193,17 @@ GOOGLE_MAPS_APIKEY = ''
 # wiki settings
 WIKI_MAIN_PAGE = 'Startseite'
 
+# time in seconds the render instructions of wiki texts are cached
+WIKI_INSTRUCTIONS_CACHE_TIMEOUT = 86400
+
+# time in seconds the rendered pages for anonymous users are cached
+WIKI_FRAGMENT_CACHE_TIMEOUT = 86400
+
+# maximum number and depth of the pages that are invalidated because a page
+# they embed changed (see `scripts/wiki_invalidate`)
+WIKI_INVALIDATION_LIMIT = 2000
+WIKI_INVALIDATION_DEPTH = 10
+
 # The forum that should contain the wiki discussions
 WIKI_DISCUSSION_FORUM = 'diskussionen'
 
@@ -149,6 +225,30 @@ MEMCACHE_SERVERS = []
 # key collision.
 CACHE_PREFIX = 'ubuntu_de/'
 
+# hot keys that rarely change are additionally cached in the memory of
+# every worker process.  Maps key prefixes to the time to live in seconds.
+# Keys of that prefixes must be deleted using `request_cache` so that the
+# other processes get notified.  Set to an empty dict to disable.
+CACHE_PROCESS_TIERS = {
+    'forum/slugs':          300,
+    'forum/forums/':        60,
+    'forum/acls/anonymous': 300,
+    'wiki/page_index':      60,
+    'wiki/storage/':        300,
+}
+# prefixes whose values are copied (pickled) for every request, required
+# for database objects.
+CACHE_PROCESS_COPY = ['forum/forums/']
+# maximum number of keys in the process cache
+CACHE_PROCESS_SIZE = 1000
+
+# time in seconds the autocompletion indexes are cached, they are kept up
+# to date by the model hooks
+COMPLETION_CACHE_TIMEOUT = 86400
+# maximum number of names in one cached shard of an autocompletion index,
+# bigger shards are split to stay below the item size limit of memcached
+COMPLETION_SHARD_SIZE = 5000
+
 MIDDLEWARE_CLASSES = (
     'inyoka.middlewares.common.CommonServicesMiddleware',
     'inyoka.middlewares.session.AdvancedSessionMiddleware',
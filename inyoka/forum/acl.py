@@ -10,7 +10,7 @@
 """
 import operator as ops
 from inyoka.utils.database import db
-from inyoka.utils.cache import cache
+from inyoka.utils.cache import request_cache
 
 
 PRIVILEGES_DETAILS = [
@@ -91,10 +91,10 @@ def _get_privilege_map(user, forum_ids):
     # Once we get an authenticated user we filter for the ids requested.
     cache_key = 'forum/acls/anonymous'
     if user.is_anonymous:
-        result = cache.get(cache_key)
+        result = request_cache.get(cache_key)
         if result is None:
             privilege_map = query.all()
-            cache.set(cache_key, privilege_map, 86400)
+            request_cache.set(cache_key, privilege_map, 86400)
         else:
             privilege_map = list(query.merge_result(result, False))
         # filter the privilege_map for ids not requested (api compatibility)
@@ -19,7 +19,9 @@ from PIL import Image
 from time import time
 from datetime import datetime
 from itertools import groupby
+from sqlalchemy.orm.attributes import get_history
 from operator import attrgetter
+from bisect import bisect_right
 
 from django.core.files.storage import default_storage
 from django.utils.encoding import force_unicode, DjangoUnicodeDecodeError
@@ -33,7 +35,9 @@ from inyoka.utils.dates import timedelta_to_seconds
 from inyoka.utils.html import escape
 from inyoka.utils.urls import href
 from inyoka.utils.search import search
-from inyoka.utils.cache import cache, request_cache
+from inyoka.utils.cache import cache, request_cache, CacheNamespace, \
+    get_or_create, update_cached
+from inyoka.utils.completion import PrefixIndex
 from inyoka.utils.local import current_request
 from inyoka.utils.decorators import deferred
 from inyoka.utils.imaging import get_thumbnail
@@ -54,6 +58,17 @@ POSTS_PER_PAGE = 15
 TOPICS_PER_PAGE = 30
 CACHE_PAGES_COUNT = 5
 
+#: the cached topic lists of a forum, invalidated on every change of a topic
+topic_list_cache = CacheNamespace('forum/topics')
+
+
+def _load_topic_slugs(shard):
+    return [row.slug for row in db.session.query(Topic.slug)
+                                  .filter(Topic.slug.startswith(shard))]
+
+#: the topic slugs for the autocompletion of the split topic form
+topic_completion = PrefixIndex('forum/topics', _load_topic_slugs)
+
 
 class UbuntuVersion(object):
     """holds the ubuntu versions. implement this as a model in SA!"""
@@ -181,11 +196,11 @@ class ForumQuery(db.Query):
             # we only select one forum and query only one if it's
             # not cached yet.
             query = self.get_eager().filter_by(slug=slug)
-            forum = cache.get('forum/forums/%s' % slug)
+            forum = request_cache.get('forum/forums/%s' % slug)
             if forum is None:
                 forum = query.first()
                 if forum:
-                    cache.set('forum/forums/%s' % slug, forum, 300)
+                    request_cache.set('forum/forums/%s' % slug, forum, 300)
             else:
                 forum = db.session.merge(forum, load=False)
             return forum
@@ -207,17 +222,17 @@ class ForumQuery(db.Query):
 class ForumMapperExtension(db.MapperExtension):
 
     def after_update(self, mapper, connection, instance):
-        cache.delete('forum/forums/%s' % instance.slug)
+        request_cache.delete('forum/forums/%s' % instance.slug)
         return db.EXT_CONTINUE
 
     def after_insert(self, mapper, connection, instance):
-        cache.delete('forum/forums/%s' % instance.slug)
-        cache.delete('forum/slugs')
+        request_cache.delete('forum/forums/%s' % instance.slug)
+        request_cache.delete('forum/slugs')
         return db.EXT_CONTINUE
 
     def after_delete(self, mapper, connection, instance):
-        cache.delete('forum/forums/%s' % instance.slug)
-        cache.delete('forum/slugs')
+        request_cache.delete('forum/forums/%s' % instance.slug)
+        request_cache.delete('forum/slugs')
         return db.EXT_CONTINUE
 
 
@@ -230,6 +245,127 @@ class TopicQuery(db.Query):
         return self.options(*options).filter_by(forum_id=forum_id).order_by(*order)
 
 
+class TopicList(object):
+    """
+    The materialized topic list of the first `CACHE_PAGES_COUNT` pages of a
+    forum together with the number of topics in it, so that those pages
+    never run the sort query.  The list is built on first access and kept
+    up to date by the mapper extensions of topics and posts::
+
+        topic_ids, topic_count = TopicList(forum.id).get_page(page)
+
+    The entries are ``[topic_id, last_post_id]`` pairs, the sticky topics
+    and the other topics are kept in two lists ordered like the forum view.
+    The list is built through `get_or_create` and changed under the same
+    lock, an update that collides with a running build drops the list.
+    Whatever else goes wrong (a rolled back transaction) is corrected after
+    `TOPIC_LIST_TIMEOUT` seconds, when the list is built again.
+    """
+    capacity = CACHE_PAGES_COUNT * TOPICS_PER_PAGE
+
+    def __init__(self, forum_id):
+        self.forum_id = forum_id
+        self.key = 'forum/topiclist/%d' % forum_id
+
+    def build(self):
+        query = db.session.query(Topic.id, Topic.last_post_id) \
+                          .filter(Topic.forum_id == self.forum_id) \
+                          .order_by(Topic.last_post_id.desc())
+        sticky = [list(r) for r in query.filter(Topic.sticky == True)]
+        topics = [list(r) for r in query.filter(Topic.sticky == False)
+                                         .limit(self.capacity + 1)]
+        complete = len(topics) <= self.capacity
+        if complete:
+            count = len(sticky) + len(topics)
+        else:
+            del topics[self.capacity:]
+            count = query.order_by(None).count()
+        return {
+            'sticky':   sticky,
+            'topics':   topics,
+            'count':    count,
+            'complete': complete,
+        }
+
+    def get(self, rebuild=False):
+        if rebuild:
+            self.invalidate()
+        return get_or_create(self.key, self.build,
+                             settings.FORUM_TOPIC_LIST_TIMEOUT)
+
+    def get_page(self, page):
+        """
+        Return the topic ids of `page` and the number of topics in the forum
+        or `None` if the page is not part of the materialized list.
+        """
+        def _get_page(data):
+            ids = [t[0] for t in data['sticky']] + \
+                  [t[0] for t in data['topics']]
+            start = (page - 1) * TOPICS_PER_PAGE
+            end = start + TOPICS_PER_PAGE
+            if end > len(ids) and not data['complete']:
+                return None
+            return ids[start:end], data['count']
+
+        result = _get_page(self.get())
+        if result is None and page <= CACHE_PAGES_COUNT:
+            # deleted topics shrank the list, fill it up again
+            result = _get_page(self.get(rebuild=True))
+        return result
+
+    def _update(self, updater):
+        def _updater(item):
+            if item.__class__ is not tuple:
+                # a list stored by an older version
+                return None
+            updater(item[0])
+            return item
+        update_cached(self.key, _updater, settings.FORUM_TOPIC_LIST_TIMEOUT)
+
+    def add(self):
+        """Count a new topic, it is listed as soon as it has a post."""
+        def _add(data):
+            data['count'] += 1
+        self._update(_add)
+
+    def remove(self, topic_id):
+        """Remove a deleted topic."""
+        def _remove(data):
+            self._discard(data, topic_id)
+            data['count'] -= 1
+        self._update(_remove)
+
+    def touch(self, topic_id, last_post_id, sticky):
+        """
+        Move a topic to the place given by its (new) `last_post_id` and
+        `sticky` flag.
+        """
+        def _touch(data):
+            self._discard(data, topic_id)
+            entries = sticky and data['sticky'] or data['topics']
+            idx = bisect_right([-(t[1] or 0) for t in entries], -last_post_id)
+            if idx == len(entries) and not sticky and not data['complete']:
+                # the topic belongs behind the materialized pages
+                return
+            entries.insert(idx, [topic_id, last_post_id])
+            if len(data['topics']) > self.capacity:
+                del data['topics'][self.capacity:]
+                data['complete'] = False
+        self._update(_touch)
+
+    def invalidate(self):
+        # also keeps a build that is running from storing the old list
+        update_cached(self.key, lambda data: None)
+
+    @staticmethod
+    def _discard(data, topic_id):
+        for entries in data['sticky'], data['topics']:
+            for idx, (id, last_post_id) in enumerate(entries):
+                if id == topic_id:
+                    del entries[idx]
+                    return
+
+
 class TopicMapperExtension(db.MapperExtension):
 
     def before_insert(self, mapper, connection, instance):
@@ -246,6 +382,14 @@ class TopicMapperExtension(db.MapperExtension):
             connection.execute(Forum.__table__.update(Forum.id.in_(parent_ids), {
                 'topic_count': Forum.topic_count + 1
             }))
+        TopicList(instance.forum_id).add()
+        topic_completion.add(instance.slug)
+        return db.EXT_CONTINUE
+
+    def after_update(self, mapper, connection, instance):
+        if instance.last_post_id and get_history(instance, 'sticky')[0]:
+            TopicList(instance.forum_id).touch(instance.id,
+                instance.last_post_id, instance.sticky)
         return db.EXT_CONTINUE
 
     def before_delete(self, mapper, connection, instance):
@@ -276,6 +420,9 @@ class TopicMapperExtension(db.MapperExtension):
             delete from portal_subscription where topic_id = %s;
         ''', [instance.id])
 
+        TopicList(instance.forum_id).remove(instance.id)
+        topic_completion.remove(instance.slug)
+
         connection.execute('''
             update wiki_page set topic_id = NULL where topic_id = %s;
         ''', [instance.id])
@@ -293,9 +440,11 @@ class PostMapperExtension(db.MapperExtension):
     def before_insert(self, mapper, connection, instance):
         if not instance.is_plaintext:
             instance.rendered_text = instance.render_text()
-        # XXX: race-conditions and other stupid staff... :/
-        # require a mysql update to work properly!
         if instance.position is None:
+            # lock the topic row so that concurrent replies are serialized
+            # and never get the same position.
+            connection.execute(db.select([Topic.id],
+                Topic.id == instance.topic_id, for_update=True))
             instance.position = connection.execute(db.select(
                 [db.func.max(Post.position)+1],
                 Post.topic_id == instance.topic_id)).fetchone()[0] or 0
@@ -325,6 +474,8 @@ class PostMapperExtension(db.MapperExtension):
             'last_post_id': instance.id
         }))
         instance.topic.cached_forum().invalidate_topic_cache()
+        TopicList(instance.topic.forum_id).touch(instance.topic_id,
+            instance.id, instance.topic.sticky)
         search.queue('f', instance.id)
         return db.EXT_CONTINUE
 
@@ -370,14 +521,17 @@ class PostMapperExtension(db.MapperExtension):
         # set the last post id for the topic
         if instance.id == instance.topic.last_post_id:
             new_last_post = Post.query.filter(db.and_(
-                Topic.id == instance.topic_id,
+                Post.topic_id == instance.topic_id,
                 Post.id != instance.id
             )).order_by(Post.id.desc()).first()
-            connection.execute(Topic.__table__.update(
-                db.and_(Topic.id == instance.topic_id,
-                        Topic.last_post_id == instance.id),
-                values={'last_post_id': new_last_post.id}
-            ))
+            if new_last_post is not None:
+                connection.execute(Topic.__table__.update(
+                    db.and_(Topic.id == instance.topic_id,
+                            Topic.last_post_id == instance.id),
+                    values={'last_post_id': new_last_post.id}
+                ))
+                TopicList(instance.topic.forum_id).touch(instance.topic_id,
+                    new_last_post.id, instance.topic.sticky)
 
         if instance.id == instance.topic.forum.last_post_id:
             # we cannot loop over all posts in the forum so we cheat a bit
@@ -392,7 +546,7 @@ class PostMapperExtension(db.MapperExtension):
                         Forum.last_post_id == instance.id),
                 values={'last_post_id': new_last_post.id}
             ))
-            cache.delete('forum/forums/%s' % instance.topic.forum.slug)
+            request_cache.delete('forum/forums/%s' % instance.topic.forum.slug)
 
         # decrement post_counts
         connection.execute(Topic.__table__.update(
@@ -406,13 +560,9 @@ class PostMapperExtension(db.MapperExtension):
                 'post_count': Forum.post_count - 1
             }))
 
-        # decrement position
-        connection.execute(Post.__table__.update(db.and_(
-            Post.position > instance.position,
-            Post.topic_id == instance.topic_id), values={
-                'position': Post.position - 1
-            }
-        ))
+        # We don't renumber the following posts here, that would rewrite
+        # every later post of the topic within the request.  The positions
+        # get a gap instead which is closed by `scripts/renumber_posts.py`.
 
 
 class PrivilegeMapperExtension(db.MapperExtension):
@@ -420,7 +570,7 @@ class PrivilegeMapperExtension(db.MapperExtension):
     def _erase_anonymous_cache(self, instance):
         if instance.user_id and instance.user_id == 1:
             # anonymous user, erase cache
-            cache.delete('forum/acls/anonymous')
+            request_cache.delete('forum/acls/anonymous')
 
     def after_update(self, mapper, connection, instance):
         self._erase_anonymous_cache(instance)
@@ -520,17 +670,17 @@ class Forum(db.Model):
         The returned object do not include hidden objects!
         """
         limit = max(settings.FORUM_TOPIC_CACHE, count)
-        key = 'forum/latest_topics/%d' % self.id
-        topic_ids = (limit == 100) and cache.get(key) or None
-
-        if not topic_ids:
-            topic_ids = db.session.query(Topic.id) \
-                .filter(db.and_(Topic.forum_id == self.id, Topic.hidden == False)) \
-                .order_by(Topic.sticky.desc(), Topic.last_post_id.desc()) \
-                .limit(limit)
-            if limit == settings.FORUM_TOPIC_CACHE:
-                topic_ids = [t.id for t in topic_ids.all()]
-                cache.set(key, topic_ids, 300)
+        query = db.session.query(Topic.id) \
+            .filter(db.and_(Topic.forum_id == self.id, Topic.hidden == False)) \
+            .order_by(Topic.sticky.desc(), Topic.last_post_id.desc()) \
+            .limit(limit)
+
+        if limit == settings.FORUM_TOPIC_CACHE:
+            key = topic_list_cache.key(self.id, 'latest')
+            topic_ids = get_or_create(key,
+                lambda: [t.id for t in query.all()], 300)
+        else:
+            topic_ids = query
 
         topics = Topic.query \
                 .options(db.eagerload('author'),
@@ -592,8 +742,7 @@ class Forum(db.Model):
         user.save()
 
     def invalidate_topic_cache(self):
-        for page in xrange(CACHE_PAGES_COUNT):
-            cache.delete('forum/topics/%d/%d' % (self.id, page+1))
+        topic_list_cache.invalidate(self.id)
 
     @staticmethod
     def get_children_recursive(forums, parent=None, offset=0):
@@ -708,8 +857,10 @@ class Topic(db.Model):
             'post_count': Forum.post_count + self.post_count,
         }))
         db.session.commit()
-        forum.invalidate_topic_cache()
+        old_forum.invalidate_topic_cache()
         self.forum.invalidate_topic_cache()
+        TopicList(old_forum.id).invalidate()
+        TopicList(self.forum.id).invalidate()
         self.reindex()
 
         if old_forum.user_count_posts != forum.user_count_posts:
@@ -790,6 +941,28 @@ class Topic(db.Model):
     def paginated(self):
         return bool((self.post_count - 1) // POSTS_PER_PAGE)
 
+    def has_position_gaps(self):
+        """
+        Return `True` if the post positions of this topic are not gap-free
+        anymore (e.g. because a post was deleted) and thus can't be used to
+        find the posts of a page.  Run `scripts/renumber_posts.py` to fix it.
+        """
+        max_position = db.session.execute(db.select(
+            [db.func.max(Post.position)],
+            Post.topic_id == self.id)).scalar()
+        if max_position is None:
+            return False
+        return max_position + 1 != self.post_count
+
+    def get_position_column(self):
+        """
+        Return the `rownum_column` to paginate the posts of this topic with
+        or `None` if offset pagination is required.
+        """
+        if self.has_position_gaps():
+            return None
+        return Post.position
+
     def get_ubuntu_version(self):
         if self.ubuntu_version:
             return filter(lambda v: v.number == self.ubuntu_version, UBUNTU_VERSIONS)[0]
@@ -940,8 +1113,7 @@ class Post(db.Model):
         if post is None or post.topic is None:
             return
 
-        position, slug = post.position, post.topic.slug
-        page = max(0, position) // POSTS_PER_PAGE + 1
+        page, slug = post.page or 1, post.topic.slug
         url = href('forum', 'topic', slug, *(page != 1 and (page,) or ()))
         return u''.join((url, paramstr and '?%s' % paramstr or '', '#post-%d' % id))
 
@@ -995,11 +1167,23 @@ class Post(db.Model):
         """
         this returns None if page is 1, use post.page or 1 if you need number
         """
-        page = self.position // POSTS_PER_PAGE + 1
+        page = max(0, self.get_ordinal()) // POSTS_PER_PAGE + 1
         if page == 1:
             return None
         return page
 
+    def get_ordinal(self):
+        """
+        Return the zero-based index of this post in its topic.  That's the
+        position unless the topic has gaps in its numbering, in which case
+        the posts in front of this one are counted.
+        """
+        if not self.topic.has_position_gaps():
+            return self.position
+        return db.session.execute(db.select([db.func.count(Post.id)],
+            db.and_(Post.topic_id == self.topic_id,
+                    Post.position < self.position))).scalar()
+
     @staticmethod
     def split(posts, old_topic, new_topic):
         """
@@ -1113,6 +1297,8 @@ class Post(db.Model):
 
         new_topic.forum.invalidate_topic_cache()
         old_topic.forum.invalidate_topic_cache()
+        TopicList(new_topic.forum_id).invalidate()
+        TopicList(old_topic.forum_id).invalidate()
 
     @property
     def grouped_attachments(self):
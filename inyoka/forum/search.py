@@ -8,38 +8,30 @@
     :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
     :license: GNU GPL, see LICENSE for more details.
 """
+import xapian
 from inyoka.forum.acl import get_privileges, check_privilege
 from inyoka.forum.models import Post, Forum, Topic
 from inyoka.utils.urls import url_for, href
 from inyoka.utils.search import search, SearchAdapter
-from inyoka.utils.decorators import deferred
 from inyoka.utils.database import db
 
 
-class ForumSearchAuthDecider(object):
-    """Decides whether a user can display a search result or not."""
-
-    def __init__(self, user):
-        self.user = user
-
-    @deferred
-    def privs(self):
-        # the privileges are set on first call and not on init because this
-        # would create one useless query if the user e.g. just searched the
-        # wiki.
-        privs = get_privileges(self.user, [f.id for f in Forum.query.get_cached()])
-        return dict((id, check_privilege(priv, 'read'))
-            for id, priv in privs.iteritems())
-
-    def __call__(self, auth):
-        # TODO: Hide hidden topics
-        return self.privs.get(auth[0], False)
-
-
 class ForumSearchAdapter(SearchAdapter):
     type_id = 'f'
-    auth_decider = ForumSearchAuthDecider
     support_multi = True
+    # the last post of the topic changes with every reply
+    volatile_fields = ('last_post_url',)
+
+    def get_filter(self, user):
+        privs = get_privileges(user, [f.id for f in Forum.query.get_cached()])
+        readable = [xapian.Query('XF%d' % id) for id, priv in privs.iteritems()
+                    if check_privilege(priv, 'read')]
+        if not readable:
+            return False
+        # hidden posts and posts of hidden topics are never displayed
+        return xapian.Query(xapian.Query.OP_AND_NOT,
+                            xapian.Query(xapian.Query.OP_OR, readable),
+                            xapian.Query('XFH'))
 
     def store(self, post_id):
         post = Post.query.options(db.eagerload('topic'), db.eagerload('author'))
@@ -60,10 +52,12 @@ class ForumSearchAdapter(SearchAdapter):
                 collapse=post.topic_id,
                 category=[p.slug for p in forum.parents] + \
                     [forum.slug],
-                auth=[post.topic.forum_id, post.topic.hidden],
+                filter=['F%d' % post.topic.forum_id] +
+                       ((post.hidden or post.topic.hidden) and ['FH'] or []),
                 text=post.text,
                 solved='1' if post.topic.solved else '0',
                 version=post.topic.get_version_info(default=None),
+                display=self.get_display_data(post),
             )
         except AttributeError:
             pass
@@ -84,6 +78,9 @@ class ForumSearchAdapter(SearchAdapter):
                               .filter(Post.id.in_(ids)).all()
             for post in posts:
                 self._store_post(post)
+            # posts deleted in the meantime
+            for post_id in set(ids) - set(post.id for post in posts):
+                search.delete('f', post_id)
             # cleanup some stuff
             search.flush()
             db.session.commit()
@@ -106,6 +103,20 @@ class ForumSearchAdapter(SearchAdapter):
                 'last_post_url': href('forum', 'post', post.topic.last_post_id),
                 'user_url': url_for(post.author)}
 
+    def get_display_data(self, post):
+        data = SearchAdapter.get_display_data(self, post)
+        if data is not None:
+            data['topic_id'] = post.topic_id
+        return data
+
+    def update_display(self, docs):
+        topic_ids = set(doc['topic_id'] for doc in docs)
+        last_posts = dict(db.session.execute(db.select(
+            [Topic.id, Topic.last_post_id], Topic.id.in_(topic_ids))))
+        for doc in docs:
+            doc['last_post_url'] = href('forum', 'post',
+                                        last_posts.get(doc['topic_id']))
+
     def recv(self, post_id):
         post = Post.query.options(db.eagerload('topic'), db.eagerload('author'))
         post = post.get(post_id)
@@ -12,7 +12,8 @@
 from sqlalchemy.orm import eagerload
 from django.db import transaction
 
-from inyoka.forum.models import UBUNTU_VERSIONS, Topic, Post, Forum
+from inyoka.forum.models import UBUNTU_VERSIONS, Topic, Post, Forum, \
+    topic_completion
 from inyoka.forum.acl import get_forum_privileges, check_privilege, \
     have_privilege
 from inyoka.portal.models import Subscription
@@ -24,11 +25,10 @@ from inyoka.utils.database import session
 
 
 def on_get_topic_autocompletion(request):
-    qs = list(Topic.query.filter(Topic.slug.startswith(
-                                  request.GET.get('q', '')))[:11])
-    if len(qs) > 10:
-        qs[10] = '...'
-    return [x.slug for x in qs]
+    slugs = topic_completion.complete(request.GET.get('q', ''), 11)
+    if len(slugs) > 10:
+        slugs[10] = '...'
+    return slugs
 
 
 def on_get_post(request):
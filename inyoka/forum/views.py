@@ -9,6 +9,7 @@
     :license: GNU GPL, see LICENSE for more details.
 """
 import re
+from hashlib import md5
 from datetime import datetime, timedelta
 from operator import attrgetter
 
@@ -28,10 +29,10 @@ from inyoka.utils.http import templated, PageNotFound, HttpResponseRedirect
 from inyoka.utils.feeds import atom_feed, AtomFeed
 from inyoka.utils.flashing import flash
 from inyoka.utils.templating import render_template
-from inyoka.utils.pagination import Pagination
+from inyoka.utils.pagination import Pagination, KeysetPagination
 from inyoka.utils.notification import send_notification, notify_about_subscription
 from inyoka.utils.collections import flatten_iterator
-from inyoka.utils.cache import cache
+from inyoka.utils.cache import cache, get_or_create
 from inyoka.utils.dates import format_datetime
 from inyoka.utils.database import db
 from inyoka.utils.storage import storage
@@ -44,7 +45,7 @@ from inyoka.portal.user import User
 from inyoka.portal.models import Subscription
 from inyoka.forum.models import Forum, Topic, POSTS_PER_PAGE, Post, Poll, \
     TOPICS_PER_PAGE, PollVote, PollOption, Attachment, PostRevision, \
-    CACHE_PAGES_COUNT, WelcomeMessage, Privilege
+    CACHE_PAGES_COUNT, WelcomeMessage, Privilege, TopicList, topic_list_cache
 from inyoka.forum.compat import SAUser
 from inyoka.forum.forms import NewTopicForm, SplitTopicForm, EditPostForm, \
     AddPollForm, MoveTopicForm, ReportTopicForm, ReportListForm, \
@@ -150,31 +151,30 @@ def forum(request, slug, page=1):
     if fmsg is not None:
         return welcome(request, fmsg.slug, request.path)
 
-    #TODO: move that cache logic to model
-    if page < CACHE_PAGES_COUNT:
-        key = 'forum/topics/%d/%d' % (forum.id, int(page))
-        ctx = cache.get(key)
-    else:
-        ctx = None
-
-    if ctx is None:
-        topic_ids = db.session.query(Topic.id) \
-                              .filter_by(forum_id=forum.id) \
-                              .order_by(Topic.sticky.desc(), Topic.last_post_id.desc())
-        pagination = Pagination(request, topic_ids, page, TOPICS_PER_PAGE, url_for(forum))
+    def _get_topic_ids():
+        query = db.session.query(Topic.id, Topic.sticky, Topic.last_post_id) \
+                          .filter_by(forum_id=forum.id) \
+                          .order_by(Topic.sticky.desc(), Topic.last_post_id.desc())
+        pagination = KeysetPagination(request, query, page, TOPICS_PER_PAGE,
+            url_for(forum), keys=((Topic.sticky, True), (Topic.last_post_id, True)),
+            cursor_key='forum/cursors/%d/%%d' % forum.id,
+            count_key=topic_list_cache.key(forum.id, 'count'))
 
-        #TODO: investigate if it makes sense to store the topic-count of all forums
-        #      in the global cache and only increment and decrement it
-        ctx = {
+        return {
             'topic_ids':        [obj.id for obj in pagination.objects],
             'topic_count':      pagination.total
         }
 
-        if page < CACHE_PAGES_COUNT:
-            cache.set(key, ctx, 60)
+    result = None
+    if int(page) <= CACHE_PAGES_COUNT:
+        result = TopicList(forum.id).get_page(int(page))
+    if result is not None:
+        ctx = {'topic_ids': result[0], 'topic_count': result[1]}
     else:
-        pagination = Pagination(request, ctx['topic_ids'], page, TOPICS_PER_PAGE,
-                                url_for(forum), total=ctx['topic_count'])
+        ctx = _get_topic_ids()
+
+    pagination = Pagination(request, ctx['topic_ids'], page, TOPICS_PER_PAGE,
+                            url_for(forum), total=ctx['topic_count'])
 
     topics = Topic.query.filter_overview(forum.id) \
                                         .filter(Topic.id.in_(ctx['topic_ids'])).all()
@@ -279,7 +279,8 @@ def viewtopic(request, topic_slug, page=1):
         polls = None
 
     pagination = Pagination(request, posts, page, POSTS_PER_PAGE, url_for(t),
-                     total=t.post_count, rownum_column=Post.position)
+                     total=t.post_count,
+                     rownum_column=t.get_position_column())
 
     subscribed = True
     if request.user.is_authenticated:
@@ -780,8 +781,8 @@ def change_status(request, topic_slug, solved=None, locked=None):
         abort_access_denied(request)
     if solved is not None:
         topic.solved = solved
-        topic.reindex()
         db.session.commit()
+        topic.reindex()
         flash(u'Das Thema wurde als %s markiert' % (solved and u'gelöst' or \
                                                     u'ungelöst'), True)
     if locked is not None:
@@ -910,9 +911,9 @@ def report(request, topic_slug):
             topic.reporter_id = request.user.id
             db.session.commit()
 
-            users = (User.objects.get(id=int(i)) for i in
+            users = User.objects.get_many(i for i in
                     storage['reported_topics_subscribers'].split(',') if i)
-            for user in users:
+            for user in users.itervalues():
                 send_notification(user, 'new_reported_topic',
                                   u'Thema gemeldet: %s' % topic.title,
                                   {'topic': topic, 'text':data['text']})
@@ -1141,7 +1142,7 @@ def splittopic(request, topic_slug, page=1):
 
     pagination = Pagination(request, old_posts, page, POSTS_PER_PAGE,
         url_for(old_topic, action='split'), total=old_topic.post_count,
-        rownum_column=Post.position)
+        rownum_column=old_topic.get_position_column())
 
     if request.method == 'POST' and ('switch1' in request.POST or
                                      'switch2' in request.POST):
@@ -1155,7 +1156,7 @@ def splittopic(request, topic_slug, page=1):
 
         pagination = Pagination(request, old_topic.posts, switch_to, POSTS_PER_PAGE,
             url_for(old_topic, action='split'), total=old_topic.post_count,
-            rownum_column=Post.position)
+            rownum_column=old_topic.get_position_column())
 
         rendered_posts = pagination.objects.all()
 
@@ -1383,6 +1384,7 @@ def restore_topic(request, topic_slug):
         return abort_access_denied(request)
     topic.hidden = False
     db.session.commit()
+    topic.reindex()
     flash(u'Das Thema „%s“ wurde wieder sichtbar gemacht.' % topic.title,
           success=True)
     topic.forum.invalidate_topic_cache()
@@ -1430,6 +1432,8 @@ def delete_topic(request, topic_slug, action='hide'):
                       success=True)
 
             db.session.commit()
+            if action == 'hide':
+                topic.reindex()
             topic.forum.invalidate_topic_cache()
             return HttpResponseRedirect(redirect)
     else:
@@ -1582,7 +1586,8 @@ def topiclist(request, page=1, action='newposts', hours=24, user=None):
         flash(u'Du kannst maximal die letzten %s Seiten anzeigen lassen' % MAX_PAGES_TOPICLIST)
         return HttpResponseRedirect(href('forum'))
 
-    topics = db.session.query(Topic.id).order_by(Topic.last_post_id.desc())
+    topics = db.session.query(Topic.id, Topic.last_post_id) \
+                       .order_by(Topic.last_post_id.desc())
 
     if 'version' in request.GET:
         topics = topics.filter_by(ubuntu_version=request.GET['version'])
@@ -1638,9 +1643,14 @@ def topiclist(request, page=1, action='newposts', hours=24, user=None):
     invisible = [f.id for f in Forum.query.get_forums_filtered(request.user, reverse=True)]
     if invisible:
         topics = topics.filter(db.not_(Topic.forum_id.in_(invisible)))
-    total_topics = topics.limit(TOPICS_PER_PAGE * MAX_PAGES_TOPICLIST).count()
-    pagination = Pagination(request, topics, page, TOPICS_PER_PAGE, url,
-                            total=total_topics)
+    # the lists depend on the forums the user can see and on his read status
+    key = 'forum/topiclist/%s' % md5((u'%s/%s/%s' % (url, request.user.id,
+        request.GET.get('version', u''))).encode('utf-8')).hexdigest()
+    total_topics = get_or_create(key + '/count',
+        lambda: topics.limit(TOPICS_PER_PAGE * MAX_PAGES_TOPICLIST).count(), 60)
+    pagination = KeysetPagination(request, topics, page, TOPICS_PER_PAGE, url,
+        total=total_topics, keys=((Topic.last_post_id, True),),
+        cursor_key=key + '/%d', cache_timeout=60)
     topic_ids = (obj.id for obj in pagination.objects)
     pagination = pagination.generate()
 
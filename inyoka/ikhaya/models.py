@@ -8,6 +8,7 @@
     :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
     :license: GNU GPL, see LICENSE for more details.
 """
+import xapian
 from hashlib import md5
 from datetime import datetime
 from django.db import models
@@ -18,9 +19,9 @@ from inyoka.wiki.parser import render, parse, RenderContext
 from inyoka.utils.text import slugify
 from inyoka.utils.html import striptags
 from inyoka.utils.urls import href, url_for
-from inyoka.utils.cache import cache
+from inyoka.utils.cache import cache, request_cache
 from inyoka.utils.dates import date_time_to_datetime, datetime_to_timezone
-from inyoka.utils.search import search, SearchAdapter
+from inyoka.utils.search import search, SearchAdapter, get_date_range_query
 from inyoka.utils.local import current_request
 from inyoka.utils.decorators import deferred
 from inyoka.utils.database import find_next_django_increment
@@ -62,7 +63,7 @@ class ArticleManager(models.Manager):
         this function.
         """
         keys = map(lambda x: ('ikhaya/article/%s/%s' % x, x[0], x[1]), keys)
-        articles = cache.get_many(*[k[0] for k in keys])
+        articles = request_cache.get_many(*[k[0] for k in keys])
         cache_vals = {}
         for i, (key, pub_date, slug) in enumerate(keys):
             if articles[i] is None:
@@ -81,7 +82,7 @@ class ArticleManager(models.Manager):
                 article._simplified_text = unicode(article.simplified_text)
                 article._simplified_intro = unicode(article.simplified_intro)
                 article.text = article.intro = None
-        if len(cache_vals): cache.set_many(cache_vals)
+        if len(cache_vals): request_cache.set_many(cache_vals)
         return filter(None, articles)
 
     def get_latest_articles(self, count=10):
@@ -373,25 +374,19 @@ class Comment(models.Model):
             cache.delete('ikhaya/comment/%d' % self.id)
 
 
-class ArticleSearchAuthDecider(object):
-    """Decides whether a user can display a search result or not."""
-
-    def __init__(self, user):
-        self.now = datetime.utcnow()
-        self.priv = user.can('article_read')
-
-    def __call__(self, auth):
-        if not isinstance(auth[1], datetime):
-            # this is a workaround for old data in search-index.
-            auth = list(auth)
-            auth[1] = datetime(auth[1].year, auth[1].month, auth[1].day)
-            auth = tuple(auth)
-        return self.priv or ((not auth[0]) and auth[1] <= self.now)
-
-
 class IkhayaSearchAdapter(SearchAdapter):
     type_id = 'i'
-    auth_decider = ArticleSearchAuthDecider
+
+    def get_filter(self, user):
+        if user.can('article_read'):
+            return None
+        # only published articles
+        return xapian.Query(xapian.Query.OP_AND_NOT, get_date_range_query(),
+                            xapian.Query('XIH'))
+
+    def get_filter_key(self, filter):
+        # the filter contains the current time
+        return filter is None and u'all' or u'published'
 
     def store(self, docid):
         article = Article.objects.select_related(depth=1).get(id=docid)
@@ -401,9 +396,10 @@ class IkhayaSearchAdapter(SearchAdapter):
             title=article.subject,
             user=article.author_id,
             date=article.pub_datetime,
-            auth=(article.hidden, article.pub_datetime),
+            filter=article.hidden and ['IH'] or [],
             category=article.category.slug,
-            text=[article.text, article.intro]
+            text=[article.text, article.intro],
+            display=self.get_display_data(article)
         )
 
     def extract_data(self, article):
@@ -153,7 +153,8 @@ class PlanetSearchAdapter(SearchAdapter):
             title=entry.title,
             text=entry.simplified_text,
             date=entry.pub_date,
-            category=entry.blog.name
+            category=entry.blog.name,
+            display=self.get_display_data(entry)
         )
 
     def get_doc_ids(self):
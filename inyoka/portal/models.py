@@ -8,8 +8,10 @@
     :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
     :license: GNU GPL, see LICENSE for more details.
 """
+from datetime import datetime, timedelta
 from django.db import models, connection, transaction
 
+from inyoka.conf import settings
 from inyoka.utils.text import slugify
 from inyoka.utils.urls import href
 from inyoka.utils.local import current_request
@@ -561,21 +563,155 @@ class SearchQueueManager(models.Manager):
         """
         Remove all elements, which are smaller (or equal)
         than last_id from the queue."""
-        SearchQueue.objects.filter(id__lt=last_id).delete()
+        SearchQueue.objects.filter(id__lte=last_id).delete()
+
+    @transaction.commit_manually
+    def claim(self, block_size=1000):
+        """
+        Claim the next `block_size` due elements of the queue and return the
+        ids of the claimed rows and the elements as list of ``(component,
+        doc_id, created, attempts)`` tuples without duplicate documents, the
+        first queue entry of a document wins.
+
+        The rows are locked while they are claimed so that concurrent
+        indexers never get the same rows.  They stay in the queue until
+        they are removed with `finish` once the documents are stored in the
+        index; rows not finished after `SEARCH_CLAIM_TIMEOUT` seconds (the
+        indexer died) are claimed again.
+        """
+        lock = settings.DATABASE_ENGINE == 'mysql' and ' for update' or ''
+        now = datetime.utcnow()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('''
+                select id, component, doc_id, created, attempts
+                from portal_searchqueue
+                where failed = %%s and next_attempt <= %%s and
+                      (claimed is null or claimed < %%s)
+                order by id limit %d%s
+            ''' % (block_size, lock), [False, now, now -
+                timedelta(seconds=settings.SEARCH_CLAIM_TIMEOUT)])
+            rows = cursor.fetchall()
+            if rows:
+                # don't use a range of ids here, an entry with a smaller id
+                # could still be uncommitted and thus not claimed.
+                ids = [row[0] for row in rows]
+                cursor.execute('''
+                    update portal_searchqueue set claimed = %%s
+                    where id in (%s)
+                ''' % u', '.join(['%s'] * len(ids)), [now] + ids)
+        except:
+            transaction.rollback()
+            raise
+        transaction.commit()
+
+        result = []
+        seen = set()
+        for id, component, doc_id, created, attempts in rows:
+            if (component, doc_id) not in seen:
+                seen.add((component, doc_id))
+                result.append((component, doc_id, created, attempts))
+        return [row[0] for row in rows], result
+
+    @transaction.commit_manually
+    def finish(self, ids):
+        """Remove the claimed rows `ids` after their documents were stored."""
+        try:
+            for idx in xrange(0, len(ids), 1000):
+                self.filter(id__in=ids[idx:idx + 1000]).delete()
+        except:
+            transaction.rollback()
+            raise
+        transaction.commit()
+
+    def deferred(self, component, doc_id, created, attempts, error):
+        """
+        Queue a document that could not be indexed again, with an
+        exponential backoff.  After `SEARCH_MAX_ATTEMPTS` tries it is kept
+        with `failed` set and not claimed anymore.
+        """
+        item = self.model(component=component, doc_id=doc_id,
+                          created=created, attempts=attempts + 1,
+                          last_error=error)
+        if item.attempts >= settings.SEARCH_MAX_ATTEMPTS:
+            item.failed = True
+        else:
+            item.next_attempt = datetime.utcnow() + \
+                timedelta(minutes=2 ** item.attempts)
+        item.save()
 
 
 class SearchQueue(models.Model):
     """
-    Managing a to-do list for asynchronous indexing.
+    Managing a to-do list for asynchronous indexing.  Documents that could
+    not be indexed after `SEARCH_MAX_ATTEMPTS` tries are kept with `failed`
+    set.
     """
     objects = SearchQueueManager()
     component = models.CharField(max_length=1)
     doc_id = models.IntegerField()
+    created = models.DateTimeField(default=datetime.utcnow)
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=datetime.utcnow)
+    last_error = models.TextField(blank=True)
+    failed = models.BooleanField(default=False)
+    claimed = models.DateTimeField(null=True)
 
     class Meta:
         ordering = ['id']
 
 
+class NotificationQueueManager(models.Manager):
+
+    def append(self, user, method, recipient, subject, text):
+        """Queue an already rendered notification for `user`."""
+        item = self.model(user=user, method=method, recipient=recipient,
+                          subject=subject, text=text)
+        item.save()
+        return item
+
+    def get_due(self, block_size=100):
+        """
+        Return the next `block_size` notifications that are due for
+        (another) delivery attempt.
+        """
+        query = self.filter(failed=False, next_attempt__lte=datetime.utcnow())
+        return list(query.order_by('id')[:block_size])
+
+
+class NotificationQueue(models.Model):
+    """
+    Notifications waiting to be delivered by `scripts/send_notifications`.
+    Notifications that could not be delivered after
+    `NOTIFICATION_MAX_ATTEMPTS` tries are kept with `failed` set.
+    """
+    objects = NotificationQueueManager()
+    user = models.ForeignKey(User)
+    method = models.CharField(max_length=10)
+    recipient = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255)
+    text = models.TextField()
+    created = models.DateTimeField(default=datetime.utcnow)
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=datetime.utcnow, db_index=True)
+    last_error = models.TextField(blank=True)
+    failed = models.BooleanField(default=False)
+
+    def deferred(self, error):
+        """
+        Record a failed delivery and schedule the next attempt with an
+        exponential backoff or give up after `NOTIFICATION_MAX_ATTEMPTS`.
+        """
+        self.attempts += 1
+        self.last_error = error
+        if self.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+            self.failed = True
+        else:
+            self.next_attempt = datetime.utcnow() + \
+                timedelta(minutes=2 ** self.attempts)
+        self.save()
+
+
 class Storage(models.Model):
     key = models.CharField(max_length=200, db_index=True)
     value = models.TextField()
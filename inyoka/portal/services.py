@@ -14,7 +14,7 @@ from hashlib import md5
 from urlparse import urlparse
 
 from inyoka.conf import settings
-from inyoka.portal.user import User, Group
+from inyoka.portal.user import Group, user_completion
 from inyoka.portal.models import Event
 from inyoka.utils.text import get_random_password
 from inyoka.utils.http import PageNotFound
@@ -38,10 +38,8 @@ def on_get_user_list(request):
     q = request.GET.get('q', '')
     if len(q) < 3:
         return
-    qs = list(User.objects.filter(username__istartswith=q,
-                                  status__exact=1)[:11])
-    usernames = [x.username for x in qs]
-    if len(qs) > 10:
+    usernames = user_completion.complete(q, 11)
+    if len(usernames) > 10:
         usernames[10] = '...'
     return usernames
 
@@ -22,7 +22,8 @@ from django.db import models
 from inyoka.conf import settings
 from inyoka.utils import encode_confirm_data, classproperty
 from inyoka.utils.decorators import deferred
-from inyoka.utils.cache import cache
+from inyoka.utils.cache import cache, request_cache
+from inyoka.utils.completion import PrefixIndex
 from inyoka.utils.mail import send_mail
 from inyoka.utils.html import escape
 from inyoka.utils.user import normalize_username, get_hexdigest,\
@@ -68,6 +69,14 @@ USER_STATUSES = {
 }
 
 
+def _load_usernames(shard):
+    return User.objects.filter(username__istartswith=shard, status=1) \
+                       .values_list('username', flat=True)
+
+#: the names of the active users for the recipient autocompletion
+user_completion = PrefixIndex('portal/users', _load_usernames)
+
+
 class UserBanned(Exception):
     """
     Simple exception that is raised while
@@ -316,6 +325,26 @@ class UserManager(models.Manager):
             cache.set('portal/user/%d' % pk, user, 300)
         return user
 
+    def get_many(self, ids):
+        """Return a dict of the users with the given `ids`.  The users are
+        fetched from the cache with one multi-get, the missing ones with one
+        query.  Unknown ids are not part of the result.
+        """
+        ids = set(int(id) for id in ids)
+        keys = dict(('portal/user/%d' % id, id) for id in ids)
+        users = {}
+        for key, user in request_cache.get_dict(*keys).iteritems():
+            if user is not None:
+                users[keys[key]] = user
+        missing = ids.difference(users)
+        if missing:
+            fetched = dict((user.id, user) for user in
+                           self.filter(pk__in=missing))
+            request_cache.set_many(dict(('portal/user/%d' % id, user)
+                for id, user in fetched.iteritems()), 300)
+            users.update(fetched)
+        return users
+
     def create_user(self, username, email, password=None):
         now = datetime.utcnow()
         user = self.model(
@@ -475,6 +504,15 @@ class User(models.Model):
                                        blank=True, null=True,
                                        db_column='primary_group_id')
 
+    #: the saved name and status, see `save`.  Users unpickled from the
+    #: cache that were pickled without it don't know them.
+    _completion_state = (None, 0)
+
+    def __init__(self, *args, **kwargs):
+        super(User, self).__init__(*args, **kwargs)
+        self._completion_state = self.id and (self.username, self.status) \
+                                 or (None, 0)
+
     def save(self, force_insert=False, force_update=False):
         """
         Save method that pickles `self.settings` before and cleanup
@@ -482,8 +520,16 @@ class User(models.Model):
         """
         self._settings = cPickle.dumps(self.settings)
         super(User, self).save(force_insert, force_update)
-        cache.delete('portal/user/%s/signature' % self.id)
-        cache.delete('portal/user/%s' % self.id)
+        request_cache.delete_many('portal/user/%s/signature' % self.id,
+                                  'portal/user/%s' % self.id)
+        state = (self.username, self.status)
+        if state != self._completion_state:
+            old_name, old_status = self._completion_state
+            if old_status == 1:
+                user_completion.remove(old_name)
+            if self.status == 1:
+                user_completion.add(self.username)
+            self._completion_state = state
 
     def __unicode__(self):
         return self.username
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    inyoka.scripts.renumber_posts
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Deleting a post leaves a gap in the post positions of its topic so that
+    the delete does not have to rewrite every later post of the topic.  Those
+    topics are paginated by offset until this script closes the gaps again.
+
+    Usage::
+
+        renumber_posts.py [--check] [topic_id ...]
+
+    Without topic ids all topics with gaps, duplicate positions or a wrong
+    post count are searched.  With ``--check`` the broken topics are only
+    reported, otherwise every topic is renumbered in its own transaction.
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+import sys
+import time
+from inyoka.conf import settings
+settings.DATABASE_DEBUG = False
+from inyoka.forum.models import Post, Topic
+from inyoka.utils.database import db, session
+
+
+#: number of posts that are updated with one statement
+BATCH_SIZE = 500
+
+
+def find_broken_topics():
+    """
+    Return a list of ``(topic_id, post_count, real_count, max_position)``
+    tuples for all topics whose positions are not ``0..post_count-1``.
+    """
+    real_count = db.func.count(Post.id)
+    max_position = db.func.max(Post.position)
+    query = db.select([Post.topic_id, Topic.post_count, real_count,
+                       max_position],
+        Post.topic_id == Topic.id,
+        group_by=[Post.topic_id, Topic.post_count],
+        having=db.or_(max_position + 1 != real_count,
+                      db.func.min(Post.position) != 0,
+                      db.func.count(Post.position.distinct()) != real_count,
+                      Topic.post_count != real_count))
+    return session.execute(query).fetchall()
+
+
+def renumber_topic(topic_id):
+    """
+    Renumber the posts of a topic gap-free, keeping their current order,
+    and return the number of changed posts.
+    """
+    # lock the topic row like the post insert does, so that no post
+    # is added while we renumber.
+    session.execute(db.select([Topic.id], Topic.id == topic_id,
+                              for_update=True))
+    rows = session.execute(db.select([Post.id, Post.position],
+        Post.topic_id == topic_id,
+        order_by=[Post.position, Post.id])).fetchall()
+
+    changed = {}
+    for position, (post_id, old_position) in enumerate(rows):
+        if position != old_position:
+            changed[post_id] = position
+
+    ids = changed.keys()
+    for idx in xrange(0, len(ids), BATCH_SIZE):
+        batch = ids[idx:idx + BATCH_SIZE]
+        session.execute(Post.__table__.update(Post.id.in_(batch), values={
+            'position': db.case(dict((id, changed[id]) for id in batch),
+                                value=Post.id)
+        }))
+    session.execute(Topic.__table__.update(Topic.id == topic_id, values={
+        'post_count': len(rows)
+    }))
+    session.commit()
+    return len(changed)
+
+
+def renumber_posts(topic_ids=None, check=False):
+    if topic_ids is None:
+        broken = find_broken_topics()
+        for topic_id, post_count, real_count, max_position in broken:
+            print 'topic %d: %d posts (post_count %d), highest position %d' % (
+                topic_id, real_count, post_count, max_position)
+        topic_ids = [row[0] for row in broken]
+        print '%d topics need to be renumbered' % len(topic_ids)
+    if check:
+        return
+    for topic_id in topic_ids:
+        changed = renumber_topic(topic_id)
+        print 'topic %d: renumbered %d posts' % (topic_id, changed)
+        # give the database some time to breathe
+        time.sleep(0.1)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    check = '--check' in args
+    topic_ids = [int(arg) for arg in args if arg != '--check'] or None
+    renumber_posts(topic_ids, check)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    inyoka.scripts.search_rebuild
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Rebuild the whole search index in parallel.  The documents of every
+    component are split into id ranges of `SEARCH_REBUILD_SHARD_SIZE`
+    documents.  Worker processes index every range into a shard database of
+    its own.  The shards are merged with `xapian-compact` and the result
+    replaces `XAPIAN_DATABASE` atomically.  For that, `XAPIAN_DATABASE`
+    becomes a symlink to the current index directory.
+
+    Usage::
+
+        search_rebuild.py [--restart] [processes]
+
+    The progress is saved in ``XAPIAN_DATABASE.rebuild/plan``.  An
+    interrupted rebuild continues with the missing shards unless
+    ``--restart`` is given.
+
+    Stop the indexer (`search_update.py --daemon`) during the rebuild.
+    Changes queued meanwhile are applied when it is started again.  Old
+    index directories are kept and need to be removed by hand.  This only
+    works for local databases.
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+import os
+import sys
+import time
+import shutil
+import datetime
+from bisect import bisect_left, bisect_right
+from cPickle import dump, load
+from multiprocessing import Pool, cpu_count
+from subprocess import call
+
+from django.db import connection
+from inyoka.conf import settings
+from inyoka.utils.search import search
+from inyoka.utils.database import session
+
+# import required adapters
+import inyoka.forum.search
+import inyoka.planet.models
+import inyoka.wiki.search
+import inyoka.ikhaya.models
+
+
+def get_rebuild_path(*parts):
+    return os.path.join(settings.XAPIAN_DATABASE.rstrip('/') + '.rebuild',
+                        *parts)
+
+
+def save_plan(plan):
+    filename = get_rebuild_path('plan')
+    f = open(filename + '.tmp', 'wb')
+    try:
+        dump(plan, f, -1)
+    finally:
+        f.close()
+    os.rename(filename + '.tmp', filename)
+
+
+def make_plan():
+    """
+    Split the documents of every component into id ranges.  A plan is a
+    dict with the list of ``(component, number, first_id, last_id)`` shards
+    and the set of finished shard numbers.  The last shard of a component
+    is open-ended (`last_id` is `None`) so that it also gets the documents
+    created while resuming.
+    """
+    shards = []
+    for component, adapter in sorted(search.adapters.iteritems()):
+        ids = sorted(adapter.get_doc_ids())
+        size = settings.SEARCH_REBUILD_SHARD_SIZE
+        for idx in xrange(0, len(ids), size):
+            first = idx and ids[idx] or 0
+            last = idx + size < len(ids) and ids[idx + size - 1] or None
+            shards.append((component, len(shards), first, last))
+    return {'shards': shards, 'done': set()}
+
+
+def get_shard_ids(all_ids, first, last):
+    start = bisect_left(all_ids, first)
+    end = last is None and len(all_ids) or bisect_right(all_ids, last)
+    return all_ids[start:end]
+
+
+def build_shard(args):
+    component, number, ids = args
+    search.open_shard(get_rebuild_path('shard-%d' % number))
+    try:
+        if search.adapters[component].support_multi:
+            search.index_multi(component, ids)
+        else:
+            for id in ids:
+                search.index(component, id)
+    finally:
+        search.close()
+        session.remove()
+    return number, len(ids)
+
+
+def merge_shards(plan):
+    merged = get_rebuild_path('merged')
+    if os.path.exists(merged):
+        shutil.rmtree(merged)
+    shards = [get_rebuild_path('shard-%d' % s[1]) for s in plan['shards']]
+    if not shards:
+        search.open_shard(merged)
+        search.close()
+        return merged
+    if call([settings.XAPIAN_COMPACT, '--multipass'] + shards + [merged]):
+        raise RuntimeError('xapian-compact failed')
+    return merged
+
+
+def swap_database(path):
+    """
+    Make `path` the new search index.  `XAPIAN_DATABASE` is a symlink that
+    is replaced with a rename, so readers always find an index.
+    """
+    target = settings.XAPIAN_DATABASE.rstrip('/')
+    suffix = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    if os.path.exists(target) and not os.path.islink(target):
+        # the first rebuild turns the database into a symlink
+        os.rename(target, '%s.old-%s' % (target, suffix))
+    final = '%s.%s' % (target, suffix)
+    os.rename(path, final)
+    link = target + '.link'
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(final, link)
+    os.rename(link, target)
+    return final
+
+
+def rebuild(processes=None, restart=False):
+    if settings.XAPIAN_DATABASE.startswith('tcpsrv://'):
+        raise RuntimeError('only local search databases can be rebuilt')
+    if restart and os.path.exists(get_rebuild_path()):
+        shutil.rmtree(get_rebuild_path())
+    if not os.path.exists(get_rebuild_path()):
+        os.makedirs(get_rebuild_path())
+
+    if os.path.exists(get_rebuild_path('plan')):
+        f = open(get_rebuild_path('plan'), 'rb')
+        try:
+            plan = load(f)
+        finally:
+            f.close()
+        print 'Continuing rebuild, %d of %d shards are done' % (
+            len(plan['done']), len(plan['shards']))
+    else:
+        plan = make_plan()
+        save_plan(plan)
+        print 'Rebuilding %d shards' % len(plan['shards'])
+    sys.stdout.flush()
+
+    def _get_jobs():
+        all_ids = {}
+        for component, number, first, last in plan['shards']:
+            if number in plan['done']:
+                continue
+            if component not in all_ids:
+                all_ids.clear()
+                all_ids[component] = sorted(
+                    search.adapters[component].get_doc_ids())
+            yield component, number, get_shard_ids(all_ids[component],
+                                                   first, last)
+
+    # the database connections must not be shared with the workers
+    session.remove()
+    connection.close()
+    pool = Pool(processes or cpu_count())
+    try:
+        started = time.time()
+        for number, count in pool.imap_unordered(build_shard, _get_jobs()):
+            plan['done'].add(number)
+            save_plan(plan)
+            print '%s: shard %d with %d documents done (%d/%d, %ds)' % (
+                datetime.datetime.utcnow(), number, count,
+                len(plan['done']), len(plan['shards']), time.time() - started)
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+    print 'Merging shards'
+    merged = merge_shards(plan)
+    final = swap_database(merged)
+    shutil.rmtree(get_rebuild_path())
+    print 'The search index is now %s' % final
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    restart = '--restart' in args
+    args = [arg for arg in args if arg != '--restart']
+    rebuild(args and int(args[0]) or None, restart)
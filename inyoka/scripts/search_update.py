@@ -5,7 +5,12 @@
     ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     This scripts updates the search index by (re)indexing the documents
-    of `portal_searchqueue`.
+    of `portal_searchqueue`.  Documents queued several times are indexed
+    only once.  Called with ``--daemon`` it keeps running and indexes new
+    documents as they are queued.  Documents that cannot be indexed are
+    queued again and given up after `SEARCH_MAX_ATTEMPTS` tries.  The queue
+    entries are only removed after the index was flushed, so a killed
+    indexer loses nothing.
 
     If the search index is not existent when starting this script, it
     automatically gets created; afterwards the index is completely generated
@@ -15,12 +20,15 @@
     :license: GNU GPL, see LICENSE for more details.
 """
 from __future__ import division
-import sys, datetime
+import sys, time, datetime
 from xapian import DatabaseOpeningError
+from django.db import transaction
 
+from inyoka.conf import settings
 from inyoka.portal.models import SearchQueue
 from inyoka.utils.search import search
 from inyoka.utils.database import session
+from inyoka.utils.logger import logger
 
 # import required adapters
 import inyoka.forum.search
@@ -29,29 +37,132 @@ import inyoka.wiki.search
 import inyoka.ikhaya.models
 
 
+def index_block(items):
+    """
+    Index the ``(component, doc_id, created, attempts)`` tuples as returned
+    by `SearchQueue.objects.claim`, using `store_multi` where possible.
+    Documents that fail are queued again, the number of them is returned.
+    """
+    by_component = {}
+    for item in items:
+        by_component.setdefault(item[0], []).append(item)
+    failed = 0
+    for component, entries in by_component.iteritems():
+        if search.adapters[component].support_multi:
+            try:
+                search.index_multi(component, [e[1] for e in entries])
+                continue
+            except Exception:
+                # index the documents one by one to find the broken ones
+                rollback()
+        for component, doc_id, created, attempts in entries:
+            try:
+                search.index(component, doc_id)
+            except Exception, exc:
+                logger.exception('Could not index %s:%s' % (component, doc_id))
+                rollback()
+                SearchQueue.objects.deferred(component, doc_id, created,
+                    attempts, u'%s: %s' % (exc.__class__.__name__, exc))
+                failed += 1
+    return failed
+
+
+def rollback():
+    """Reset the database connections after an adapter failed."""
+    session.rollback()
+    transaction.rollback_unless_managed()
+
+
+class IndexStats(object):
+    """Collects the numbers the indexer reports."""
+
+    def __init__(self):
+        self.indexed = 0
+        self.failed = 0
+        self.claimed = []
+        self.lag = datetime.timedelta(0)
+        self.last_flush = time.time()
+        self.pending = 0
+
+    def add(self, ids, items, failed=0):
+        self.claimed.extend(ids)
+        self.indexed += len(items) - failed
+        self.failed += failed
+        self.pending += len(items)
+        if items:
+            self.lag = datetime.datetime.utcnow() - min(i[2] for i in items)
+
+    def flushed(self):
+        self.claimed = []
+        self.pending = 0
+        self.last_flush = time.time()
+
+    def report(self):
+        print "%s: %d documents indexed, %d failed, %d queued, lag %s" % (
+            datetime.datetime.utcnow(), self.indexed, self.failed,
+            SearchQueue.objects.filter(failed=False).count(), self.lag)
+        sys.stdout.flush()
+
+
+def flush(stats):
+    search.flush()
+    session.commit()
+    SearchQueue.objects.finish(stats.claimed)
+    stats.flushed()
+
+
 def update():
     """
     Update the next items from the queue.  You should call this
     function regularly (e.g. as cron).
     """
-    max = SearchQueue.objects.count()
     print "Start Update on %s with %s queued objects" % (
-        datetime.datetime.utcnow(), max)
-
-    cur = 0
-    iterator = SearchQueue.objects.select_blocks()
-    for type, idx in iterator:
-        search.index(type, idx)
-        cur += 1
-        if (cur % 100) == 0:
-            print "flush connection and database session"
-            search.flush()
-            session.commit()
-            print "flushed, %s objects remaining" % (int(max) - int(cur))
+        datetime.datetime.utcnow(), SearchQueue.objects.count())
+
+    stats = IndexStats()
+    while 1:
+        ids, items = SearchQueue.objects.claim(
+            settings.SEARCH_INDEX_BLOCK_SIZE)
+        if not items:
+            break
+        stats.add(ids, items, index_block(items))
+        if stats.pending >= settings.SEARCH_FLUSH_DOCUMENTS:
+            flush(stats)
+            stats.report()
 
     # finally a flush at the end of everything
-    search.flush()
-    session.commit()
+    flush(stats)
+    stats.report()
+
+
+def daemon():
+    """
+    Keep indexing the queue.  Changes are flushed to the index after
+    `SEARCH_FLUSH_DOCUMENTS` documents or `SEARCH_FLUSH_INTERVAL` seconds,
+    whatever comes first.  Errors are logged and the indexer keeps running.
+    """
+    print "Search indexer started on %s" % datetime.datetime.utcnow()
+    stats = IndexStats()
+    while 1:
+        items = None
+        try:
+            ids, items = SearchQueue.objects.claim(
+                settings.SEARCH_INDEX_BLOCK_SIZE)
+            if items:
+                stats.add(ids, items, index_block(items))
+            if stats.pending >= settings.SEARCH_FLUSH_DOCUMENTS or \
+               (stats.pending and time.time() - stats.last_flush >
+                settings.SEARCH_FLUSH_INTERVAL):
+                flush(stats)
+                stats.report()
+        except Exception:
+            logger.exception('Search indexer failed')
+            rollback()
+            items = None
+        if not items:
+            # don't keep the database connection of an idle indexer
+            session.remove()
+            time.sleep(settings.SEARCH_DAEMON_INTERVAL)
 
 
 def reindex(app=None):
@@ -96,5 +207,8 @@ if __name__ == '__main__':
         search.get_connection(True)
         print 'Starting to reindex everything'
         reindex()
-    update()
+    if '--daemon' in sys.argv[1:]:
+        daemon()
+    else:
+        update()
     print "search updated finished at %s" % datetime.datetime.now()
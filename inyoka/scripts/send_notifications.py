@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    inyoka.scripts.send_notifications
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This script delivers the notifications queued in
+    `portal_notificationqueue` (see `inyoka.utils.notification`).  Call it
+    regularly (e.g. as cron), only one instance must run at a time.
+
+    Failed deliveries are retried with an exponential backoff, after
+    `NOTIFICATION_MAX_ATTEMPTS` tries they are kept with the `failed` flag
+    for inspection.
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+from __future__ import with_statement
+import datetime
+from django.db import transaction
+from inyoka.portal.models import NotificationQueue
+from inyoka.utils.mail import mail_session
+from inyoka.utils.notification import deliver
+
+
+#: number of notifications fetched and committed at once
+BLOCK_SIZE = 100
+
+
+@transaction.commit_manually
+def send_block(items):
+    """Deliver `items` and return the number of successful deliveries."""
+    sent = []
+    try:
+        # all mails of the block share one connection
+        with mail_session():
+            for item in items:
+                try:
+                    deliver(item.method, item.recipient, item.subject,
+                            item.text)
+                except Exception, exc:
+                    item.deferred(u'%s: %s' % (exc.__class__.__name__, exc))
+                else:
+                    sent.append(item.id)
+        NotificationQueue.objects.filter(id__in=sent).delete()
+    finally:
+        transaction.commit()
+    return len(sent)
+
+
+def send_notifications():
+    print 'Start sending notifications on %s' % datetime.datetime.utcnow()
+    sent = failed = 0
+    seen = set()
+    while 1:
+        # deferred items stay in the queue but are not due anymore, the
+        # `seen` check makes sure we stop if the clock plays tricks on us.
+        items = [i for i in NotificationQueue.objects.get_due(BLOCK_SIZE)
+                 if i.id not in seen]
+        if not items:
+            break
+        seen.update(i.id for i in items)
+        count = send_block(items)
+        sent += count
+        failed += len(items) - count
+    print 'Sent %d notifications, %d failed' % (sent, failed)
+
+
+if __name__ == '__main__':
+    send_notifications()
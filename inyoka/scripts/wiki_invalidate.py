@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    inyoka.scripts.wiki_invalidate
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    This script invalidates the caches of the wiki pages that depend on
+    the pages queued in `wiki_invalidationqueue` by `Page.save` (see
+    `PageManager.get_dependent_pages`).  Call it regularly (e.g. as cron),
+    only one instance must run at a time.
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+import datetime
+from inyoka.wiki.models import Page, InvalidationQueue
+
+
+#: number of queued pages processed at once
+BLOCK_SIZE = 100
+
+
+def invalidate():
+    print 'Start invalidating wiki pages on %s' % datetime.datetime.utcnow()
+    count = 0
+    while 1:
+        items = list(InvalidationQueue.objects.all()[:BLOCK_SIZE])
+        if not items:
+            break
+        changed = set(item.page_name for item in items)
+        created = set(item.page_name for item in items
+                      if item.existence_changed)
+        pages, truncated = Page.objects.get_dependent_pages(changed, created)
+        if truncated:
+            print 'Too many pages depend on %s, invalidated only %d' % (
+                u', '.join(sorted(changed)).encode('utf-8'), len(pages))
+        Page.objects.invalidate_pages(pages)
+        InvalidationQueue.objects.filter(id__lte=items[-1].id).delete()
+        count += len(pages)
+    print 'Invalidated %d pages' % count
+
+
+if __name__ == '__main__':
+    invalidate()
@@ -11,10 +11,28 @@
     in a thread-local dictionary.  This saves a lot of memcached-commands in
     some szenarios.
 
+    Expensive values should be filled using :func:`get_or_create` which
+    makes sure that only one process recomputes an expired value while the
+    others keep serving the old one.  Values that are maintained in place
+    instead of being recomputed are changed with :func:`update_cached`.
+
+    For groups of keys that are invalidated together there is the
+    :class:`CacheNamespace` that embeds a generation number into the keys so
+    that a whole group is invalidated with one atomic increment.
+
+    Between those two layers sits an optional :class:`ProcessCache` that keeps
+    hot and rarely changing keys (configured by prefix) in the memory of the
+    worker process.  Those entries are dropped as soon as the generation
+    counter of their prefix in memcached changes.
+
     :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
     :license: GNU GPL, see LICENSE for more details.
 """
-from cPickle import loads
+from __future__ import with_statement
+import time
+import random
+from threading import Lock
+from cPickle import loads, dumps, HIGHEST_PROTOCOL
 from werkzeug.contrib.cache import MemcachedCache, SimpleCache
 from django.utils.encoding import force_unicode
 from inyoka.utils.local import current_request, _request_cache, local_has_key
@@ -32,6 +50,15 @@ from inyoka.conf import settings
 cache = (type('UnconfiguredCache', (object,), {}))()
 request_cache = None
 
+#: how long the generation counters of a :class:`CacheNamespace` are kept
+NAMESPACE_TIMEOUT = 86400 * 7
+
+#: marker for a lock that is held by a process filling a cache key
+_LOCK_SUFFIX = u'/__lock'
+
+#: marker for an update that was dropped while the lock was held
+_DIRTY_SUFFIX = u'/__dirty'
+
 
 def _set_cache(obj):
     cache.__class__ = obj.__class__
@@ -75,7 +102,12 @@ def set_real_cache():
         cache = CacheDebugProxy(cache)
 
     global request_cache
-    request_cache = RequestCache(cache)
+    process_cache = None
+    if settings.CACHE_PROCESS_TIERS:
+        process_cache = ProcessCache(settings.CACHE_PROCESS_TIERS,
+                                     settings.CACHE_PROCESS_COPY,
+                                     settings.CACHE_PROCESS_SIZE)
+    request_cache = RequestCache(cache, process_cache)
 
 
 def set_test_cache():
@@ -83,50 +115,416 @@ def set_test_cache():
     _set_cache(SimpleCache())
 
 
+class ProcessCache(object):
+    """A bounded in-process LRU cache with a time to live per key prefix.
+
+    Every entry remembers the generation of its prefix it was stored with.
+    The generation counters live in memcached (see
+    :meth:`RequestCache.get_generations`) and are bumped whenever a key with
+    that prefix is deleted, so that all worker processes drop their copies.
+
+    Values of prefixes listed in `copy_prefixes` are stored pickled so that
+    every caller gets a fresh copy.  That's required for mutable objects such
+    as sqlalchemy models that are merged into a session later.
+    """
+
+    def __init__(self, tiers, copy_prefixes=(), max_items=1000):
+        self.tiers = dict(tiers)
+        # match the longest prefix first
+        self.prefixes = sorted(self.tiers, key=len, reverse=True)
+        self.copy_prefixes = frozenset(copy_prefixes)
+        self.max_items = max_items
+        self._lock = Lock()
+        self._data = {}
+        self._tick = 0
+        self.hits = dict.fromkeys(self.prefixes, 0)
+        self.misses = dict.fromkeys(self.prefixes, 0)
+
+    def match(self, key):
+        """Return the configured prefix for `key` or `None`."""
+        for prefix in self.prefixes:
+            if key.startswith(prefix):
+                return prefix
+
+    def get(self, key, prefix, generation):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.time() or item[2] != generation:
+                if item is not None:
+                    del self._data[key]
+                self.misses[prefix] += 1
+                return None
+            self._tick += 1
+            item[0] = self._tick
+            self.hits[prefix] += 1
+            value = item[3]
+        if prefix in self.copy_prefixes:
+            value = loads(value)
+        return value
+
+    def set(self, key, prefix, generation, value):
+        if prefix in self.copy_prefixes:
+            value = dumps(value, HIGHEST_PROTOCOL)
+        expires = time.time() + self.tiers[prefix]
+        with self._lock:
+            self._tick += 1
+            self._data[key] = [self._tick, expires, generation, value]
+            if len(self._data) > self.max_items:
+                self._prune()
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _prune(self):
+        # drop the least recently used tenth of the entries in one go so
+        # that we don't need to sort on every insert.
+        now = time.time()
+        items = sorted(self._data.iteritems(), key=lambda x: x[1][0])
+        to_remove = max(1, len(items) // 10)
+        for key, item in items:
+            if to_remove > 0 or item[1] < now:
+                del self._data[key]
+                to_remove -= 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_stats(self):
+        """Return a dict of ``prefix -> (hits, misses)``."""
+        with self._lock:
+            return dict((p, (self.hits[p], self.misses[p]))
+                        for p in self.prefixes)
+
+
 class RequestCache(object):
-    """A helper cache to cache the requested stuff in a threadlocal."""
-    def __init__(self, real_cache):
+    """A helper cache to cache the requested stuff in a threadlocal.
+
+    If a :class:`ProcessCache` is given, keys matching one of its prefixes
+    are looked up there before asking the real cache.
+    """
+    def __init__(self, real_cache, process_cache=None):
         self.real_cache = real_cache
         self.request_cache = _request_cache
+        self.process_cache = process_cache
+
+    def get_generations(self):
+        """Return the generation counters of all process cache prefixes.
+        They are fetched with one multi-get and kept for the rest of the
+        request so that a request sees a consistent state.
+        """
+        if local_has_key('cache') and '_generations' in self.request_cache:
+            return self.request_cache['_generations']
+        keys = ['generation/' + p for p in self.process_cache.prefixes]
+        values = self.real_cache.get_dict(*keys)
+        generations = dict((p, values.get('generation/' + p) or 0)
+                           for p in self.process_cache.prefixes)
+        if local_has_key('cache'):
+            self.request_cache['_generations'] = generations
+        return generations
+
+    def _get_uncached(self, key):
+        prefix = self.process_cache and self.process_cache.match(key)
+        if not prefix:
+            return self.real_cache.get(key)
+        generation = self.get_generations()[prefix]
+        val = self.process_cache.get(key, prefix, generation)
+        if val is None:
+            val = self.real_cache.get(key)
+            if val is not None:
+                self.process_cache.set(key, prefix, generation, val)
+        return val
+
+    def _set_process_cache(self, key, value):
+        prefix = self.process_cache and self.process_cache.match(key)
+        if prefix:
+            self.process_cache.set(key, prefix,
+                                   self.get_generations()[prefix], value)
+
+    def _invalidate_process_cache(self, key):
+        prefix = self.process_cache and self.process_cache.match(key)
+        if prefix:
+            # invalidate the copies in all worker processes
+            self.process_cache.delete(key)
+            self.real_cache.add('generation/' + prefix, 0)
+            self.real_cache.inc('generation/' + prefix)
+            if local_has_key('cache'):
+                self.request_cache.pop('_generations', None)
 
     def get(self, key):
         if local_has_key('cache'):
             try:
                 return self.request_cache[key]
             except KeyError:
-                val = self.real_cache.get(key)
+                val = self._get_uncached(key)
                 if val is not None:
                     self.request_cache[key] = val
 
                 return val
         else:
-            return self.real_cache.get(key)
+            return self._get_uncached(key)
 
     def get_dict(self, *keys):
-        if not local_has_key('cache'):
-            return self.real_cache.get_dict(*keys)
-
+        """Return a dict of all `keys` and their values (or `None`).  Keys
+        found in the thread local cache or in the process cache are merged
+        with the rest that is fetched from the real cache with one
+        multi-get.
+        """
+        has_local = local_has_key('cache')
         key_mapping = {}
-
-        # fetch keys that are not yet in the thread local cache
-        keys_to_fetch = set(key for key in keys if not key in self.request_cache)
-        key_mapping.update(self.real_cache.get_dict(*keys_to_fetch))
-
-        # pull in remaining keys from thread local cache.
-        missing = keys_to_fetch.difference(set(keys))
-        key_mapping.update(dict((k, self.request_cache[k]) for k in missing))
+        keys_to_fetch = []
+
+        # pull in the keys from the thread local and process cache
+        generations = None
+        for key in keys:
+            if has_local and key in self.request_cache:
+                key_mapping[key] = self.request_cache[key]
+                continue
+            prefix = self.process_cache and self.process_cache.match(key)
+            if prefix:
+                if generations is None:
+                    generations = self.get_generations()
+                val = self.process_cache.get(key, prefix, generations[prefix])
+                if val is not None:
+                    key_mapping[key] = val
+                    if has_local:
+                        self.request_cache[key] = val
+                    continue
+            keys_to_fetch.append(key)
+
+        # fetch keys that are not yet cached locally
+        if keys_to_fetch:
+            fetched = self.real_cache.get_dict(*keys_to_fetch)
+            for key, val in fetched.iteritems():
+                key_mapping[key] = val
+                if val is not None:
+                    if has_local:
+                        self.request_cache[key] = val
+                    self._set_process_cache(key, val)
         return key_mapping
 
+    def get_many(self, *keys):
+        """Like :meth:`get_dict` but returns a list of the values in the
+        order of `keys`.
+        """
+        key_mapping = self.get_dict(*keys)
+        return [key_mapping.get(key) for key in keys]
+
     def set(self, key, value, timeout=None):
         if local_has_key('cache'):
             self.request_cache[key] = value
+        self._set_process_cache(key, value)
         return self.real_cache.set(key, value, timeout)
 
+    def set_many(self, mapping, timeout=None):
+        has_local = local_has_key('cache')
+        for key, value in mapping.iteritems():
+            if has_local:
+                self.request_cache[key] = value
+            self._set_process_cache(key, value)
+        return self.real_cache.set_many(mapping, timeout)
+
     def delete(self, key):
         if local_has_key('cache') and key in self.request_cache:
             self.request_cache.pop(key)
+        self._invalidate_process_cache(key)
         self.real_cache.delete(key)
 
+    def delete_many(self, *keys):
+        has_local = local_has_key('cache')
+        for key in keys:
+            if has_local:
+                self.request_cache.pop(key, None)
+            self._invalidate_process_cache(key)
+        self.real_cache.delete_many(*keys)
+
+    def forget(self, key):
+        """Drop the thread local and process copies of `key` (in all
+        worker processes) but keep the value in the real cache.  Use this
+        after changing the value with :func:`update_cached`.
+        """
+        if local_has_key('cache'):
+            self.request_cache.pop(key, None)
+        self._invalidate_process_cache(key)
+
+    def inc(self, key, delta=1):
+        if local_has_key('cache'):
+            self.request_cache.pop(key, None)
+        return self.real_cache.inc(key, delta)
+
+
+class CacheNamespace(object):
+    """Groups cache keys by an identifier (e.g. a forum id) and embeds the
+    current generation of that identifier into every key.  Invalidating all
+    keys of an identifier is then just one increment of the generation
+    counter, the old keys are never read again and expire on their own::
+
+        topic_list_cache = CacheNamespace('forum/topics')
+        key = topic_list_cache.key(forum.id, page)
+        ...
+        topic_list_cache.invalidate(forum.id)
+
+    The generation is cached in the thread local cache so that one request
+    sees a consistent generation and fetches it only once.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def _generation_key(self, ident):
+        return u'ns/%s/%s' % (self.name, ident)
+
+    def generation(self, ident):
+        key = self._generation_key(ident)
+        generation = request_cache.get(key)
+        if generation is None:
+            # initialize with the current time so that a counter evicted
+            # from memcached never revives keys of an older generation.
+            generation = int(time.time())
+            request_cache.real_cache.add(key, generation, NAMESPACE_TIMEOUT)
+            generation = request_cache.real_cache.get(key) or generation
+        return generation
+
+    def key(self, ident, *parts):
+        """Return the cache key for `parts` in the namespace `ident`."""
+        key = u'%s/%s/%d' % (self.name, ident, self.generation(ident))
+        if parts:
+            key += u'/' + u'/'.join(unicode(p) for p in parts)
+        return key
+
+    def invalidate(self, ident):
+        """Invalidate all keys of the namespace `ident`."""
+        key = self._generation_key(ident)
+        # an evicted counter must not restart at 1 (the client creates
+        # missing counters with the delta), seed it like `generation` does.
+        request_cache.real_cache.add(key, int(time.time()), NAMESPACE_TIMEOUT)
+        request_cache.inc(key)
+
+
+def _try_add(key, value, timeout):
+    """Like `cache.add` but returns `True` if the key was stored, werkzeug
+    swallows that information.
+    """
+    real_cache = getattr(cache, 'cache', cache)
+    client = getattr(real_cache, '_client', None)
+    if client is None:
+        # not atomic, but the simple cache lives in one process anyway
+        if real_cache.get(key) is not None:
+            return False
+        real_cache.add(key, value, timeout)
+        return True
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    if real_cache.key_prefix:
+        key = real_cache.key_prefix + key
+    return bool(client.add(key, value, timeout))
+
+
+def _store_locked(key, value, timeout):
+    """Store `value` while holding the lock of `key`.  If an update of the
+    key was dropped in the meantime the value is outdated and is removed
+    again so that it gets rebuilt.
+    """
+    cache.set(key, value, timeout)
+    # check after storing: the dropped update marks the key dirty before
+    # it deletes the value, so one of both always sees the other.
+    dirty_key = key + _DIRTY_SUFFIX
+    if cache.get(dirty_key) is not None:
+        cache.delete_many(key, dirty_key)
+
+
+def _unwrap(item):
+    """Return the ``(value, soft_expires)`` tuple stored by
+    :func:`get_or_create` or `None` for anything else, e.g. a raw value
+    stored under the same key by an older version.
+    """
+    if item.__class__ is tuple and len(item) == 2 and \
+       isinstance(item[1], float):
+        return item
+
+
+def get_or_create(key, creator, timeout=300, stale_timeout=None,
+                  lock_timeout=30, wait=5, jitter=0.1):
+    """Return the value for `key` from the cache or create it by calling
+    `creator` and store it.  Other than a plain get-and-set this protects
+    the database from a stampede if a popular key expires:
+
+    - the value is stored together with a soft expiry.  After that point
+      one process (the one getting the lock via memcached `add`) refreshes
+      the value while everybody else keeps serving the stale one for up to
+      `stale_timeout` seconds (defaults to `timeout`).
+    - if there is no value at all, processes that don't get the lock wait
+      up to `wait` seconds for the lock holder to store the value before
+      they create it themselves.
+    - the timeout is shortened by a random amount of up to `jitter` (a
+      fraction of `timeout`) so that keys created together don't expire
+      together.
+
+    If `creator` returns `None` nothing is stored.  Values stored this way
+    must only be read using this function, other values found under `key`
+    are treated as missing.
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout
+    lock_key = key + _LOCK_SUFFIX
+    item = cache.get(key)
+    if item is not None:
+        item = _unwrap(item)
+    if item is not None:
+        value, soft_expires = item
+        if soft_expires > time.time() or \
+           not _try_add(lock_key, 1, lock_timeout):
+            return value
+    elif not _try_add(lock_key, 1, lock_timeout):
+        deadline = time.time() + wait
+        while time.time() < deadline:
+            time.sleep(0.05)
+            item = cache.get(key)
+            if item is not None and _unwrap(item) is not None:
+                return item[0]
+        # the lock holder seems to be stuck, create the value on our own
+        # but leave his lock alone.
+        return creator()
+
+    try:
+        value = creator()
+        if value is not None:
+            soft_timeout = timeout - random.uniform(0, jitter * timeout)
+            _store_locked(key, (value, time.time() + soft_timeout),
+                          int(soft_timeout + stale_timeout))
+    finally:
+        cache.delete(lock_key)
+    return value
+
+
+def update_cached(key, updater, timeout=None, lock_timeout=10):
+    """Replace the cached value of `key` by ``updater(value)`` while holding
+    the same lock as :func:`get_or_create`.  Nothing happens if the key is
+    not cached; if `updater` returns `None` the key is deleted.
+
+    If the lock is held by somebody else the update is dropped instead of
+    waiting for it: the key is marked dirty and deleted, the lock holder
+    does not store its value over a dirty key either.  So the value has
+    to be rebuilt but a concurrent update never gets lost.
+    """
+    lock_key = key + _LOCK_SUFFIX
+    if not _try_add(lock_key, 1, lock_timeout):
+        cache.set(key + _DIRTY_SUFFIX, 1, lock_timeout)
+        cache.delete(key)
+        return
+    try:
+        value = cache.get(key)
+        if value is None:
+            return
+        value = updater(value)
+        if value is None:
+            cache.delete(key)
+        else:
+            _store_locked(key, value, timeout)
+    finally:
+        cache.delete(lock_key)
+
 
 class CacheDebugProxy(object):
     """A proxy for a werkzeug.contrib.Cache which logs all queries for
@@ -152,7 +550,8 @@ class CacheDebugProxy(object):
                     format, instructions = loads(obj[1:])
                 obj = ('%s%s%s' % (obj[0], format, instructions)).decode('utf-8')
             elif isinstance(obj, basestring):
-                obj = force_unicode(obj)
+                # compressed values are no valid utf-8
+                obj = force_unicode(obj, errors='replace')
             request.cache_queries.append((ctx, force_unicode(query), obj))
         return result
 
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+    inyoka.utils.completion
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Prefix indexes for the autocompletion services.  Instead of a
+    ``LIKE 'prefix%'`` query for every keystroke the names are kept in the
+    cache, split into shards by their first characters::
+
+        user_completion = PrefixIndex('portal/users', load_usernames)
+        user_completion.complete(u'Fo')   # [u'foo', u'Foobar', ...]
+
+    A shard is loaded from the database when it is requested for the first
+    time, after that the model hooks keep it up to date with `add` and
+    `remove`.  Shards with too many names for one cache item are split into
+    shards of one character more.
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+from bisect import bisect_left
+from inyoka.conf import settings
+from inyoka.utils.cache import cache, update_cached
+
+
+#: stored instead of the entries of a shard that is split
+_SPLIT = 'split'
+
+
+class PrefixIndex(object):
+    """
+    A case insensitive prefix index of names.  `loader` is called with the
+    lowercase first `shard_length` (or more) characters of the names and
+    must return all names starting with them (case insensitive).  Prefixes
+    shorter than `shard_length` don't complete.
+
+    A shard with more than `max_shard_size` names (defaults to
+    `COMPLETION_SHARD_SIZE`) is split, its prefix and names shorter than
+    the longer shards don't complete either.
+    """
+
+    def __init__(self, name, loader, shard_length=2, max_shard_size=None):
+        self.name = name
+        self.loader = loader
+        self.shard_length = shard_length
+        self.max_shard_size = max_shard_size
+
+    def _get_key(self, shard):
+        # memcached keys must not contain spaces or control characters
+        return 'completion/%s/%s' % (self.name,
+                                     shard.encode('utf-8').encode('hex'))
+
+    def _get_max_shard_size(self):
+        if self.max_shard_size is None:
+            return settings.COMPLETION_SHARD_SIZE
+        return self.max_shard_size
+
+    def _get_shard(self, shard):
+        key = self._get_key(shard)
+        entries = cache.get(key)
+        if entries is None:
+            entries = sorted((name.lower(), name) for name in
+                             self.loader(shard))
+            if len(entries) > self._get_max_shard_size():
+                entries = _SPLIT
+            cache.set(key, entries, settings.COMPLETION_CACHE_TIMEOUT)
+        return entries
+
+    def _find_shard(self, prefix):
+        """
+        Return the entries of the shard `prefix` belongs to or `None` if
+        `prefix` is too short for the split shards.
+        """
+        length = self.shard_length
+        entries = self._get_shard(prefix[:length])
+        while entries == _SPLIT:
+            if length >= len(prefix):
+                return None
+            length += 1
+            entries = self._get_shard(prefix[:length])
+        return entries
+
+    def _update(self, name, updater):
+        """Call `updater` with the entries of the loaded shard of `name`."""
+        def _updater(entries):
+            if entries == _SPLIT:
+                return entries
+            updater(entries)
+            if len(entries) > self._get_max_shard_size():
+                # load it again to split it
+                return None
+            return entries
+        name = name.lower()
+        for length in xrange(self.shard_length, len(name) + 1):
+            key = self._get_key(name[:length])
+            if cache.get(key) != _SPLIT:
+                update_cached(key, _updater, settings.COMPLETION_CACHE_TIMEOUT)
+                break
+
+    def complete(self, prefix, limit=10):
+        """
+        Return up to `limit` names starting with `prefix`, sorted case
+        insensitive.
+        """
+        prefix = prefix.lower()
+        if len(prefix) < self.shard_length:
+            return []
+        entries = self._find_shard(prefix)
+        if entries is None:
+            return []
+        result = []
+        for idx in xrange(bisect_left(entries, (prefix,)), len(entries)):
+            key, name = entries[idx]
+            if len(result) >= limit or not key.startswith(prefix):
+                break
+            result.append(name)
+        return result
+
+    def add(self, name):
+        """Add `name` to the index if its shard is loaded."""
+        def _add(entries):
+            item = (name.lower(), name)
+            idx = bisect_left(entries, item)
+            if idx == len(entries) or entries[idx] != item:
+                entries.insert(idx, item)
+        self._update(name, _add)
+
+    def remove(self, name):
+        """Remove `name` from the index if its shard is loaded."""
+        def _remove(entries):
+            item = (name.lower(), name)
+            idx = bisect_left(entries, item)
+            if idx < len(entries) and entries[idx] == item:
+                del entries[idx]
+        self._update(name, _remove)
@@ -12,6 +12,7 @@
     :license: GNU GPL, see LICENSE for more details.
 """
 from __future__ import with_statement
+import os
 import re
 import sys
 import time
@@ -22,11 +23,11 @@ from sqlalchemy import orm, sql, exc
 from sqlalchemy import MetaData, create_engine, String, Unicode
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql.expression import Executable, ClauseElement, _literal_as_text
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import NullPool, QueuePool
 from sqlalchemy.util import to_list
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm.attributes import get_attribute, set_attribute
-from sqlalchemy.interfaces import ConnectionProxy
+from sqlalchemy.interfaces import ConnectionProxy, PoolListener
 from sqlalchemy.orm.session import Session as SASession
 from sqlalchemy.orm.interfaces import AttributeExtension
 from inyoka.conf import settings
@@ -38,16 +39,138 @@ from inyoka.utils.local import current_request
 
 
 _engine = None
+_engine_pid = None
 _engine_lock = Lock()
 _ending_numbers = re.compile(r'([^\d]+)(\d+)$')
 
 
+class PoolStatistics(object):
+    """Collects some counters about the connection pool of the current
+    worker process.  Use :func:`get_pool_status` to get a snapshot.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connects = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.invalidated = 0
+            self.timeouts = 0
+            self.wait_time = 0.0
+            self.max_wait_time = 0.0
+
+    def record_wait(self, duration, timeout=False):
+        with self._lock:
+            self.wait_time += duration
+            self.max_wait_time = max(self.max_wait_time, duration)
+            if timeout:
+                self.timeouts += 1
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'connects':         self.connects,
+                'checkouts':        self.checkouts,
+                'checkins':         self.checkins,
+                'invalidated':      self.invalidated,
+                'timeouts':         self.timeouts,
+                'wait_time':        self.wait_time,
+                'max_wait_time':    self.max_wait_time,
+                'avg_wait_time':    self.checkouts and
+                                    self.wait_time / self.checkouts or 0.0,
+            }
+
+
+pool_stats = PoolStatistics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A queue pool that records how long a checkout had to wait for
+    a free connection.
+    """
+
+    def do_get(self):
+        start = time.time()
+        try:
+            con = QueuePool.do_get(self)
+        except exc.TimeoutError:
+            pool_stats.record_wait(time.time() - start, timeout=True)
+            raise
+        pool_stats.record_wait(time.time() - start)
+        return con
+
+
+class PoolStatisticsListener(PoolListener):
+    """Counts connects, checkouts and checkins of the pool."""
+
+    def connect(self, dbapi_con, con_record):
+        pool_stats.incr('connects')
+
+    def checkout(self, dbapi_con, con_record, con_proxy):
+        pool_stats.incr('checkouts')
+
+    def checkin(self, dbapi_con, con_record):
+        pool_stats.incr('checkins')
+
+
+class PingListener(PoolListener):
+    """Validates a pooled connection on checkout.  The database servers
+    kill idle connections after a very short timeout, so a connection that
+    sat in the pool may be dead already.  In that case we raise a
+    `DisconnectionError` so that the pool throws the connection away and
+    retries the checkout with a fresh one.
+    """
+
+    def checkout(self, dbapi_con, con_record, con_proxy):
+        cursor = dbapi_con.cursor()
+        try:
+            try:
+                cursor.execute('SELECT 1')
+            except Exception:
+                pool_stats.incr('invalidated')
+                raise exc.DisconnectionError()
+        finally:
+            cursor.close()
+
+
+def get_pool_status():
+    """Return the pool counters and the current pool usage of this
+    worker process as dictionary.
+    """
+    status = pool_stats.as_dict()
+    pool = _engine.pool if _engine is not None else None
+    if isinstance(pool, QueuePool):
+        status.update({
+            'size':         pool.size(),
+            'checkedin':    pool.checkedin(),
+            'checkedout':   pool.checkedout(),
+            'overflow':     pool.overflow(),
+        })
+    return status
+
+
 def get_engine():
     """Creates the engine if it does not exist and returns
     the current engine.
+
+    The engine is recreated if the process forked (e.g. a gunicorn worker
+    that inherited the engine of the master), so that pooled connections
+    are never shared between processes.
     """
-    global _engine
+    global _engine, _engine_pid
     with _engine_lock:
+        if _engine is not None and _engine_pid != os.getpid():
+            # don't close the connections, they belong to the parent
+            _engine = None
+            pool_stats.reset()
         if _engine is None:
             rdbm = 'mysql'
             extra = '?charset=utf8&use_unicode=1'
@@ -59,14 +182,30 @@ def get_engine():
             if settings.DEBUG:
                 options['proxy'] = ConnectionDebugProxy()
 
-            #XXX: We don't use a connection pool because of fancy mysql
-            #     timeout settings on the ubuntu-eu servers so that
-            #     our php applications don't kill the server with open
-            #     connections.
+            if settings.DATABASE_POOLING:
+                listeners = [PoolStatisticsListener()]
+                if settings.DATABASE_POOL_PRE_PING:
+                    listeners.append(PingListener())
+                options.update(
+                    poolclass=InstrumentedQueuePool,
+                    pool_size=settings.DATABASE_POOL_SIZE,
+                    max_overflow=settings.DATABASE_POOL_MAX_OVERFLOW,
+                    pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+                    listeners=listeners,
+                )
+            else:
+                #XXX: We don't use a connection pool because of fancy mysql
+                #     timeout settings on the ubuntu-eu servers so that
+                #     our php applications don't kill the server with open
+                #     connections.
+                options['poolclass'] = NullPool
+
             _engine = create_engine('%s://%s:%s@%s/%s%s' % (
                 rdbm, settings.DATABASE_USER, settings.DATABASE_PASSWORD,
                 settings.DATABASE_HOST, settings.DATABASE_NAME, extra
-            ), pool_recycle=25, echo=False, poolclass=NullPool, **options)
+            ), pool_recycle=settings.DATABASE_POOL_RECYCLE, echo=False,
+               **options)
+            _engine_pid = os.getpid()
 
         return _engine
 
@@ -353,6 +492,7 @@ def _make_module():
     db.PGArray = PGArray
 
     db.get_engine = get_engine
+    db.get_pool_status = get_pool_status
     db.session = session
     db.metadata = metadata
     db.mapper = mapper
@@ -13,8 +13,8 @@ from werkzeug.contrib.atom import AtomFeed
 from django.utils.encoding import force_unicode, DjangoUnicodeDecodeError
 from inyoka.utils.html import escape
 from inyoka.utils.http import HttpResponse, PageNotFound, \
-    HttpResponsePermanentRedirect
-from inyoka.utils.cache import cache
+    HttpResponsePermanentRedirect, DirectResponse
+from inyoka.utils.cache import get_or_create
 
 
 AVAILABLE_FEED_COUNTS = (25,)
@@ -38,16 +38,21 @@ def atom_feed(cache_key=None, available_counts=AVAILABLE_FEED_COUNTS):
             if kwargs['count'] not in available_counts:
                 raise PageNotFound()
 
-            if cache_key is not None:
-                key = cache_key % kwargs
-                content = cache.get(key)
-                if content is None:
-                    rv = f(*args, **kwargs)
-                    if not isinstance(rv, AtomFeed):
-                        # ret is a HttpResponse object
-                        return rv
-                    content = rv.to_string()
-                    cache.set(key, content, 600)
+            def _create_content():
+                rv = f(*args, **kwargs)
+                if not isinstance(rv, AtomFeed):
+                    # ret is a HttpResponse object
+                    raise DirectResponse(rv)
+                return rv.to_string()
+
+            try:
+                if cache_key is not None:
+                    content = get_or_create(cache_key % kwargs,
+                                            _create_content, 600)
+                else:
+                    content = _create_content()
+            except DirectResponse, exc:
+                return exc.response
 
             content_type='application/atom+xml; charset=utf-8'
             response = HttpResponse(content, content_type=content_type)
@@ -16,6 +16,7 @@
 """
 import re
 import xapian
+from markupsafe import escape
 from pygments import highlight
 from pygments.lexers import get_lexer_by_name, get_lexer_for_filename, \
     get_lexer_for_mimetype, TextLexer
@@ -35,6 +36,9 @@ _split_re = re.compile(r'<\w+[^>]*>|</\w+>|[\w\']+|\s+|[^\w\'\s<>/]+')
 # regular expression for the tested for box
 _tested_for_re = re.compile(r'<div class="box tested_for">(.+?)</div>', re.M | re.S)
 
+# the german stemmer replaces umlauts and sharp s, see `ExcerptBuilder`
+_stem_chars = {u'a': u'[aä]', u'o': u'[oö]', u'u': u'[uü]'}
+
 
 def highlight_code(code, lang=None, filename=None, mimetype=None):
     """Highlight a block using pygments to HTML."""
@@ -294,11 +298,155 @@ class TextHighlighter(object):
         return u''.join(words)
 
 
-def create_excerpt(text, query, tags=None, language=None, stemmer=None, strip_tags=False):
-    if tags is None:
-        tags = [u'<strong>', u'</strong>']
+def get_plaintext(html):
+    """Return the text of `html` as it is used for excerpts."""
     # Strip the tested for box from highlighting so that we get better results
     # on wiki pages
-    text = _tested_for_re.sub(u'', text)
-    highlighter = TextHighlighter(language, stemmer)
-    return highlighter.make_sample(text, query, 250, tags)
+    html = _tested_for_re.sub(u'', html)
+    return striptags(html.replace('<br />', ' ').replace('<p>', ' '))
+
+
+def get_query_terms(query):
+    """
+    Return the set of the (stemmed) words of `query`, a `xapian.Query` or
+    a list of words, as utf-8 strings.
+    """
+    terms = set()
+    if isinstance(query, xapian.Query):
+        t = query.get_terms_begin()
+        while t != query.get_terms_end():
+            term = t.get_term()
+            if term.islower():
+                terms.add(term)
+            elif term[:1] == 'Z' and term[1:].islower():
+                # stemmed term of the query parser
+                terms.add(term[1:])
+            t.next()
+    else:
+        stemmer = get_stemmer()
+        for word in query:
+            terms.add(stemmer(word.lower().encode('utf-8')))
+    return terms
+
+
+class ExcerptBuilder(object):
+    """
+    Creates the excerpts for the results of one search query.  Other than
+    `TextHighlighter.make_sample` the text is not split into words:
+
+    - a regular expression finds the words that start like one of the
+      query terms, only those are stemmed to check whether they match.
+      Stems are remembered for all excerpts created by the builder.
+    - the scan stops as soon as the matches found give `maxlen` characters
+      of context.
+
+    Words whose stem doesn't start like the word (apart from umlauts and
+    sharp s, which the german stemmer replaces) are not found.
+    """
+
+    def __init__(self, query, tags=None, maxlen=250, language=None,
+                 stemmer=None):
+        if tags is None:
+            tags = [u'<strong>', u'</strong>']
+        self.tags = tags
+        self.maxlen = maxlen
+        self._stem = stemmer or get_stemmer(language or LANGUAGE)
+        self.terms = get_query_terms(query)
+        self._matches = {}
+        self._candidate_re = None
+        if self.terms:
+            prefixes = []
+            for term in sorted(self.terms, key=len, reverse=True):
+                parts = term.decode('utf-8', 'ignore').split(u'ss')
+                prefixes.append(u'(?:ss|ß)'.join(
+                    u''.join(_stem_chars.get(c, re.escape(c)) for c in part)
+                    for part in parts))
+            self._candidate_re = re.compile(ur"(?<![\w'])(?:%s)[\w']*" %
+                                            u'|'.join(prefixes), re.I | re.U)
+
+    def is_match(self, word):
+        """Check whether `word` is one of the query terms."""
+        word = word.lower()
+        try:
+            return self._matches[word]
+        except KeyError:
+            encoded = word.encode('utf-8')
+            rv = self._matches[word] = encoded in self.terms or \
+                 self._stem(encoded) in self.terms
+            return rv
+
+    def find_windows(self, text):
+        """
+        Return a list of ``[start, end, matches]`` windows around the
+        first matches in `text`, `matches` are ``(start, end)`` tuples.
+        """
+        context = self.maxlen // 4
+        windows = []
+        length = 0
+        if self._candidate_re is None:
+            return windows
+        for match in self._candidate_re.finditer(text):
+            if windows and length >= self.maxlen and \
+               match.start() > windows[-1][1]:
+                break
+            if not self.is_match(match.group()):
+                continue
+            start, end = match.span()
+            if windows and start <= windows[-1][1]:
+                window = windows[-1]
+                length += max(end + context, window[1]) - window[1]
+                window[1] = max(end + context, window[1])
+                window[2].append((start, end))
+            else:
+                windows.append([max(0, start - context), end + context,
+                                [(start, end)]])
+                length += windows[-1][1] - windows[-1][0]
+        return windows
+
+    def build(self, text, plain=False):
+        """
+        Return the excerpt of `text` as HTML.  `text` is HTML unless
+        `plain` is true (e.g. the text was made with `get_plaintext`).
+        """
+        if not plain:
+            text = get_plaintext(text)
+        windows = self.find_windows(text)
+        if not windows:
+            windows = [[0, self.maxlen, []]]
+
+        result = []
+        length = 0
+        for start, end, matches in windows:
+            if length >= self.maxlen:
+                break
+            end = min(end, len(text), start + self.maxlen - length)
+            # don't cut words
+            if start > 0:
+                space = text.find(u' ', start, matches and matches[0][0] or end)
+                start = space == -1 and start or space + 1
+                result.append(u'... ')
+            if end < len(text):
+                space = text.rfind(u' ', matches and matches[-1][1] or start,
+                                   end)
+                end = space == -1 and end or space
+            pos = start
+            for match_start, match_end in matches:
+                if match_end > end:
+                    break
+                result.append(escape(text[pos:match_start]))
+                result.append(self.tags[0])
+                result.append(escape(text[match_start:match_end]))
+                result.append(self.tags[1])
+                pos = match_end
+            result.append(escape(text[pos:end]))
+            if end < len(text):
+                result.append(u' ...')
+            length += end - start
+        return u''.join(result)
+
+
+def create_excerpt(text, query, tags=None, language=None, stemmer=None,
+                   plain=False):
+    """Create the excerpt of `text` for `query`, see `ExcerptBuilder`."""
+    return ExcerptBuilder(query, tags, 250, language, stemmer) \
+        .build(text, plain)
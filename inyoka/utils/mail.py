@@ -5,13 +5,36 @@
 
     This module provides various e-mail related functionality.
 
+    Mails are handed to one of the backends in `MAIL_BACKENDS`, selected by
+    the `MAIL_BACKEND` setting:
+
+    ``sendmail``
+        pipes every mail into its own ``/usr/sbin/sendmail -t`` process.
+
+    ``smtp``
+        talks to `EMAIL_HOST` and keeps up to `MAIL_SMTP_POOL_SIZE` idle
+        connections per process for reuse.
+
+    ``file``
+        writes every mail into a file in `MAIL_FILE_PATH`, useful for
+        development and tests.
+
+    Many mails are best sent with :func:`send_mass_mail` or within a
+    :func:`mail_session` so that they share one backend connection.
+
     :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
     :license: GNU GPL, see LICENSE for more details.
 """
+from __future__ import with_statement
+import os
 import re
+import time
+import smtplib
+from contextlib import contextmanager
 from email.mime.text import MIMEText
 from email.header import Header
 from subprocess import Popen, PIPE
+from threading import Lock, local
 from dns.resolver import query as dns_query
 from dns.exception import DNSException
 from inyoka.utils.storage import storage
@@ -24,29 +47,212 @@ _mail_re = re.compile(r'''(?xi)
           \\[\x01-\x09\x0b\x0c\x0e-\x7f])*")@
 ''')
 
-def send_mail(subject, message_, from_, to):
-    assert len(to) == 1
-    if to[0].endswith('.invalid'):
+_session = local()
+
+
+class SendmailBackend(object):
+    """Pipes every mail into its own sendmail process."""
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        for from_, to, message in messages:
+            try:
+                proc = Popen(['/usr/sbin/sendmail', '-t'], stdin=PIPE)
+                proc.stdin.write(message)
+                proc.stdin.close()
+                # replace with os.wait() in a outer level to not wait to much?!
+                proc.wait()
+            except OSError:
+                if settings.DEBUG:
+                    print message
+                else:
+                    raise
+        return len(messages)
+
+
+class SMTPPool(object):
+    """Keeps idle SMTP connections of this process for reuse."""
+
+    def __init__(self):
+        self._idle = []
+        self._lock = Lock()
+
+    def connect(self):
+        connection = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT)
+        if settings.EMAIL_USE_TLS:
+            connection.ehlo()
+            connection.starttls()
+            connection.ehlo()
+        if settings.EMAIL_HOST_USER:
+            connection.login(settings.EMAIL_HOST_USER,
+                             settings.EMAIL_HOST_PASSWORD)
+        return connection
+
+    def acquire(self):
+        while 1:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection = self._idle.pop()
+            # the server may have closed the connection in the meantime
+            try:
+                connection.noop()
+                return connection
+            except smtplib.SMTPException:
+                pass
+        return self.connect()
+
+    def release(self, connection):
+        with self._lock:
+            if len(self._idle) < settings.MAIL_SMTP_POOL_SIZE:
+                self._idle.append(connection)
+                return
+        try:
+            connection.quit()
+        except smtplib.SMTPException:
+            pass
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            try:
+                connection.quit()
+            except smtplib.SMTPException:
+                pass
+
+
+smtp_pool = SMTPPool()
+
+
+class SMTPBackend(object):
+    """Sends mails over a connection from the `smtp_pool`."""
+
+    def __init__(self):
+        self.connection = None
+
+    def open(self):
+        if self.connection is None:
+            self.connection = smtp_pool.acquire()
+
+    def close(self):
+        if self.connection is not None:
+            smtp_pool.release(self.connection)
+            self.connection = None
+
+    def send_messages(self, messages):
+        for from_, to, message in messages:
+            try:
+                self.connection.sendmail(from_, [to], message)
+            except smtplib.SMTPServerDisconnected:
+                self.connection = smtp_pool.connect()
+                self.connection.sendmail(from_, [to], message)
+        return len(messages)
+
+
+class FileBackend(object):
+    """Writes every mail into its own file in `MAIL_FILE_PATH`."""
+
+    _counter = 0
+
+    def open(self):
+        if not os.path.isdir(settings.MAIL_FILE_PATH):
+            os.makedirs(settings.MAIL_FILE_PATH)
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        for from_, to, message in messages:
+            FileBackend._counter += 1
+            filename = os.path.join(settings.MAIL_FILE_PATH, '%d-%d-%06d.eml' %
+                (time.time() * 1000, os.getpid(), FileBackend._counter))
+            f = open(filename, 'w')
+            try:
+                f.write(message)
+            finally:
+                f.close()
+        return len(messages)
+
+
+MAIL_BACKENDS = {
+    'sendmail':     SendmailBackend,
+    'smtp':         SMTPBackend,
+    'file':         FileBackend,
+}
+
+
+def get_backend():
+    return MAIL_BACKENDS[settings.MAIL_BACKEND]()
+
+
+@contextmanager
+def mail_session():
+    """
+    All mails sent by this thread within the `with` block share one backend
+    connection::
+
+        with mail_session():
+            for user in users:
+                send_mail(subject, text, from_, [user.email])
+    """
+    if getattr(_session, 'backend', None) is not None:
+        yield _session.backend
         return
+    backend = get_backend()
+    backend.open()
+    _session.backend = backend
+    try:
+        yield backend
+    finally:
+        _session.backend = None
+        backend.close()
+
 
-    message = u'From: %s\nTo: %s' % (from_ , to[0])
+def build_message(subject, text):
+    """
+    Return the part of a mail that is the same for all recipients, pass it
+    to :func:`address_message` for each of them.
+    """
+    return '\nSubject: ' + \
+        Header(subject, 'utf-8', header_name='Subject').encode() + '\n' + \
+        MIMEText(text.encode('utf-8'), _charset='utf-8').as_string()
+
+
+def address_message(message, from_, to):
+    headers = u'From: %s\nTo: %s' % (from_, to)
     # Ignore für den Fall, dass wir hier blöde emailadressen bekommen…
     # TODO: non ascii adressen erlauben
-    message = message.encode('ascii', 'ignore')
-    message += '\nSubject: ' + Header(subject, 'utf-8', header_name='Subject').encode() + '\n'
-    message += MIMEText(message_.encode('utf-8'), _charset='utf-8').as_string()
+    return headers.encode('ascii', 'ignore') + message
 
-    try:
-        proc = Popen(['/usr/sbin/sendmail', '-t'], stdin=PIPE)
-        proc.stdin.write(message)
-        proc.stdin.close()
-        # replace with os.wait() in a outer level to not wait to much?!
-        proc.wait()
-    except OSError:
-        if settings.DEBUG:
-            print message
-        else:
-            raise
+
+def send_mass_mail(datatuple):
+    """
+    Send a mail for every ``(subject, message, from, recipients)`` tuple in
+    `datatuple` using one backend connection.  Every recipient gets his own
+    mail.  Return the number of sent mails.
+    """
+    messages = []
+    for subject, message_, from_, to in datatuple:
+        message = build_message(subject, message_)
+        for recipient in to:
+            if recipient.endswith('.invalid'):
+                continue
+            messages.append((from_, recipient,
+                             address_message(message, from_, recipient)))
+    if not messages:
+        return 0
+    with mail_session() as backend:
+        return backend.send_messages(messages)
+
+
+def send_mail(subject, message_, from_, to):
+    return send_mass_mail([(subject, message_, from_, to)])
 
 
 def may_be_valid_mail(email):
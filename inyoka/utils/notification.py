@@ -11,10 +11,15 @@ from inyoka.utils.mail import send_mail
 from inyoka.utils.jabber import send as send_jabber
 from inyoka.utils.templating import render_template
 
+
 def send_notification(user, template_name=None, subject=None, args=None):
     """
     Send a message to the user using the person's favourite method(s)
     he has specified in the user control panel.
+
+    The messages are rendered right away but only queued for delivery by
+    `scripts/send_notifications.py` unless `NOTIFICATIONS_QUEUED` is
+    disabled.
     """
     assert subject is not None
     args = args or {}
@@ -26,11 +31,33 @@ def send_notification(user, template_name=None, subject=None, args=None):
     methods = user.settings.get('notify', ['mail'])
     if 'jabber' in methods and user.jabber:
         message = render_template('mails/%s.jabber.txt' % template_name, args)
-        send_jabber(user.jabber, message, xhtml=False)
+        queue_notification(user, 'jabber', user.jabber, subject, message)
     if 'mail' in methods:
         message = render_template('mails/%s.txt' % template_name, args)
-        send_mail(settings.EMAIL_SUBJECT_PREFIX + subject, message,
-                  settings.INYOKA_SYSTEM_USER_EMAIL, [user.email])
+        queue_notification(user, 'mail', user.email,
+                           settings.EMAIL_SUBJECT_PREFIX + subject, message)
+
+
+def queue_notification(user, method, recipient, subject, text):
+    if not settings.NOTIFICATIONS_QUEUED:
+        deliver(method, recipient, subject, text)
+        return
+    from inyoka.portal.models import NotificationQueue
+    NotificationQueue.objects.append(user, method, recipient,
+                                     subject[:255], text)
+
+
+def deliver(method, recipient, subject, text):
+    """
+    Deliver a single notification.  Raises an `IOError` if the jabber bot
+    is not reachable.
+    """
+    if method == 'jabber':
+        if not send_jabber(recipient, text, xhtml=False):
+            raise IOError('jabber bot not reachable')
+    elif method == 'mail':
+        send_mail(subject, text, settings.INYOKA_SYSTEM_USER_EMAIL,
+                  [recipient])
 
 
 def notify_about_subscription(sub, template=None, subject=None, args=None):
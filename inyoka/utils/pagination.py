@@ -28,6 +28,11 @@
     column determinating the position instead of using an offset / limit
     statement. In this case you can use the `rownum_column` argument.
 
+    If there's no such column, :class:`KeysetPagination` seeks to the start
+    of a page using the sort key of the last entry on the previous page
+    instead of an offset, see there for the details.  It generates the very
+    same HTML.
+
     Caveat: paginations with link functions generated in a closure are
     not pickleable.
 
@@ -35,8 +40,12 @@
     :license: GNU GPL, see LICENSE for more details.
 """
 import math
+import operator
+from sqlalchemy import and_, or_
 from inyoka.utils.http import PageNotFound, HttpResponseRedirect
 from inyoka.utils.html import escape
+from inyoka.utils.cache import cache, get_or_create
+from django.db.models import Q
 from django.utils.encoding import force_unicode
 from werkzeug import url_encode
 
@@ -65,6 +74,9 @@ class Pagination(object):
         else:
             self.total = query.count()
 
+        self._setup(request, link)
+
+    def _setup(self, request, link):
         if self.per_page == 0: # Display all entries on one page
             self.max_pages = 1
         else:
@@ -82,7 +94,7 @@ class Pagination(object):
             self.generate_link = link
 
         self.needs_redirect_to = None
-        if self.total and self.total/per_page < 1 and page > 1:
+        if self.total and self.total/self.per_page < 1 and self.page > 1:
             url = self.generate_link(1, dict(request.GET.lists()))
             self.needs_redirect_to = lambda: HttpResponseRedirect(url)
 
@@ -153,3 +165,87 @@ class Pagination(object):
             class_ += ' pagination_' + position
         return u'<div class="%s">%s<div style="clear: both">' \
                u'</div></div>' % (class_, u''.join(result))
+
+
+class KeysetPagination(Pagination):
+    """A pagination that doesn't use an offset to select the entries of a
+    page but seeks to the sort key of the last entry on the previous page.
+    This way deep pages are as cheap as the first one if the sort key is
+    indexed.
+
+    `keys` is a list of ``(column, descending)`` tuples that define the
+    order of `query` and must be unique together (add the primary key as
+    last key if required).  For sqlalchemy queries the columns are column
+    objects that must be part of the selected columns, for Django querysets
+    they are field names.  The query must already be ordered by them.
+
+    Page numbers stay the same as for :class:`Pagination`, so the sort key
+    a page starts after (the cursor) is stored in the cache under
+    ``cursor_key % page`` whenever the previous page is shown.  If there is
+    no cursor for a page (e.g. if someone jumps to a deep page) this page is
+    selected with an offset once.  Cursors are not invalidated, a changed
+    order just shifts the page boundaries a bit, like it does for an offset.
+
+    If `total` is not given and a `count_key` is, the total is cached for
+    `cache_timeout` seconds.  Pass an approximation as `total` if even that
+    is too expensive.
+    """
+
+    def __init__(self, request, query, page, per_page=10, link=None,
+                 total=None, keys=(), cursor_key=None, count_key=None,
+                 cache_timeout=300):
+        self.page = int(page)
+        self.per_page = per_page
+        self.keys = keys
+
+        cursor = None
+        if cursor_key is not None and self.page > 1:
+            cursor = cache.get(cursor_key % self.page)
+        if cursor is not None:
+            result = list(self._seek(query, cursor)[:self.per_page])
+        else:
+            idx = (self.page - 1) * self.per_page
+            result = list(query[idx:idx + self.per_page])
+        self.objects = result
+
+        if cursor_key is not None and result and len(result) == self.per_page:
+            cache.set(cursor_key % (self.page + 1), self._get_key(result[-1]),
+                      cache_timeout)
+
+        if total is None:
+            if count_key is not None:
+                total = get_or_create(count_key, query.count, cache_timeout)
+            else:
+                total = query.count()
+        self.total = total
+
+        self._setup(request, link)
+
+    def _get_key(self, obj):
+        return tuple(getattr(obj, isinstance(column, basestring)
+                                  and column or column.key)
+                     for column, descending in self.keys)
+
+    def _seek(self, query, cursor):
+        """Filter `query` for all entries that are sorted after `cursor`."""
+        if isinstance(self.keys[0][0], basestring):
+            # django queryset
+            clauses = []
+            for idx, (field, descending) in enumerate(self.keys):
+                lookup = '%s__%s' % (field, descending and 'lt' or 'gt')
+                clause = Q(**{lookup: cursor[idx]})
+                for prev_idx in xrange(idx):
+                    clause &= Q(**{self.keys[prev_idx][0]: cursor[prev_idx]})
+                clauses.append(clause)
+            return query.filter(reduce(operator.or_, clauses))
+
+        clauses = []
+        for idx, (column, descending) in enumerate(self.keys):
+            parts = [self.keys[prev_idx][0] == cursor[prev_idx]
+                     for prev_idx in xrange(idx)]
+            if descending:
+                parts.append(column < cursor[idx])
+            else:
+                parts.append(column > cursor[idx])
+            clauses.append(and_(*parts))
+        return query.filter(or_(*clauses))
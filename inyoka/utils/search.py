@@ -10,17 +10,21 @@
     :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
     :license: GNU GPL, see LICENSE for more details.
 """
+from __future__ import with_statement
+import os
 import re
 import time
 import xapian
-from weakref import WeakKeyDictionary
-from threading import currentThread as get_current_thread, local
+from hashlib import md5
+from contextlib import contextmanager
+from threading import Lock, local
 from time import mktime
 from datetime import datetime
 from cPickle import dumps, loads
 from django.core.exceptions import ObjectDoesNotExist
 from inyoka.conf import settings
 from inyoka.utils import get_significant_digits
+from inyoka.utils.cache import get_or_create
 from inyoka.utils.parsertools import OrderedDict
 
 
@@ -64,6 +68,171 @@ def get_full_id(match):
     return match.document.get_value(0).split(':')
 
 
+def get_date_range_query(date_begin=None, date_end=None):
+    """
+    Return a query matching the documents dated between `date_begin` and
+    `date_end` (defaults to now).
+    """
+    d1 = date_begin and mktime(date_begin.timetuple()) or 0
+    d2 = date_end and mktime(date_end.timetuple()) or \
+         mktime(datetime.utcnow().timetuple())
+    return xapian.Query(xapian.Query.OP_VALUE_RANGE, 2,
+                        xapian.sortable_serialise(d1),
+                        xapian.sortable_serialise(d2))
+
+
+def open_database(location, writeable=False):
+    """
+    Open the search database at `location`, a path or a ``tcpsrv://`` url
+    of a xapian-tcpsrv.
+    """
+    match = _tcpsrv_re.match(location)
+    if match is not None:
+        host, port = match.groups()
+        if writeable:
+            return xapian.remote_open_writable(host, int(port))
+        return xapian.remote_open(host, int(port))
+    if writeable:
+        return xapian.WritableDatabase(location, xapian.DB_CREATE_OR_OPEN)
+    return xapian.Database(location)
+
+
+def get_database_signature(location):
+    """
+    Return a value that changes with every commit to the local database at
+    `location` (the database files are rewritten then) or if the
+    `location` symlink is switched to another database.  Remote databases
+    have no signature (`None`).
+    """
+    if _tcpsrv_re.match(location):
+        return None
+    path = os.path.realpath(location)
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return None
+    files = []
+    for name in sorted(names):
+        try:
+            stat = os.stat(os.path.join(path, name))
+        except OSError:
+            continue
+        files.append((name, stat.st_mtime, stat.st_size))
+    return path, tuple(files)
+
+
+class Reader(object):
+    """A pooled read-only database, see `ReaderPool`."""
+
+    def __init__(self, location):
+        self.location = location
+        self.signature = get_database_signature(location)
+        self.database = open_database(location)
+        self.checked = time.time()
+
+    def invalidate(self):
+        """Make the next `refresh` open the database again."""
+        self.signature = self.checked = 0
+
+    def refresh(self, reopen_interval):
+        """Reopen the database if a newer revision is available."""
+        if _tcpsrv_re.match(self.location):
+            # we can't look at the files, ask the server now and then
+            if time.time() - self.checked >= reopen_interval:
+                self.database.reopen()
+                self.checked = time.time()
+            return
+        signature = get_database_signature(self.location)
+        if signature == self.signature:
+            return
+        if not self.signature or (signature is not None and
+                                  signature[0] != self.signature[0]):
+            # invalidated or the index was rebuilt, reopen would stay on
+            # the old directory
+            self.database = open_database(self.location)
+        else:
+            self.database.reopen()
+        self.signature = signature
+
+
+class ReaderPool(object):
+    """
+    Keeps up to `size` idle read-only connections to the search databases
+    at `locations` (the index or replicas of it).  New connections are
+    opened round-robin, a location that fails is skipped for
+    `retry_interval` seconds.  Connections are only reopened if the index
+    changed, see `Reader.refresh`.
+    """
+
+    def __init__(self, locations, size=4, retry_interval=30,
+                 reopen_interval=1):
+        self.locations = list(locations)
+        self.size = size
+        self.retry_interval = retry_interval
+        self.reopen_interval = reopen_interval
+        self._lock = Lock()
+        self._idle = []
+        self._next = 0
+        self._down = {}
+
+    def _get_locations(self):
+        """Return the locations to try for a new connection, in order."""
+        with self._lock:
+            count = len(self.locations)
+            start = self._next
+            self._next = (self._next + 1) % count
+        now = time.time()
+        locations = [self.locations[(start + idx) % count]
+                     for idx in xrange(count)]
+        healthy = [l for l in locations if self._down.get(l, 0) <= now]
+        # if everything is down try the one that failed first anyway
+        return healthy or sorted(locations, key=lambda l: self._down[l])
+
+    def mark_down(self, location):
+        self._down[location] = time.time() + self.retry_interval
+
+    def _connect(self):
+        error = None
+        for location in self._get_locations():
+            try:
+                return Reader(location)
+            except (xapian.DatabaseOpeningError, xapian.NetworkError), exc:
+                error = exc
+                self.mark_down(location)
+        raise error
+
+    def acquire(self):
+        """Return an up-to-date `Reader` that is not used by anybody else."""
+        while 1:
+            with self._lock:
+                reader = self._idle and self._idle.pop() or None
+            if reader is None:
+                return self._connect()
+            if self._down.get(reader.location, 0) > time.time():
+                continue
+            try:
+                reader.refresh(self.reopen_interval)
+            except (xapian.DatabaseOpeningError, xapian.NetworkError):
+                self.mark_down(reader.location)
+                continue
+            return reader
+
+    def release(self, reader, failed=False):
+        """Give back `reader`.  If it `failed` its location is marked down
+        and the connection is dropped."""
+        if failed:
+            self.mark_down(reader.location)
+            return
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(reader)
+
+    def clear(self):
+        with self._lock:
+            self._idle = []
+            self._down.clear()
+
+
 class EmptySearchResult(object):
     """This class more or less is a dummy to define an emtpy result set"""
 
@@ -94,28 +263,44 @@ class SearchResult(EmptySearchResult):
             results[(adapter, int(id))] = match
 
         for adapter, instance in adapters.iteritems():
-            to_load = [id[1] for id in results if id[0] == adapter]
-            if not to_load:
-                continue
-            values = instance.recv_multi(to_load)
-            if values is None:
-                continue
-
-            mapping = zip((res for res in results if res[0] == adapter), values)
-
-            for mq, data in mapping:
-                match = results[mq]
-                if data is None:
+            # documents with a display payload are rendered without any
+            # database query, the others are loaded with `recv_multi`.
+            stored, to_load = [], []
+            for mq in results:
+                if mq[0] != adapter:
                     continue
-                try:
-                    text = data.pop('text')
-                except KeyError:
-                    text = None
-                if text:
-                    data['excerpt'] = create_excerpt(text, query)
-                data['title'] = data['title']
-                data['score'] = match.percent
-                results[mq] = data
+                payload = results[mq].document.get_data()
+                if payload:
+                    data = loads(payload)
+                    stored.append(data)
+                    results[mq] = (results[mq], data, True)
+                else:
+                    to_load.append(mq)
+            if stored:
+                instance.update_display(stored)
+
+            values = to_load and instance.recv_multi([mq[1] for mq in to_load])
+            for mq, data in zip(to_load, values or ()):
+                if data is not None:
+                    results[mq] = (results[mq], data, False)
+
+        # the excerpts share the stems of the text's words
+        excerpts = ExcerptBuilder(query)
+        for mq, value in results.items():
+            if not isinstance(value, tuple):
+                # not found in the database anymore, the raw match must not
+                # end up in the (cached) results
+                del results[mq]
+                continue
+            match, data, plain = value
+            try:
+                text = data.pop('text')
+            except KeyError:
+                text = None
+            if text:
+                data['excerpt'] = excerpts.build(text, plain)
+            data['score'] = match.percent
+            results[mq] = data
         self.results = results.values()
 
         self.terms = []
@@ -137,7 +322,7 @@ class SearchSystem(object):
         if search is not None:
             raise TypeError('cannot create %r instances, use the search '
                             "object instead" % self.__class__.__name__)
-        self.connections = WeakKeyDictionary()
+        self._readers = None
         self.prefix_handlers = {}
         self.auth_deciders = {}
         self.adapters = {}
@@ -156,46 +341,65 @@ class SearchSystem(object):
             #TODO: how to resolve the failed object?
             pass
 
+    def get_fingerprint(self, component, docid):
+        """
+        Return the fingerprint the document was stored with or `None`.
+        Adapters use it to skip objects that did not change since they
+        were indexed.
+        """
+        connection = self.get_connection(True)
+        term = 'Q%s:%d' % (component.lower(), docid)
+        for item in connection.postlist(term):
+            return connection.get_document(item.docid).get_value(4) or None
+        return None
+
     def queue(self, component, docid):
         from inyoka.portal.models import SearchQueue
         SearchQueue.objects.append(component, docid)
 
     def get_connection(self, writeable=False):
-        """Get a new connection to the database."""
+        """
+        Get the writable database or a new read-only connection.  Use
+        `reader` to search, it gives pooled connections.
+        """
         if writeable:
             if not self._connection:
-                if _tcpsrv_re.match(settings.XAPIAN_DATABASE):
-                    host, port = _tcpsrv_re.match(settings.XAPIAN_DATABASE).groups()
-                    self._connection = xapian.remote_open_writable(host, int(port))
-                else:
-                    self._connection = xapian.WritableDatabase(
-                        settings.XAPIAN_DATABASE, xapian.DB_CREATE_OR_OPEN)
+                self._connection = open_database(settings.XAPIAN_DATABASE,
+                                                 True)
             return self._connection
-        thread = get_current_thread()
-        if thread not in self.connections:
-            if _tcpsrv_re.match(settings.XAPIAN_DATABASE):
-                host, port = _tcpsrv_re.match(settings.XAPIAN_DATABASE).groups()
-                self.connections[thread] = connection = \
-                    xapian.remote_open(host, int(port))
-            else:
-                self.connections[thread] = connection = \
-                    xapian.Database(settings.XAPIAN_DATABASE)
-            return self.connections[thread]
-        else:
-            connection = self.connections[thread]
+        return open_database(settings.XAPIAN_DATABASE)
 
-        _connection_attemts = 0
-        while _connection_attemts <= 3:
-            try:
-                connection.reopen()
-            except xapian.DatabaseOpeningError:
-                time.sleep(0.1)
-                connection.reopen()
-                _connection_attemts += 1
-            else:
-                break
+    @property
+    def readers(self):
+        if self._readers is None:
+            self._readers = ReaderPool(
+                settings.XAPIAN_READ_DATABASES or [settings.XAPIAN_DATABASE],
+                settings.SEARCH_READER_POOL_SIZE,
+                settings.SEARCH_REPLICA_RETRY_INTERVAL,
+                settings.SEARCH_REOPEN_INTERVAL)
+        return self._readers
+
+    @contextmanager
+    def reader(self):
+        """
+        Context manager that provides a `Reader` from the pool, use its
+        `database` attribute::
 
-        return connection
+            with search.reader() as reader:
+                enq = xapian.Enquire(reader.database)
+        """
+        reader = self.readers.acquire()
+        failed = False
+        try:
+            yield reader
+        except xapian.DatabaseModifiedError:
+            reader.invalidate()
+            raise
+        except xapian.NetworkError:
+            failed = True
+            raise
+        finally:
+            self.readers.release(reader, failed)
 
     def register(self, adapter):
         """
@@ -269,61 +473,147 @@ class SearchSystem(object):
 
         return qp.parse_query(query, qp.FLAG_DEFAULT)
 
+    def get_filters(self, user, components):
+        """Return a dict of the adapters' `get_filter` results for `user`."""
+        return dict((component, self.adapters[component].get_filter(user))
+                    for component in components)
+
+    def get_auth_filter(self, user, components, filters=None):
+        """
+        Return a boolean query that only matches the documents of
+        `components` `user` may see according to the adapters' `get_filter`
+        (or the results of `get_filters`) or `None` if no document is
+        visible at all.
+        """
+        if filters is None:
+            filters = self.get_filters(user, components)
+        queries = []
+        for component in components:
+            qry = xapian.Query('P%s' % component)
+            filter = filters[component]
+            if filter is False:
+                continue
+            elif filter is not None:
+                qry = xapian.Query(xapian.Query.OP_FILTER, qry, filter)
+            queries.append(qry)
+        if not queries:
+            return None
+        return xapian.Query(xapian.Query.OP_OR, queries)
+
+    def get_revision(self):
+        """
+        Return a value that changes with every modification of the search
+        index.  Xapian versions without `Database.get_revision` (and remote
+        databases) only give us the last document id and the document count,
+        that misses replaced documents but all new ones.
+        """
+        with self.reader() as reader:
+            return self._get_revision(reader.database)
+
+    @staticmethod
+    def _get_revision(database):
+        try:
+            return database.get_revision()
+        except (AttributeError, xapian.InvalidOperationError):
+            return '%d-%d' % (database.get_lastdocid(),
+                              database.get_doccount())
+
+    def get_acl_key(self, user, components, filters):
+        """
+        Return a string identifying the documents of `components` `user`
+        may see, users with the same key share cached search results.
+        `filters` are the results of `get_filters`.
+        """
+        parts = []
+        for component in components:
+            parts.append(u'%s:%s' % (component,
+                self.adapters[component].get_filter_key(filters[component])))
+            if component in self.auth_deciders:
+                parts.append(u'%s:%s' % (component,
+                    self.adapters[component].get_decider_key(user)))
+        return u'|'.join(parts)
+
     def query(self, user, query, page=1, per_page=20, date_begin=None,
               date_end=None, collapse=True, component=None, exclude=[],
               sort='date'):
-        """Search for something."""
-        auth = AuthMatchDecider(user, self.auth_deciders)
+        """
+        Search for something.  The results are cached for
+        `SEARCH_RESULT_CACHE_TIMEOUT` seconds per revision of the index
+        that was searched.
+        """
+        components = component and [component.lower()] or \
+                     sorted(self.adapters)
+        filters = self.get_filters(user, components)
+        auth_filter = self.get_auth_filter(user, components, filters)
+        if auth_filter is None:
+            return EmptySearchResult(success=True)
         try:
             qry = self.parse_query(query)
         except xapian.QueryParserError:
             return EmptySearchResult(success=False)
-
-        offset = (page - 1) * per_page
-
-        if component:
-            qry = xapian.Query(xapian.Query.OP_FILTER, qry,
-                               xapian.Query('P%s' % component.lower()))
+        qry, auth = self._build_query(user, qry, date_begin, date_end,
+                                      components, exclude, auth_filter)
+        key = repr((u' '.join(query.split()), page, per_page, date_begin,
+                    date_end, collapse, components, sorted(exclude), sort,
+                    self.get_acl_key(user, components, filters)))
+
+        # retry with exponential backoff if the revision we read was
+        # discarded by the indexer or a replica went away.  The pool
+        # reopens or replaces the connection.
+        for attempt in xrange(settings.SEARCH_QUERY_ATTEMPTS):
+            try:
+                with self.reader() as reader:
+                    def _query():
+                        return self._query(reader.database, qry, auth, page,
+                                           per_page, collapse, sort)
+                    if not settings.SEARCH_RESULT_CACHE_TIMEOUT:
+                        return _query()
+                    # the revision of the index this reader searches
+                    revision = self._get_revision(reader.database)
+                    return get_or_create('search/results/%s' %
+                                         md5(repr((key, revision))).hexdigest(),
+                                         _query,
+                                         settings.SEARCH_RESULT_CACHE_TIMEOUT)
+            except (xapian.DatabaseModifiedError, xapian.NetworkError):
+                time.sleep(0.05 * 2 ** attempt)
+        # the index was not readable
+        return EmptySearchResult(success=False)
+
+    def _build_query(self, user, qry, date_begin, date_end, components,
+                     exclude, auth_filter):
+        """Return the filtered query and the match decider for `qry`."""
+        qry = xapian.Query(xapian.Query.OP_FILTER, qry, auth_filter)
+        # the python deciders are only required for components whose
+        # permissions can't be expressed with filter terms
+        deciders = dict((c, self.auth_deciders[c]) for c in components
+                        if c in self.auth_deciders)
+        auth = deciders and AuthMatchDecider(user, deciders) or None
         if exclude:
             qry = xapian.Query(xapian.Query.OP_AND_NOT, qry,
                                xapian.Query(xapian.Query.OP_OR, exclude))
         if date_begin or date_end:
-            d1 = date_begin and mktime(date_begin.timetuple()) or 0
-            d2 = date_end and mktime(date_end.timetuple()) or \
-                 mktime(datetime.utcnow().timetuple())
-            range = xapian.Query(xapian.Query.OP_VALUE_RANGE, 2,
-                                 xapian.sortable_serialise(d1),
-                                 xapian.sortable_serialise(d2))
-            qry = xapian.Query(xapian.Query.OP_FILTER, qry, range)
-
-
-        connection = self.get_connection()
-
-        _connection_attemts = 0
+            qry = xapian.Query(xapian.Query.OP_FILTER, qry,
+                               get_date_range_query(date_begin, date_end))
+        return qry, auth
+
+    def _query(self, database, qry, auth, page, per_page, collapse, sort):
+        enq = xapian.Enquire(database)
+        if sort == 'magic':
+            enq.set_sort_by_value_then_relevance(2, True)
+        elif sort == 'date':
+            enq.set_sort_by_value(2, True)
+            enq.set_weighting_scheme(xapian.BoolWeight())
+        else:
+            enq.set_sort_by_relevance()
+        if collapse:
+            enq.set_collapse_key(1)
+        enq.set_docid_order(xapian.Enquire.DESCENDING)
+        enq.set_query(qry)
 
-        # Try to reopen the database if the revision has been discarded
-        # or otherwise modified.
-        while _connection_attemts <= 3:
-            try:
-                enq = xapian.Enquire(self.get_connection())
-                if sort == 'magic':
-                    enq.set_sort_by_value_then_relevance(2, True)
-                elif sort == 'date':
-                    enq.set_sort_by_value(2, True)
-                    enq.set_weighting_scheme(xapian.BoolWeight())
-                else:
-                    enq.set_sort_by_relevance()
-                if collapse:
-                    enq.set_collapse_key(1)
-                enq.set_docid_order(xapian.Enquire.DESCENDING)
-                enq.set_query(qry)
-
-                mset = enq.get_mset(offset, per_page, per_page, None, auth)
-                return SearchResult(mset, enq, qry, page, per_page, self.adapters, success=True)
-            except xapian.DatabaseModifiedError:
-                time.sleep(0.1)
-                connection.reopen()
-                _connection_attemts += 1
+        offset = (page - 1) * per_page
+        mset = enq.get_mset(offset, per_page, per_page, None, auth)
+        return SearchResult(mset, enq, qry, page, per_page, self.adapters,
+                            success=True)
 
     def store(self, **data):
         doc = xapian.Document()
@@ -358,10 +648,28 @@ class SearchSystem(object):
             time = xapian.sortable_serialise(mktime(data['date'].timetuple()))
             doc.add_value(2, time)
 
-        # authentification informations (optional)
+        # authentification informations for the python auth decider
+        # (optional)
         if data.get('auth'):
             doc.add_value(3, dumps(data['auth']))
 
+        # state of the indexed object, see `get_fingerprint` (optional)
+        if data.get('fingerprint'):
+            doc.add_value(4, data['fingerprint'])
+
+        # data to render the search result without loading the object from
+        # the database (optional), see `SearchAdapter.get_display_data`
+        if data.get('display'):
+            display = dict(data['display'])
+            if display.get('text'):
+                display['text'] = get_plaintext(display['text'])[
+                    :settings.SEARCH_DISPLAY_TEXT_LENGTH]
+            doc.set_data(dumps(display, -1))
+
+        # boolean terms for the adapter's `get_filter` (optional)
+        for term in data.get('filter') or ():
+            doc.add_term('X%s' % term)
+
         # category (optional)
         if data.get('category'):
             categories = data.get('category')
@@ -400,6 +708,22 @@ class SearchSystem(object):
         if self._connection:
             self._connection.flush()
 
+    def open_shard(self, path):
+        """
+        Write all following changes of this process into a new database at
+        `path` instead of `XAPIAN_DATABASE`.  Used to build an index in
+        several processes, see `scripts/search_rebuild.py`.
+        """
+        self.close()
+        self._connection = xapian.WritableDatabase(path,
+                                                   xapian.DB_CREATE_OR_OVERWRITE)
+
+    def close(self):
+        """Flush and close the writable database."""
+        if self._connection:
+            self._connection.flush()
+            self._connection = None
+
 
 # setup the singleton instance
 search = None
@@ -433,9 +757,65 @@ class AuthMatchDecider(xapian.MatchDecider):
 
 class SearchAdapter(object):
     type_id = None
+    #: a class called with the user and then with the `auth` data of every
+    #: matching document, only use it if `get_filter` is not sufficient.
     auth_decider = None
     support_multi = False
 
+    #: store the result of `extract_data` in the search index so that
+    #: search results are displayed without database queries.  Set it to
+    #: `False` if the data may change without the document being reindexed.
+    store_display = True
+    #: keys of `extract_data` that are not stored in the index, they are
+    #: filled by `update_display` when the results are displayed.
+    volatile_fields = ()
+
+    def get_display_data(self, obj):
+        """
+        Return the display data of `obj` for the ``display`` argument of
+        `SearchSystem.store`.
+        """
+        if not self.store_display:
+            return None
+        data = self.extract_data(obj)
+        for key in self.volatile_fields:
+            data.pop(key, None)
+        return data
+
+    def update_display(self, docs):
+        """
+        Fill the `volatile_fields` of the display data `docs` read from the
+        search index.
+        """
+
+    def get_decider_key(self, user):
+        """
+        Return a string of everything the `auth_decider` decisions for
+        `user` depend on.  Users with the same key share cached search
+        results, so be conservative.
+        """
+        return u'user:%d' % user.id
+
+    def get_filter(self, user):
+        """
+        Return a `xapian.Query` of the filter terms (stored with the
+        ``filter`` argument of `SearchSystem.store`) of the documents
+        `user` may see, `None` if he may see all documents or `False`
+        if he may see none.
+        """
+        return None
+
+    def get_filter_key(self, filter):
+        """
+        Return a string identifying `filter` (a result of `get_filter`) for
+        the keys of cached search results.  Adapters whose filter depends
+        on the current time must return a stable marker instead of the
+        query description.
+        """
+        if filter is None or filter is False:
+            return repr(filter)
+        return filter.get_description()
+
     @classmethod
     def queue(self, docid):
         from inyoka.portal.models import SearchQueue
@@ -447,6 +827,9 @@ class SearchAdapter(object):
     def store_multi(self, docids):
         raise NotImplementedError('store_multi')
 
+    def extract_data(self, obj):
+        raise NotImplementedError('extract_data')
+
     def recv(self, docid):
         raise NotImplementedError('recv')
 
@@ -458,4 +841,4 @@ class SearchAdapter(object):
 
 
 # circ import
-from inyoka.utils.highlight import create_excerpt
+from inyoka.utils.highlight import ExcerptBuilder, get_plaintext
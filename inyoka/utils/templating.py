@@ -19,7 +19,7 @@ from inyoka.utils.dates import format_timedelta, natural_date, \
      format_datetime, format_specific_datetime, format_time
 from inyoka.utils.text import human_number
 from inyoka.utils.flashing import get_flashed_messages
-from inyoka.utils.cache import cache
+from inyoka.utils.cache import request_cache
 from inyoka.utils.local import current_request
 from werkzeug import UserAgent
 
@@ -85,7 +85,7 @@ def populate_context_defaults(context):
         if can['event_edit']:
             keys.append('ikhaya/event_count')
 
-        cached_values = cache.get_dict(*keys)
+        cached_values = request_cache.get_dict(*keys)
         to_update = {}
 
         key = 'portal/pm_count/%s' % user.id
@@ -114,7 +114,7 @@ def populate_context_defaults(context):
                 to_update[key] = events
 
         if to_update:
-            cache.set_many(to_update)
+            request_cache.set_many(to_update)
 
     # we don't need to use cache here because storage does this for us
     global_message = storage['global_message']
@@ -30,12 +30,11 @@ from inyoka.utils.diff3 import merge
 from inyoka.utils.templating import render_template
 from inyoka.utils.notification import notify_about_subscription
 from inyoka.utils.pagination import Pagination
-from inyoka.utils.cache import cache
 from inyoka.utils.text import normalize_pagename, get_pagetitle, join_pagename
 from inyoka.utils.html import escape
 from inyoka.utils.urls import url_encode
 from inyoka.utils.storage import storage
-from inyoka.wiki.models import Page, Revision
+from inyoka.wiki.models import Page, Revision, page_cache
 from inyoka.wiki.forms import PageEditForm, AddAttachmentForm, \
     EditAttachmentForm, ManageDiscussionForm
 from inyoka.wiki.parser import parse, RenderContext
@@ -271,6 +270,7 @@ def do_rename(request, name):
                     for attachment in dublicate:
                         obj = Page.objects.get_by_name(join_pagename(new_name, attachment))
                         models.Model.delete(obj)
+                        Page.objects.update_index(None, old_name=obj.name)
 
                 page.name = new_name
                 page.edit(note=u'Umbenannt von %s' % name, user=request.user,
@@ -295,8 +295,7 @@ def do_rename(request, name):
                     ap.edit(note=u'Umbenannt von %s' % old_attachment_name,
                             remote_addr=request.META.get('REMOTE_ADDR'))
 
-                cache.delete('wiki/page/' + name)
-                cache.delete('wiki/object_list')
+                page_cache.invalidate(name)
                 flash(u'Die Seite wurde erfolgreich umbenannt.', success=True)
                 return HttpResponseRedirect(url_for(page))
             else:
@@ -43,7 +43,7 @@ from inyoka.utils.text import human_number, join_pagename, normalize_pagename, \
     get_pagetitle
 from inyoka.utils.dates import parse_iso8601, format_datetime, format_time, \
     datetime_to_timezone
-from inyoka.utils.cache import cache
+from inyoka.utils.cache import get_or_create
 from inyoka.utils.pagination import Pagination
 from inyoka.utils.parsertools import OrderedDict
 from inyoka.utils.collections import MultiMap, flatten_iterator
@@ -85,6 +85,11 @@ class Macro(object):
     #: set this to True if you want to do the argument parsing yourself.
     has_argument_parser = False
 
+    #: dynamic macros whose output depends on the request, the time, chance
+    #: or other pages than those they emit metadata for have to set this
+    #: to False.  Pages using them are not stored in the fragment cache.
+    cacheable = True
+
     #: if a macro is dynamic it's unable to emit metadata normally. This
     #: slot allows one to store a list of nodes that are sent to the
     #: stream before the macro itself is emited and removed from the
@@ -117,6 +122,8 @@ class Macro(object):
 
     def render(self, context, format):
         """Dispatch to the correct render method."""
+        if not self.cacheable:
+            context.cacheable = False
         rv = self.build_node(context, format)
         if isinstance(rv, basestring):
             return rv
@@ -182,6 +189,7 @@ class RecentChanges(Macro):
     so far, all other formats just get an empty text back.
     """
 
+    cacheable = False
     arguments = (
         ('per_page', int, 50),
         ('days', int, 10),
@@ -220,13 +228,11 @@ class RecentChanges(Macro):
                 rv += '?' + url_encode(parameters)
             return rv
 
-        def pagebuffer_sorter(x, y):
-            pb = pagebuffer
-            return cmp(pb[x][-1].change_date, pb[y][-1].change_date)
+        def _create_data():
+            def pagebuffer_sorter(x, y):
+                pb = pagebuffer
+                return cmp(pb[x][-1].change_date, pb[y][-1].change_date)
 
-        cache_key = 'wiki/recent_changes/%d-%d' % (max_days, page_num)
-        data = cache.get(cache_key)
-        if data is None:
             revisions = Revision.objects.filter(
                 change_date__gt=(datetime.utcnow()-timedelta(days=max_days))
             ).select_related('user', 'page')
@@ -304,11 +310,13 @@ class RecentChanges(Macro):
                         nodes.TableCell(
                             page_notes.children and [page_notes] or \
                             [nodes.Text(u'')], class_='note')])
-            data = {
+            return {
                 'nodes':      table,
                 'pagination': pagination.generate()
             }
-            cache.set(cache_key, data)
+
+        cache_key = 'wiki/recent_changes/%d-%d' % (max_days, page_num)
+        data = get_or_create(cache_key, _create_data, 300)
 
         # if rendering to html we add a pagination, pagination is stupid for
         # docbook and other static representations ;)
@@ -381,6 +389,8 @@ class PageCount(Macro):
     Return the number of existing pages.
     """
 
+    cacheable = False
+
     def build_node(self, context, format):
         return nodes.Text(unicode(Page.objects.get_page_count()))
 
@@ -390,6 +400,7 @@ class PageList(Macro):
     Return a list of pages.
     """
 
+    cacheable = False
     is_block_tag = True
     arguments = (
         ('pattern', unicode, ''),
@@ -421,6 +432,7 @@ class AttachmentList(Macro):
     a given page.
     """
 
+    cacheable = False
     is_block_tag = True
     arguments = (
         ('page', unicode, ''),
@@ -446,6 +458,7 @@ class OrphanedPages(Macro):
     Return a list of orphaned pages.
     """
 
+    cacheable = False
     is_block_tag = True
 
     def build_node(self, context, format):
@@ -463,6 +476,7 @@ class MissingPages(Macro):
     Return a list of missing pages.
     """
 
+    cacheable = False
     is_block_tag = True
 
     def build_node(self, context, format):
@@ -480,6 +494,7 @@ class RedirectPages(Macro):
     Return a list of pages that redirect to somewhere.
     """
 
+    cacheable = False
     is_block_tag = True
 
     def build_node(self, context, format):
@@ -540,6 +555,7 @@ class SimilarPages(Macro):
     page from the render context.
     """
 
+    cacheable = False
     is_block_tag = True
     arguments = (
         ('page', unicode, ''),
@@ -576,6 +592,7 @@ class TagCloud(Macro):
     the URL).
     """
 
+    cacheable = False
     is_block_tag = True
     arguments = (
         ('max', int, 100),
@@ -619,6 +636,7 @@ class TagList(Macro):
     Show a taglist.
     """
 
+    cacheable = False
     is_block_tag = True
     arguments = (
         ('tag', unicode, ''),
@@ -837,6 +855,7 @@ class Date(Macro):
     UTC) and formats it using the `format_datetime` function.
     """
 
+    cacheable = False
     arguments = (
         ('date', unicode, None),
     )
@@ -898,6 +917,7 @@ class RandomPageList(Macro):
     Return random a list of pages.
     """
 
+    cacheable = False
     is_block_tag = True
     arguments = (
         ('pages', int, 10),
@@ -949,6 +969,7 @@ class Span(Macro):
 
 
 class RandomKeyValue(Macro):
+    cacheable = False
     arguments = (
         ('page', unicode, u''),
         ('key', unicode, u''),
@@ -1021,6 +1042,7 @@ class FilterByMetaData(Macro):
     Filter pages by their metadata
     """
 
+    cacheable = False
     is_block_tag = True
 
     arguments = (
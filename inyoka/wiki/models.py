@@ -77,8 +77,8 @@
     :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
     :license: GNU GPL, see LICENSE for more details.
 """
+import zlib
 from hashlib import sha1
-import pickle
 from math import log
 from datetime import datetime
 from django.db import models
@@ -96,7 +96,9 @@ from inyoka.utils.search import search
 from inyoka.utils.highlight import highlight_code
 from inyoka.utils.templating import render_template
 from inyoka.utils.collections import MultiMap
-from inyoka.utils.cache import cache, request_cache
+from inyoka.utils.cache import cache, request_cache, CacheNamespace, \
+     update_cached
+from inyoka.utils.completion import PrefixIndex
 from inyoka.utils.local import current_request
 from inyoka.utils.html import escape
 from inyoka.utils.text import join_pagename, get_pagetitle
@@ -108,6 +110,152 @@ from inyoka.portal.user import User
 # maximum number of bytes for metadata.  everything above is truncated
 MAX_METADATA = 2 << 8
 
+#: the cached revisions of a page, invalidated on every change of the page
+#: or a page it links to
+page_cache = CacheNamespace('wiki/page')
+
+#: the rendered head revisions of the pages for anonymous users
+fragment_cache = CacheNamespace('wiki/fragment')
+
+
+def _load_page_names(shard):
+    return [name for name in Page.objects.get_page_list()
+            if name.lower().startswith(shard)]
+
+#: the names of the existing pages (without attachments)
+page_completion = PrefixIndex('wiki/pages', _load_page_names)
+
+#: the version of the stored render instructions, see `dump_instructions`
+INSTRUCTIONS_VERSION = '1'
+
+#: instructions shorter than that are not compressed
+INSTRUCTIONS_COMPRESS_MIN = 512
+
+#: the cache key of the render instructions of a text by its hash
+INSTRUCTIONS_KEY = 'wiki/instructions/%s'
+
+
+def dump_instructions(instructions):
+    """
+    Convert compiled instructions (see `NodeCompiler.compile`) into the
+    format stored in the database and the cache.  That's the version, a
+    ``'z'`` for zlib compressed instructions or ``'-'`` and the compiled
+    instructions.
+    """
+    if len(instructions) >= INSTRUCTIONS_COMPRESS_MIN:
+        compressed = zlib.compress(instructions)
+        if len(compressed) < len(instructions):
+            return INSTRUCTIONS_VERSION + 'z' + compressed
+    return INSTRUCTIONS_VERSION + '-' + instructions
+
+
+def load_instructions(data):
+    """
+    The reverse of `dump_instructions`.  Returns `None` for instructions of
+    another version.
+    """
+    if not data or data[0] != INSTRUCTIONS_VERSION:
+        return None
+    if data[1] == 'z':
+        return zlib.decompress(data[2:])
+    return data[2:]
+
+
+class BlobField(models.Field):
+    """A binary string stored in a BLOB column."""
+
+    __metaclass__ = models.SubfieldBase
+
+    def db_type(self, connection):
+        engine = connection.settings_dict['ENGINE']
+        if 'mysql' in engine:
+            return 'longblob'
+        elif 'postgresql' in engine:
+            return 'bytea'
+        return 'blob'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is not None and \
+           'postgresql' in connection.settings_dict['ENGINE']:
+            return buffer(value)
+        return value
+
+    def to_python(self, value):
+        # psycopg2 returns buffers, those can't be pickled for the cache
+        if isinstance(value, buffer):
+            return str(value)
+        return value
+
+try:
+    from south.modelsinspector import add_introspection_rules
+    add_introspection_rules([], [r'^inyoka\.wiki\.models\.BlobField'])
+except ImportError:
+    pass
+
+
+#: the cache key of the `PageIndex`
+PAGE_INDEX_KEY = 'wiki/page_index'
+
+#: the last decoded page index of this process as ``(data, index)``
+_decoded_page_index = (None, None)
+
+
+class PageIndex(object):
+    """
+    The names of all pages and attachments together with their flags.  In
+    the cache it is stored in the compact form returned by `dumps`, every
+    process decodes it only once and keeps the existing pages in a
+    frozenset, so that `PageManager.exists` is a set lookup.
+
+    :IVariables:
+
+        objects
+            A list of ``(name, deleted, is_attachment)`` tuples sorted by
+            name.
+
+        pages
+            A frozenset of the names of the existing pages without the
+            attachments.
+    """
+
+    def __init__(self, objects):
+        self.objects = sorted(objects)
+        self.flags = dict((x[0], x[1:]) for x in self.objects)
+        self.pages = frozenset(name for name, deleted, attachment
+                               in self.objects if not deleted and
+                               not attachment)
+
+    @classmethod
+    def loads(cls, data):
+        """Create a page index from the return value of `dumps`."""
+        objects = []
+        text = zlib.decompress(data).decode('utf-8')
+        if text:
+            for line in text.split(u'\n'):
+                flags = int(line[0])
+                objects.append((line[1:], bool(flags & 1), bool(flags & 2)))
+        return cls(objects)
+
+    def dumps(self):
+        """
+        One line per object, the flags encoded in the first character.
+        Page names cannot contain newlines.
+        """
+        return zlib.compress(u'\n'.join(
+            u'%d%s' % (deleted | attachment << 1, name)
+            for name, deleted, attachment in self.objects).encode('utf-8'))
+
+    def changed(self, name, deleted, attachment, old_name=None):
+        """
+        Return a new index where `old_name` is removed and `name` is
+        updated.  If `name` is `None` the object is just removed.
+        """
+        flags = dict(self.flags)
+        flags.pop(old_name, None)
+        if name is not None:
+            flags[name] = (deleted, attachment)
+        return PageIndex((key,) + value for key, value in flags.iteritems())
+
 
 class PageManager(models.Manager):
     """
@@ -120,7 +268,95 @@ class PageManager(models.Manager):
 
     def exists(self, name):
         """Check if a page with that name exists."""
-        return name in self.get_page_list()
+        return name in self.get_index().pages
+
+    def get_index(self, nocache=False):
+        """
+        Return the `PageIndex`.  It's cached and kept up to date by
+        `update_index`, so `nocache` is not required normally.
+        """
+        global _decoded_page_index
+        data = None
+        if not nocache:
+            data = request_cache.get(PAGE_INDEX_KEY)
+        if data is None:
+            objects = Page.objects.values_list('name', 'last_rev__deleted',
+                                               'last_rev__attachment__id')
+            index = PageIndex((name, bool(deleted), attachment is not None)
+                              for name, deleted, attachment in objects)
+            data = index.dumps()
+            # we cache that also if the user wants something uncached
+            # because if we are already fetching it we can cache it.
+            request_cache.set(PAGE_INDEX_KEY, data, 10000)
+        else:
+            last_data, index = _decoded_page_index
+            if last_data is data or last_data == data:
+                return index
+            index = PageIndex.loads(data)
+        _decoded_page_index = (data, index)
+        return index
+
+    def update_index(self, name, deleted=False, attachment=False,
+                     old_name=None):
+        """
+        Update the flags of `name` in the cached `PageIndex`.  `old_name`
+        is removed from the index, pass it for renamed pages.  If `name` is
+        `None` only `old_name` is removed.
+        """
+        def _update(data):
+            index = PageIndex.loads(data)
+            return index.changed(name, deleted, attachment, old_name).dumps()
+        update_cached(PAGE_INDEX_KEY, _update, 10000)
+        request_cache.forget(PAGE_INDEX_KEY)
+
+    def get_dependent_pages(self, changed, created=()):
+        """
+        Return the names of the pages whose rendering depends on one of the
+        pages `changed` and whether the walk was cut short, see
+        `collect_dependents`.  Those are the pages embedding them with a
+        macro (``X-Attach``), transitively.  Pages linking to one of the
+        pages `created` (created, deleted or renamed pages) are included
+        together with their embedders because the style of the link
+        changed.
+        """
+        pages = set(changed) | set(created)
+        created = list(created)
+        for idx in xrange(0, len(created), 500):
+            pages.update(MetaData.objects.filter(key='X-Link',
+                value__in=created[idx:idx + 500]) \
+                .values_list('page__name', flat=True))
+
+        def _get_embedders(names):
+            names = list(names)
+            result = set()
+            for idx in xrange(0, len(names), 500):
+                result.update(MetaData.objects.filter(key='X-Attach',
+                    value__in=names[idx:idx + 500]) \
+                    .values_list('page__name', flat=True))
+            return result
+        return collect_dependents(pages, _get_embedders,
+                                  settings.WIKI_INVALIDATION_LIMIT,
+                                  settings.WIKI_INVALIDATION_DEPTH)
+
+    def invalidate_pages(self, names):
+        """
+        Drop the cached revisions, rendered fragments and render
+        instructions of the pages `names`.  The instructions are compiled
+        again when the page is rendered the next time.
+        """
+        names = list(names)
+        for name in names:
+            page_cache.invalidate(name)
+            fragment_cache.invalidate(name)
+        for idx in xrange(0, len(names), 500):
+            texts = [x for x in Page.objects.filter(
+                        name__in=names[idx:idx + 500]) \
+                    .values_list('last_rev__text__id', 'last_rev__text__hash')
+                     if x[0] is not None]
+            if texts:
+                Text.objects.filter(id__in=[x[0] for x in texts]) \
+                            .update(render_instructions=None)
+                cache.delete_many(*[INSTRUCTIONS_KEY % x[1] for x in texts])
 
     def get_head(self, name, offset=0):
         """
@@ -182,24 +418,9 @@ class PageManager(models.Manager):
     def _get_object_list(self, nocache):
         """
         Get a list of all objects that are pages or attachments.  The return
-        value is a list of ``(name, deleted, is_page)`` tuples
-        where `is_page` is False if that object is an attachment.
+        value is a list of ``(name, deleted, is_attachment)`` tuples.
         """
-        key = 'wiki/object_list'
-        pagelist = None
-        if not nocache:
-            pagelist = request_cache.get(key)
-
-        if pagelist is None:
-            pagelist = Page.objects.all().select_related('last_rev')\
-                .order_by('name').values_list('name', 'last_rev__deleted',
-                    'last_rev__attachment__id')
-            # force a list, can't pickle ValueQueryset that way
-            pagelist = list(pagelist)
-            # we cache that also if the user wants something uncached
-            # because if we are already fetching it we can cache it.
-            request_cache.set(key, pagelist, 10000)
-        return pagelist
+        return self.get_index(nocache).objects
 
     def get_page_list(self, existing_only=True, nocache=False):
         """
@@ -322,7 +543,7 @@ class PageManager(models.Manager):
         the caching backend by passing `nocache` = True.
         """
         rev = None
-        key = 'wiki/page/' + name
+        key = page_cache.key(name)
         if not nocache:
             rev = cache.get(key)
         if rev is None:
@@ -588,7 +809,7 @@ class Text(models.Model):
     objects = TextManager()
     value = models.TextField()
     hash = models.CharField(max_length=40, unique=True, db_index=True)
-    html_render_instructions = models.TextField(null=True)
+    render_instructions = BlobField(null=True)
 
     def parse(self, template_context=None, transformers=None):
         """
@@ -648,27 +869,66 @@ class Text(models.Model):
             context = parser.RenderContext(request, page)
         if template_context is not None or format != 'html':
             return self.parse(template_context).render(context, format)
-        self.touch_html_render_instructions()
-        blob = self.html_render_instructions.decode('base64')
-        instructions = pickle.loads(blob)
-        return parser.render(instructions, context)
+        return parser.render(self.get_html_render_instructions(), context)
+
+    @property
+    def _instructions_key(self):
+        return INSTRUCTIONS_KEY % self.hash
+
+    def get_html_render_instructions(self):
+        """
+        Return the compiled html render instructions.  They are looked up
+        on the object, in the cache and in the database and compiled if
+        they are missing.
+        """
+        data = self.render_instructions
+        if data is None:
+            data = cache.get(self._instructions_key)
+            if data is None and self.id is not None:
+                data = Text.objects.filter(id=self.id) \
+                    .values_list('render_instructions', flat=True)[0]
+                if data is not None:
+                    # a buffer on postgresql
+                    data = str(data)
+                    cache.set(self._instructions_key, data,
+                              settings.WIKI_INSTRUCTIONS_CACHE_TIMEOUT)
+        instructions = load_instructions(data)
+        if instructions is None:
+            data = self.update_html_render_instructions()
+            instructions = load_instructions(data)
+        self.render_instructions = data
+        return instructions
 
     def touch_html_render_instructions(self):
         """update the html render instructions if they are none."""
-        if not self.html_render_instructions:
+        if (self.render_instructions or '')[:1] != INSTRUCTIONS_VERSION:
             self.update_html_render_instructions()
 
     def update_html_render_instructions(self, nosave=False):
         """Puts the render instructions for this text in the database and saves."""
-        self.html_render_instructions = instructions = pickle.dumps(self.parse().
-            compile('html'), protocol=0).encode('base64')
+        self.render_instructions = data = \
+            dump_instructions(self.parse().compile('html'))
         if not nosave:
-            Text.objects.filter(id=self.id).update(**{
-                'html_render_instructions': instructions
-            })
+            Text.objects.filter(id=self.id) \
+                .update(render_instructions=data)
+            cache.set(self._instructions_key, data,
+                      settings.WIKI_INSTRUCTIONS_CACHE_TIMEOUT)
+        return data
+
+    def prepare_for_caching(self):
+        """
+        Called before the text is stored in the page cache.  The render
+        instructions are cached separately by the hash of the text.
+        """
+        if (self.render_instructions or '')[:1] != INSTRUCTIONS_VERSION:
+            self.update_html_render_instructions()
+        else:
+            cache.set(self._instructions_key, self.render_instructions,
+                      settings.WIKI_INSTRUCTIONS_CACHE_TIMEOUT)
+        self.render_instructions = None
 
     def save(self, *args, **kwargs):
-        self.html_render_instructions = None
+        self.render_instructions = None
         models.Model.save(self, *args, **kwargs)
         # self.update_html_render_instructions() <-- We do that lazyly for now
         # page updates work better with that.
@@ -717,6 +977,14 @@ class Page(models.Model):
     #: the create() function binds the revision.
     rev = None
 
+    #: the name the page was loaded with, see `save`.  Pages unpickled from
+    #: the cache that were pickled without it don't know it.
+    _saved_name = None
+
+    def __init__(self, *args, **kwargs):
+        models.Model.__init__(self, *args, **kwargs)
+        self._saved_name = self.id and self.name or None
+
     @property
     def title(self):
         """
@@ -847,9 +1115,42 @@ class Page(models.Model):
         # searchindex
         search.queue('w', self.id)
 
+    def _update_index(self, old_state):
+        """
+        Update the `PageIndex` and the autocompletion if the page was
+        created, deleted, restored or renamed.  `old_state` are the flags
+        of the page before it was saved.  Return the names of the pages
+        that were created or disappeared.
+        """
+        if self.last_rev_id is None:
+            # `PageManager.create` saves the page before the revision
+            return []
+        if self.rev is not None and self.rev.id == self.last_rev_id:
+            rev = self.rev
+        else:
+            rev = self.last_rev
+        old_name, self._saved_name = self._saved_name, self.name
+        state = (rev.deleted, rev.attachment_id is not None)
+        if old_name == self.name and old_state == state:
+            return []
+        Page.objects.update_index(self.name, state[0], state[1], old_name)
+        existed = old_state is not None and not old_state[0]
+        exists = not state[0]
+        renamed = old_name != self.name
+        if existed and (renamed or not exists) and not old_state[1]:
+            page_completion.remove(old_name)
+        if exists and (renamed or not existed) and not state[1]:
+            page_completion.add(self.name)
+        created = []
+        if existed and (renamed or not exists):
+            created.append(old_name)
+        if exists != existed or renamed:
+            created.append(self.name)
+        return created
+
     def prune(self):
         """Clear the page cache."""
-        cache.delete('wiki/page/' + self.name)
+        page_cache.invalidate(self.name)
         if self.rev:
             self.rev.text.update_html_render_instructions()
         deferred.clear(self)
@@ -860,63 +1161,19 @@ class Page(models.Model):
         bound to the page object.  If you don't want to save the
         revision set it to `None` before calling `save()`.
         """
-        if self.id is None:
-            cache.delete('wiki/object_list')
+        old_state = self._saved_name and \
+            Page.objects.get_index().flags.get(self._saved_name)
         models.Model.save(self)
+        created = self._update_index(old_state)
+
+        page_cache.invalidate(self.name)
+        fragment_cache.invalidate(self.name)
+        # the pages depending on this page are invalidated in the background
+        # by `scripts/wiki_invalidate`
+        if self.last_rev_id is not None:
+            for name in set([self.name] + created):
+                InvalidationQueue.objects.append(name, name in created)
 
-        related_pages = set()
-        linked = MetaData.objects.values_list('value', 'page__id') \
-                                 .filter(key__in=('X-Link', 'X-Attach'),
-                                         value=self.name)
-        for value, pid in linked.all():
-            cache.delete('wiki/page/%s' % value)
-            related_pages.add(pid)
-        cache.delete('wiki/page/%s' % self.name)
-
-        # This kills kinda everything on the wrong article, rethink that!
-        # Right now it seems that this is required to update reference-links and such
-        # things.  I don't know how that system works right now, but I try to
-        # investigate some time into it -- entequak (11:40 12.10.10)
-        # I (--entequak) enabled partly the cache erasion of related pages.  Right now I
-        # don't see any reason why we need to erase the render instructions too. (07:55 27.11.)
-#        try:
-#            cur.execute('''
-#                select distinct p.name, p.id
-#                  from wiki_page p, wiki_metadata m
-#                 where (m.key = 'X-Link' or m.key = 'X-Attach')
-#                   and m.value = %s and m.page_id = p.id
-#            ''', [self.name])
-#            for row in cur.fetchall():
-#                cache.delete('wiki/page/' + row[0])
-#                related_pages.add(row[1])
-#            cache.delete('wiki/page/' + self.name)
-#
-#            if related_pages:
-#                # too lazy to do proper escaping here but that is not a
-#                # problem because the only variable part is a list of
-#                # integers which are guaranteed to be integers
-#                # XXX: two queries because of a possible mysql bug.
-#                # moving the first select into a subselect in the
-#                # where of the update() disables optimizing in mysql
-#                cur.execute('''
-#                    select distinct text_id from wiki_revision
-#                      join (
-#                            select page_id, max(id) as id
-#                            from wiki_revision as t
-#                            where page_id in (%s)
-#                            group by page_id, t.id
-#                        ) as d1 using (id);
-#                ''' % ', '.join(map(str, related_pages)))
-#                all = [str(x[0]) for x in cur.fetchall()]
-#                print len(all)
-#                cur.execute('''
-#                    update wiki_text
-#                       set html_render_instructions = null
-#                     where id in (%s)
-#                ''' % ', '.join(all))
-#        finally:
-#            cur.close()
-#
         if self.rev is not None:
             self.rev.save()
         if update_meta:
@@ -1036,9 +1293,6 @@ class Page(models.Model):
         self.rev.save()
         self.last_rev = self.rev
         self.save(update_meta=update_meta)
-        if (deleted and rev and not rev.deleted) or \
-           (not deleted and rev and rev.deleted):
-            cache.delete('wiki/object_list')
 
     def get_absolute_url(self, action='show', **kwargs):
         if action in ('edit', 'subscribe', 'unsubscribe'):
@@ -1200,9 +1454,24 @@ class Revision(models.Model):
     def rendered_text(self):
         """
         The rendered version of the `text` attribute.  This is equivalent
-        to calling ``text.render(page=page)``.
+        to calling ``text.render(page=page)``.  For anonymous users the
+        head revision is stored in the fragment cache.
         """
-        return self.text.render(page=self.page.name)
+        try:
+            request = current_request._get_current_object()
+        except RuntimeError:
+            request = None
+        if request is None or not request.user.is_anonymous or \
+           self.id != self.page.last_rev_id:
+            return self.text.render(request, self.page.name)
+        key = fragment_cache.key(self.page.name, self.id)
+        html = cache.get(key)
+        if html is None:
+            context = parser.RenderContext(request, self.page.name)
+            html = self.text.render(context=context)
+            if context.cacheable:
+                cache.set(key, html, settings.WIKI_FRAGMENT_CACHE_TIMEOUT)
+        return html
 
     def get_absolute_url(self, action=None):
         return href('wiki', self.page.name, rev=self.id)
@@ -1229,11 +1498,11 @@ class Revision(models.Model):
     def save(self, force_insert=False, force_update=False):
         """Save the revision and invalidate the cache."""
         models.Model.save(self, force_insert, force_update)
-        cache.delete('wiki/page/' + self.page.name)
+        page_cache.invalidate(self.page.name)
 
     def prepare_for_caching(self):
         """Called before the page object is stored in the cache."""
-        self.text.touch_html_render_instructions()
+        self.text.prepare_for_caching()
 
     def __unicode__(self):
         return 'Revision %d (%s)' % (
@@ -1267,6 +1536,33 @@ class MetaData(models.Model):
     value = models.CharField(max_length=512, db_index=True)
 
 
+class InvalidationQueueManager(models.Manager):
+
+    def append(self, page_name, existence_changed=False):
+        """Queue the invalidation of the pages depending on `page_name`."""
+        item = self.model(page_name=page_name,
+                          existence_changed=existence_changed)
+        item.save()
+        return item
+
+
+class InvalidationQueue(models.Model):
+    """
+    Changed pages whose dependent pages are invalidated by
+    `scripts/wiki_invalidate` (see `PageManager.get_dependent_pages`).
+    `existence_changed` is set for pages that were created, deleted or
+    renamed.
+    """
+    objects = InvalidationQueueManager()
+    page_name = models.CharField(max_length=200)
+    existence_changed = models.BooleanField(default=False)
+    created = models.DateTimeField(default=datetime.utcnow)
+
+    class Meta:
+        ordering = ['id']
+
+
 # imported here because of circular references
 from inyoka.wiki import parser, templates
 from inyoka.wiki.parser import nodes
+from inyoka.wiki.utils import collect_dependents
@@ -134,6 +134,7 @@
 import re
 import unicodedata
 from functools import partial
+from types import GeneratorType
 
 from inyoka.utils.css import filter_style
 from inyoka.utils.urls import href, url_for
@@ -148,8 +149,16 @@ from inyoka.wiki.parser import nodes
 __all__ = ['parse', 'render', 'stream', 'escape']
 
 
-# the maximum depth of stack-protected nodes
-MAXIMUM_DEPTH = 200
+#: the maximum nesting depth of nodes.  The parser itself has no limit but
+#: the transformers, the renderer, `Node.text` and pickle walk the tree
+#: recursively (`text` fails first, at about 160 levels with an empty
+#: stack), deeper nested nodes are converted into text.
+MAXIMUM_DEPTH = 100
+
+#: yielded by the parse functions to get the next node parsed, see
+#: `Parser.parse_node`
+NODE = object()
+
 
 def _ikhaya_id(x):
     from inyoka.ikhaya.models import Article
@@ -185,17 +194,16 @@ _table_align_re = re.compile(r'''(?x)
 
 def parse(markup, wiki_force_existing=False, catch_stack_errors=True,
           transformers=None):
-    """Parse markup into a node."""
-    try:
-        return Parser(markup, transformers, wiki_force_existing).parse()
-    except StackExhaused:
-        if not catch_stack_errors:
-            raise
-        return nodes.Paragraph([
-            nodes.Strong([nodes.Text('Interner Parserfehler: ')]),
-            nodes.Text(u'Der Parser konnte den Text nicht verarbeiten, weil '
-                       u'zu tief verschachtelte Elemente gefunden wurden.')
-        ])
+    """
+    Parse markup into a node.  Nodes nested deeper than `MAXIMUM_DEPTH`
+    are converted into text, if `catch_stack_errors` is false a
+    `StackExhaused` is raised instead.
+    """
+    parser = Parser(markup, transformers, wiki_force_existing)
+    result = parser.parse()
+    if parser.depth_exceeded and not catch_stack_errors:
+        raise StackExhaused()
+    return result
 
 
 def render(instructions, context=None, format=None):
@@ -341,8 +349,8 @@ def _parse_align_args(args, kwargs):
 
 class StackExhaused(ValueError):
     """
-    Raised if the parser recognizes nested structures that would hit the
-    stack limit.
+    Raised by `parse` if the markup has nodes nested deeper than
+    `MAXIMUM_DEPTH` and the stack errors are not catched.
     """
 
 
@@ -378,7 +386,6 @@ class Parser(object):
         """
         self.string = string
         self.lexer = Lexer()
-        self.stack_depth = 0
         if transformers is None:
             transformers = DEFAULT_TRANSFORMERS[:]
         self.transformers = transformers
@@ -430,6 +437,7 @@ class Parser(object):
 
         #: runtime information
         self.is_dirty = False
+        self.depth_exceeded = False
         self.deferred_macros = {
             'final':    [],
             'initial':  [],
@@ -444,15 +452,35 @@ class Parser(object):
         beavior is undefined and may change.  It's your reposibility to make
         sure the parser never calls `parse_node` on not existing nodes when
         extending the lexer / parser.
-        """
-        # stack exhausted, return a node that represents that
-        if self.stack_depth >= MAXIMUM_DEPTH:
-            raise StackExhaused()
-        self.stack_depth += 1
-        try:
-            return self._handlers[stream.current.type](stream)
-        finally:
-            self.stack_depth -= 1
+
+        The parse functions of nodes with children are generators.  They
+        yield `NODE` to get the next child node parsed, a generator of
+        another parse function to get its node, and finally their own node.
+        This function runs them on an explicit stack so that the nesting
+        depth is not limited by the Python recursion limit.  Nodes nested
+        deeper than `MAXIMUM_DEPTH` are replaced by their text.
+        """
+        handlers = self._handlers
+        stack = []
+        node = handlers[stream.current.type](stream)
+        while 1:
+            if node.__class__ is GeneratorType:
+                stack.append(node)
+                request = node.next()
+            elif stack:
+                request = stack[-1].send(node)
+            else:
+                return node
+            if request is NODE:
+                node = handlers[stream.current.type](stream)
+            elif request.__class__ is GeneratorType:
+                node = request
+            else:
+                if len(stack) > MAXIMUM_DEPTH:
+                    self.depth_exceeded = True
+                    request = nodes.Text(request.text)
+                stack.pop()
+                node = request
 
     def parse_text(self, stream):
         """Expects a ``'text'`` token and returns a `nodes.Text`."""
@@ -472,9 +500,9 @@ class Parser(object):
         stream.expect('%s_begin' % name)
         children = []
         while stream.current.type != '%s_end' % name:
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('%s_end' % name)
-        return nodes.Highlighted(children)
+        yield nodes.Highlighted(children)
 
     def parse_conflict_left(self, stream):
         """The begin conflict marker."""
@@ -519,9 +547,9 @@ class Parser(object):
         token = stream.expect('headline_begin')
         children = []
         while stream.current.type != 'headline_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('headline_end')
-        return nodes.Headline(len(token.value.strip()), children=children)
+        yield nodes.Headline(len(token.value.strip()), children=children)
 
     def parse_strong(self, stream):
         """
@@ -532,9 +560,9 @@ class Parser(object):
         stream.expect('strong_begin')
         children = []
         while stream.current.type != 'strong_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('strong_end')
-        return nodes.Strong(children)
+        yield nodes.Strong(children)
 
     def parse_emphasized(self, stream):
         """
@@ -545,9 +573,9 @@ class Parser(object):
         stream.expect('emphasized_begin')
         children = []
         while stream.current.type != 'emphasized_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('emphasized_end')
-        return nodes.Emphasized(children)
+        yield nodes.Emphasized(children)
 
     def parse_escaped_code(self, stream):
         """
@@ -589,9 +617,9 @@ class Parser(object):
         stream.expect('underline_begin')
         children = []
         while stream.current.type != 'underline_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('underline_end')
-        return nodes.Underline(children)
+        yield nodes.Underline(children)
 
     def parse_stroke(self, stream):
         """
@@ -602,9 +630,9 @@ class Parser(object):
         stream.expect('stroke_begin')
         children = []
         while stream.current.type != 'stroke_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('stroke_end')
-        return nodes.Stroke(children)
+        yield nodes.Stroke(children)
 
     def parse_small(self, stream):
         """
@@ -615,9 +643,9 @@ class Parser(object):
         stream.expect('small_begin')
         children = []
         while stream.current.type != 'small_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('small_end')
-        return nodes.Small(children)
+        yield nodes.Small(children)
 
     def parse_big(self, stream):
         """
@@ -628,9 +656,9 @@ class Parser(object):
         stream.expect('big_begin')
         children = []
         while stream.current.type != 'big_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('big_end')
-        return nodes.Big(children)
+        yield nodes.Big(children)
 
     def parse_sub(self, stream):
         """
@@ -641,9 +669,9 @@ class Parser(object):
         stream.expect('sub_begin')
         children = []
         while stream.current.type != 'sub_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('sub_end')
-        return nodes.Sub(children)
+        yield nodes.Sub(children)
 
     def parse_sup(self, stream):
         """
@@ -654,9 +682,9 @@ class Parser(object):
         stream.expect('sup_begin')
         children = []
         while stream.current.type != 'sup_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('sup_end')
-        return nodes.Sup(children)
+        yield nodes.Sup(children)
 
     def parse_footnote(self, stream):
         """
@@ -670,9 +698,9 @@ class Parser(object):
         stream.expect('footnote_begin')
         children = []
         while stream.current.type != 'footnote_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('footnote_end')
-        return nodes.Footnote(children)
+        yield nodes.Footnote(children)
 
     def parse_color(self, stream):
         """
@@ -690,9 +718,9 @@ class Parser(object):
                 color = '#000000'
         children = []
         while stream.current.type != 'color_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('color_end')
-        return nodes.Color(color, children)
+        yield nodes.Color(color, children)
 
     def parse_size(self, stream):
         """
@@ -708,9 +736,9 @@ class Parser(object):
             size = 100
         children = []
         while stream.current.type != 'size_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('size_end')
-        return nodes.Size(size, children)
+        yield nodes.Size(size, children)
 
     def parse_font(self, stream):
         """
@@ -722,9 +750,9 @@ class Parser(object):
         face = stream.expect('font_face').value.strip()
         children = []
         while stream.current.type != 'font_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('font_end')
-        return nodes.Font([face], children)
+        yield nodes.Font([face], children)
 
     def parse_mod(self, stream):
         """
@@ -736,9 +764,9 @@ class Parser(object):
         username = stream.expect('username').value.strip()
         children = []
         while stream.current.type != 'mod_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('mod_end')
-        return nodes.Moderated(username, children)
+        yield nodes.Moderated(username, children)
 
     def parse_edit(self, stream):
         """
@@ -750,9 +778,9 @@ class Parser(object):
         username = stream.expect('username').value.strip()
         children = []
         while stream.current.type != 'edit_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('edit_end')
-        return nodes.Edited(username, children)
+        yield nodes.Edited(username, children)
 
     def parse_quote(self, stream):
         """
@@ -765,9 +793,9 @@ class Parser(object):
         stream.expect('quote_begin')
         children = []
         while stream.current.type != 'quote_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('quote_end')
-        return nodes.Quote(children)
+        yield nodes.Quote(children)
 
     def parse_list(self, stream):
         """
@@ -796,7 +824,7 @@ class Parser(object):
                 new_indentation == indentation) or new_indentation < indentation:
                 break
             elif new_indentation > indentation:
-                nested_list = self.parse_list(stream)
+                nested_list = yield self.parse_list(stream)
                 if result.children:
                     result.children[-1].children.append(nested_list)
                 else:
@@ -805,11 +833,11 @@ class Parser(object):
             stream.next()
             children = []
             while stream.current.type != 'list_item_end':
-                children.append(self.parse_node(stream))
+                children.append((yield NODE))
             if children:
                 result.children.append(nodes.ListItem(children))
             stream.next()
-        return result
+        yield result
 
     def parse_definition(self, stream):
         """
@@ -824,7 +852,7 @@ class Parser(object):
             term = stream.expect('definition_term').value
             children = []
             while stream.current.type != 'definition_end':
-                children.append(self.parse_node(stream))
+                children.append((yield NODE))
             result.children.append(nodes.DefinitionTerm(term, children))
             if stream.current.type == 'definition_end':
                 stream.next()
@@ -832,7 +860,7 @@ class Parser(object):
                     stream.next()
                 else:
                     break
-        return result
+        yield result
 
     def parse_wiki_link(self, stream):
         """
@@ -849,17 +877,18 @@ class Parser(object):
             anchor = None
         children = []
         while stream.current.type != 'wiki_link_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('wiki_link_end')
         if not wiki:
-            return nodes.InternalLink(page, children, anchor=anchor,
-                                      force_existing=self.wiki_force_existing)
+            yield nodes.InternalLink(page, children, anchor=anchor,
+                                     force_existing=self.wiki_force_existing)
         elif wiki in STANDARD_WIKI_MAP:
             if not children:
                 children = [nodes.Text(page)]
-            return nodes.Link(STANDARD_WIKI_MAP[wiki](page), children,
-                              class_=wiki)
-        return nodes.InterWikiLink(wiki, page, children, anchor=anchor)
+            yield nodes.Link(STANDARD_WIKI_MAP[wiki](page), children,
+                             class_=wiki)
+        else:
+            yield nodes.InterWikiLink(wiki, page, children, anchor=anchor)
 
     def parse_external_link(self, stream):
         """
@@ -871,9 +900,9 @@ class Parser(object):
         url = stream.expect('link_target').value
         children = []
         while stream.current.type != 'external_link_end':
-            children.append(self.parse_node(stream))
+            children.append((yield NODE))
         stream.expect('external_link_end')
-        return nodes.Link(url, children)
+        yield nodes.Link(url, children)
 
     def parse_free_link(self, stream):
         """
@@ -956,7 +985,7 @@ class Parser(object):
         children = []
         text_node = None
         while stream.current.type != 'pre_end':
-            node = self.parse_node(stream)
+            node = yield NODE
             if node.is_text_node:
                 if text_node is None and node.text[:1] == '\n':
                     node.text = node.text[1:]
@@ -967,15 +996,16 @@ class Parser(object):
         stream.expect('pre_end')
 
         if name is None:
-            return nodes.Preformatted(children)
-
-        data = u''.join(x.text for x in children)
-        parser = get_parser(name, args, kwargs, data)
-        if parser is None:
-            return nodes.Preformatted([nodes.Text(data)])
-        elif parser.is_static:
-            return parser.build_node()
-        return nodes.Parser(parser)
+            yield nodes.Preformatted(children)
+        else:
+            data = u''.join(x.text for x in children)
+            parser = get_parser(name, args, kwargs, data)
+            if parser is None:
+                yield nodes.Preformatted([nodes.Text(data)])
+            elif parser.is_static:
+                yield parser.build_node()
+            else:
+                yield nodes.Parser(parser)
 
     def parse_table(self, stream):
         """
@@ -1037,8 +1067,8 @@ class Parser(object):
                 if stream.current.type != 'table_row_begin':
                     break
             else:
-                cell.children.append(self.parse_node(stream))
-        return table
+                cell.children.append((yield NODE))
+        yield table
 
     def parse_box(self, stream):
         """
@@ -1069,9 +1099,9 @@ class Parser(object):
             box.class_ = attrs.get('class')
 
         while stream.current.type != 'box_end':
-            box.children.append(self.parse_node(stream))
+            box.children.append((yield NODE))
         stream.expect('box_end')
-        return box
+        yield box
 
     def parse_arguments(self, stream, end_token):
         """
@@ -1116,8 +1146,30 @@ class Parser(object):
         Helper function for macro expansion.  This is called at the end of
         the parsing process to insert deferred macros.
         """
-        for placeholder, macro in self.deferred_macros[stage]:
-            placeholder.become(macro.build_node(tree))
+        deferred = self.deferred_macros[stage]
+        if not deferred:
+            return
+        # the transformers move and share nodes, so look up the containers
+        # of the placeholders first.  placeholders nested too deep were
+        # converted into text and are missing.
+        containers = {}
+        todo = [tree]
+        while todo:
+            container = todo.pop()
+            for child in container.children:
+                if child.__class__ is nodes.DeferredNode:
+                    containers.setdefault(id(child), []).append(container)
+                elif child.is_container:
+                    todo.append(child)
+        for placeholder, macro in deferred:
+            if id(placeholder) not in containers:
+                continue
+            node = macro.build_node(tree)
+            for container in containers[id(placeholder)]:
+                children = container.children
+                for idx, child in enumerate(children):
+                    if child is placeholder:
+                        children[idx] = node
 
     def parse(self):
         """
@@ -17,7 +17,7 @@ from inyoka.utils.parsertools import TokenStream
 
 def escape(text):
     """Escape a text with wiki formatting."""
-    return Lexer().escape(text)
+    return _lexer.escape(text)
 
 
 def bygroups(*args):
@@ -73,11 +73,14 @@ class rule(object):
     """
     This represents a parsing rule.
     """
-    __slots__ = ('match', 'token', 'enter', 'silententer', 'switch', 'leave')
+    __slots__ = ('match', 'search', 'token', 'enter', 'silententer',
+                 'switch', 'leave')
 
     def __init__(self, regexp, token=None, enter=None, silententer=None,
                  switch=None, leave=0):
-        self.match = re.compile(regexp, re.U).match
+        regexp = re.compile(regexp, re.U)
+        self.match = regexp.match
+        self.search = regexp.search
         self.token = token
         self.enter = enter
         self.silententer = silententer
@@ -431,6 +434,51 @@ class Lexer(object):
 
         return TokenStream.from_tuple_iter(tokenize_blocks())
 
+    @classmethod
+    def get_state_rules(cls):
+        """
+        Return a dict that maps the states to the list of their rules with
+        the includes expanded.  It's built once per lexer class.
+        """
+        state_rules = cls.__dict__.get('_state_rules')
+        if state_rules is None:
+            def iter_rules(x):
+                for rule in cls.rules[x]:
+                    if rule.__class__ is include:
+                        for item in iter_rules(rule):
+                            yield item
+                    else:
+                        yield rule
+            state_rules = dict((state, list(iter_rules(state)))
+                               for state in cls.rules)
+            cls._state_rules = state_rules
+        return state_rules
+
+    @staticmethod
+    def _add_char(add_text, string, pos, char, escaped):
+        """
+        Add a char no rule matched to the text buffer.  Returns the new
+        escaped flag.
+        """
+        if char == '\\':
+            if escaped:
+                # this is a fix for the problem that two backslashes
+                # inside are displayed as one, even in code blocks
+                if string[pos - 1] == '\\':
+                    char = '\\\\'
+                else:
+                    char = ''
+                escaped = False
+            else:
+                escaped = True
+                char = ''
+        else:
+            if escaped:
+                char = '\\' + char
+            escaped = False
+        add_text(char)
+        return escaped
+
     def tokenize_block(self, string, _escape_hint=None):
         """
         This tokenizes a block.  It's used by the normal tokenize function to
@@ -441,24 +489,48 @@ class Lexer(object):
         pos = 0
         end = len(string)
         stack = [(None, 'everything')]
-        rule_cache = {}
+        state_rules = self.get_state_rules()
+        # the position of the next match of every rule, looked up with
+        # `search`.  the string does not change, so a position stays valid
+        # until the lexer moved past it.
+        next_match = {}
         text_buffer = []
         add_text = text_buffer.append
         flatten = u''.join
 
-        def iter_rules(x):
-            for rule in self.rules[x]:
-                if rule.__class__ is include:
-                    for item in iter_rules(rule):
-                        yield item
-                else:
-                    yield rule
-
         while pos < end:
             state = stack[-1][1]
-            if state not in rule_cache:
-                rule_cache[state] = list(iter_rules(state))
-            for rule in rule_cache[state]:
+            rules = state_rules[state]
+
+            # no rule of this state matches before `nearest`, everything
+            # up to there is text and can be added in one go.
+            nearest = end
+            for rule in rules:
+                next_pos = next_match.get(rule)
+                if next_pos is None or next_pos < pos:
+                    m = rule.search(string, pos)
+                    next_pos = m is None and end or m.start()
+                    next_match[rule] = next_pos
+                if next_pos < nearest:
+                    nearest = next_pos
+                    if nearest == pos:
+                        break
+            if nearest > pos:
+                text = string[pos:nearest]
+                if '\\' in text:
+                    for char in text:
+                        escaped = self._add_char(add_text, string, pos,
+                                                 char, escaped)
+                        pos += 1
+                else:
+                    if escaped:
+                        add_text('\\')
+                        escaped = False
+                    add_text(text)
+                    pos = nearest
+                continue
+
+            for rule in rules:
                 m = rule.match(string, pos)
                 if m is not None:
                     # if the token is escaped we push the lexed
@@ -508,24 +580,8 @@ class Lexer(object):
                             stack.append((announce, rule.switch))
                     break
             else:
-                char = string[pos]
-                if char == '\\':
-                    if escaped:
-                        # this is a fix for the problem that two backslashes
-                        # inside are displayed as one, even in code blocks
-                        if string[pos - 1] == '\\':
-                            char = '\\\\'
-                        else:
-                            char = ''
-                        escaped = False
-                    else:
-                        escaped = True
-                        char = ''
-                else:
-                    if escaped:
-                        char = '\\' + char
-                    escaped = False
-                add_text(char)
+                escaped = self._add_char(add_text, string, pos, string[pos],
+                                         escaped)
                 pos += 1
 
         # if there is a bogus escaped push a backslash
@@ -555,3 +611,6 @@ class Lexer(object):
             text = text[:pos] + '\\' + text[pos:]
             offset += 1
         return text
+
+
+_lexer = Lexer()
@@ -25,6 +25,8 @@ class NodeCompiler(object):
     and obtain the `compile` method because of that.
     """
 
+    __slots__ = ()
+
     def compile(self, format):
         """Return a compiled instruction set."""
         assert not '\0' in format
@@ -60,6 +62,8 @@ class NodeRenderer(object):
     without having to instanciate a `Renderer`.
     """
 
+    __slots__ = ()
+
     def stream(self, context, format):
         """Constructs a renderer for this node and streams it."""
         return Renderer(self).stream(context, format)
@@ -83,6 +87,8 @@ class NodeQueryInterface(object):
     query interface.
     """
 
+    __slots__ = ()
+
     @property
     def query(self):
         return Query((self,))
@@ -150,6 +156,9 @@ class RenderContext(object):
     shared among subrenderings.  For example if you include a page you have
     to pass the render context object around.  The reason for this is that
     only that allows you to track circular page inclusions.
+
+    After the rendering `cacheable` is false if a macro rendered something
+    that must not be cached (see `Macro.cacheable`).
     """
 
     def __init__(self, request=None, wiki_page=None, simplified=False,
@@ -158,6 +167,7 @@ class RenderContext(object):
         self.wiki_page = wiki_page
         self.simplified = simplified
         self.included_pages = set()
+        self.cacheable = True
 
 
 class Renderer(object):
@@ -10,9 +10,9 @@
     register it in the dispatching functions.  Also in the other modules
     and especially in macro and parser baseclasses.
 
-    All nodes except of the base nodes have to have a `__dict__`.  This is
-    enforced because dict-less objects cannot be replaced in place which is
-    a required by the `DeferredNode`.
+    All nodes declare their attributes in `__slots__` because big pages
+    create a lot of them.  Subclasses have to do the same, `BaseNode`
+    pickles and compares the nodes by their slots.
 
 
     :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
@@ -59,7 +59,7 @@ def from_html(obj):
         if 'colspan' in obj.attributes:
             element.colspan = obj.attributes['colspan']
         if 'rowspan' in obj.attributes:
-            element.colspan = obj.attributes['rowspan']
+            element.rowspan = obj.attributes['rowspan']
 
     def walk(obj):
         should_add_base = True
@@ -116,9 +116,9 @@ def from_html(obj):
             element = Table()
         elif obj.tag == 'tr':
             element = TableRow()
-            add_spans(element, obj)
         elif obj.tag == 'td':
             element = TableCell()
+            add_spans(element, obj)
         elif obj.tag == 'th':
             element = TableHeader()
             add_spans(element, obj)
@@ -184,9 +184,21 @@ class BaseNode(object):
     #: whether the node is just for creating line breaks
     is_linebreak_node = False
 
+    def __getstate__(self):
+        state = {}
+        for cls in self.__class__.__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if name not in state and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
     def __eq__(self, other):
         return self.__class__ is other.__class__ and \
-               self.__dict__ == other.__dict__
+               self.__getstate__() == other.__getstate__()
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -196,10 +208,12 @@ class BaseNode(object):
 
 class DeferredNode(BaseNode):
     """
-    Special node with a `become()` function that can be used to replace
-    this node in place with another one.
+    Placeholder for a deferred macro.  The parser replaces it with the node
+    of the macro when the macro is expanded.
     """
 
+    __slots__ = ('node',)
+
     def __init__(self, node):
         self.node = node
 
@@ -207,10 +221,6 @@ class DeferredNode(BaseNode):
     def is_block_tag(self):
         return self.node.is_block_tag
 
-    def become(self, other):
-        self.__class__ = other.__class__
-        self.__dict__ = other.__dict__
-
 
 class Node(BaseNode, NodeRenderer, NodeCompiler, NodeQueryInterface):
     """
@@ -218,6 +228,8 @@ class Node(BaseNode, NodeRenderer, NodeCompiler, NodeQueryInterface):
     and `NodeCompiler` and sets some basic attributes every node must have.
     """
 
+    __slots__ = ()
+
     def generate_markup(self, w):
         """
         Generate markup from the node again.  The ``w`` argument is an
@@ -259,6 +271,8 @@ class Text(Node):
     Represents text.
     """
 
+    __slots__ = ('text',)
+
     is_text_node = True
     allowed_in_signatures = True
 
@@ -280,6 +294,8 @@ class HTML(Node):
     Raw HTML snippet.
     """
 
+    __slots__ = ('html', 'is_block_tag')
+
     allowed_in_signatures = True
 
     def __init__(self, html=u'', block_level=True):
@@ -302,6 +318,8 @@ class HTMLOnly(HTML):
     Like `HTML` but with a fallback for non HTML formats.
     """
 
+    __slots__ = ('fallback',)
+
     def __init__(self, html, fallback, block_level=True):
         HTML.__init__(self, html, block_level)
         self.fallback = fallback
@@ -316,6 +334,8 @@ class MetaData(Node):
     Holds invisible metadata.  Never rendered.
     """
 
+    __slots__ = ('key', 'values')
+
     is_block_tag = False
     allowed_in_signatures = True
 
@@ -329,6 +349,8 @@ class Newline(Node):
     A newline in a paragraph.  Never use multiple of those.
     """
 
+    __slots__ = ()
+
     allowed_in_signatures = True
     is_linebreak_node = True
 
@@ -348,6 +370,8 @@ class Ruler(Node):
     Newline with line.
     """
 
+    __slots__ = ()
+
     is_block_tag = True
 
     def generate_markup(self, w):
@@ -365,6 +389,8 @@ class ConflictMarker(Node):
     be one of `left`, `middle`, or `right`.
     """
 
+    __slots__ = ('type',)
+
     is_block_tag = True
 
     def __init__(self, type):
@@ -390,13 +416,15 @@ class Macro(Node):
     Reference to a runtime macro.
     """
 
+    __slots__ = ('macro', 'is_container', 'children')
+
     def __init__(self, macro):
         self.macro = macro
 
         # if there is metadata in a dynamic macro we copy it
         # over to this node and mark the node as container node.
-        if macro.metadata is not None:
-            self.is_container = True
+        self.is_container = macro.metadata is not None
+        if self.is_container:
             self.children = macro.metadata
             macro.metadata = None
 
@@ -419,6 +447,8 @@ class Parser(object):
     Reference to a runtime parser.
     """
 
+    __slots__ = ('parser',)
+
     def __init__(self, parser):
         self.parser = parser
 
@@ -449,6 +479,8 @@ class Image(Node):
     formatter could bundle images and refer to them.
     """
 
+    __slots__ = ('href', 'alt', 'id', 'class_', 'style')
+
     def __init__(self, href, alt, id=None, class_=None, style=None):
         self.href = href
         self.alt = alt
@@ -473,6 +505,9 @@ class Container(Node):
     """
     A basic node with children.
     """
+
+    __slots__ = ('children',)
+
     is_container = True
 
     #: this is true if the container is plain (unstyled)
@@ -530,6 +565,9 @@ class Document(Container):
     """
     Outermost node.
     """
+
+    __slots__ = ()
+
     allows_paragraphs = True
     is_document = True
     allowed_in_signatures = True
@@ -539,6 +577,9 @@ class Raw(Container):
     """
     A raw container.
     """
+
+    __slots__ = ()
+
     is_raw = True
 
 
@@ -547,6 +588,8 @@ class Element(Container):
     Baseclass for elements.
     """
 
+    __slots__ = ('id', 'style', 'class_')
+
     def __init__(self, children=None, id=None, style=None, class_=None):
         Container.__init__(self, children)
         self.id = id
@@ -570,6 +613,8 @@ class Span(Element):
     Inline general text element
     """
 
+    __slots__ = ()
+
     allowed_in_signatures = True
 
     def __init__(self, children=None, id=None,
@@ -594,6 +639,8 @@ class InternalLink(Element):
     Page to page links.
     """
 
+    __slots__ = ('force_existing', 'page', 'anchor')
+
     allowed_in_signatures = True
 
     def __init__(self, page, children=None, force_existing=False,
@@ -647,6 +694,8 @@ class InterWikiLink(Element):
     Link to other wikis.
     """
 
+    __slots__ = ('wiki', 'page', 'anchor')
+
     allowed_in_signatures = True
 
     def __init__(self, wiki, page, children=None, anchor=None,
@@ -693,6 +742,9 @@ class Link(Element):
     External or anchor links.
     """
 
+    __slots__ = ('title', 'scheme', 'netloc', 'path', 'params', 'querystring',
+                 'anchor')
+
     allowed_in_signatures = True
 
     def __init__(self, url, children=None, title=None, id=None,
@@ -766,6 +818,7 @@ class Link(Element):
 
 
 class Section(Element):
+    __slots__ = ('level',)
 
     def __init__(self, level, children=None, id=None, style=None, class_=None):
         Element.__init__(self, children, id, style, class_)
@@ -796,6 +849,9 @@ class Paragraph(Element):
     A paragraph.  Everything is in there :-)
     (except of block level stuff)
     """
+
+    __slots__ = ()
+
     is_block_tag = True
     is_paragraph = True
     allowed_in_signatures = True
@@ -828,6 +884,9 @@ class Error(Element):
     If a macro is not renderable or not found this is
     shown instead.
     """
+
+    __slots__ = ()
+
     is_block_tag = True
     allows_paragraphs = True
 
@@ -849,6 +908,8 @@ class Footnote(Element):
     If that transformer is not activated a <small> section is rendered.
     """
 
+    __slots__ = ()
+
     def generate_markup(self, w):
         w.markup(u"((")
         w.start_escaping('))')
@@ -876,6 +937,9 @@ class Quote(Element):
     """
     A blockquote.
     """
+
+    __slots__ = ()
+
     is_block_tag = True
     allows_paragraphs = True
     allowed_in_signatures = True
@@ -904,6 +968,9 @@ class Moderated(Element):
     """
     Text that describes a moderation action.
     """
+
+    __slots__ = ('username',)
+
     is_block_tag = True
     allows_paragraphs = True
     allowed_in_signatures = False
@@ -934,6 +1001,9 @@ class Edited(Element):
     """
     Text that describes an edit action.
     """
+
+    __slots__ = ('username',)
+
     is_block_tag = True
     allows_paragraphs = True
     allowed_in_signatures = False
@@ -964,6 +1034,9 @@ class Preformatted(Element):
     """
     Preformatted text.
     """
+
+    __slots__ = ()
+
     is_block_tag = True
     is_raw = True
     allowed_in_signatures = True
@@ -998,6 +1071,9 @@ class Headline(Element):
     """
     Represents all kinds of headline tags.
     """
+
+    __slots__ = ('level',)
+
     is_block_tag = True
 
     def __init__(self, level, children=None, id=None, style=None, class_=None):
@@ -1036,6 +1112,8 @@ class Strong(Element):
     return a <strong> tag which is usually bold.
     """
 
+    __slots__ = ()
+
     allowed_in_signatures = True
 
     def generate_markup(self, w):
@@ -1064,6 +1142,8 @@ class Highlighted(Strong):
     Marks highlighted text.
     """
 
+    __slots__ = ()
+
     def generate_markup(self, w):
         w.markup('[mark]')
         w.start_escaping('[/mark]')
@@ -1088,6 +1168,8 @@ class Emphasized(Element):
     with an italic font face.
     """
 
+    __slots__ = ()
+
     allowed_in_signatures = True
 
     def generate_markup(self, w):
@@ -1112,6 +1194,7 @@ class Emphasized(Element):
 
 
 class SourceLink(Element):
+    __slots__ = ('target',)
 
     allowed_in_signatures = False
 
@@ -1146,6 +1229,9 @@ class Code(Element):
     preserves whitespace.  Additionally this node is maked raw so children
     are not touched by the altering translators.
     """
+
+    __slots__ = ()
+
     is_raw = True
     allowed_in_signatures = True
 
@@ -1178,6 +1264,8 @@ class Underline(Element):
     also allowed to not render this element in a special way.
     """
 
+    __slots__ = ()
+
     allowed_in_signatures = True
 
     def generate_markup(self, w):
@@ -1209,6 +1297,8 @@ class Stroke(Element):
     This element marks deleted text.
     """
 
+    __slots__ = ()
+
     allowed_in_signatures = True
 
     def generate_markup(self, w):
@@ -1232,6 +1322,8 @@ class Small(Element):
     It's usually rendered in a smaller font.
     """
 
+    __slots__ = ()
+
     allowed_in_signatures = True
 
     def generate_markup(self, w):
@@ -1254,6 +1346,8 @@ class Big(Element):
     The opposite of Small, but it doesn't give the element a real emphasis.
     """
 
+    __slots__ = ()
+
     allowed_in_signatures = True
 
     def generate_markup(self, w):
@@ -1276,6 +1370,8 @@ class Sub(Element):
     Marks text as subscript.
     """
 
+    __slots__ = ()
+
     allowed_in_signatures = True
 
     def generate_markup(self, w):
@@ -1304,6 +1400,8 @@ class Sup(Element):
     Marks text as superscript.
     """
 
+    __slots__ = ()
+
     allowed_in_signatures = True
 
     def generate_markup(self, w):
@@ -1333,6 +1431,8 @@ class Color(Element):
     of backwards compatibility (this time to phpBB).
     """
 
+    __slots__ = ('value',)
+
     allowed_in_signatures = True
 
     def __init__(self, value, children=None, id=None, style=None,
@@ -1366,6 +1466,8 @@ class Size(Element):
     of backwards compatibility.  Requires the font size in percent.
     """
 
+    __slots__ = ('size',)
+
     def __init__(self, size, children=None, id=None, style=None,
                  class_=None):
         Element.__init__(self, children, id, style, class_)
@@ -1397,6 +1499,8 @@ class Font(Element):
     because of backwards compatibility.
     """
 
+    __slots__ = ('faces',)
+
     allowed_in_signatures = True
 
     def __init__(self, faces, children=None, id=None, style=None,
@@ -1431,6 +1535,9 @@ class DefinitionList(Element):
     """
     A list of defintion terms.
     """
+
+    __slots__ = ()
+
     is_block_tag = True
 
     def prepare_html(self):
@@ -1445,6 +1552,9 @@ class DefinitionTerm(Element):
     """
     A definition term has a term (surprise) and a value (the children).
     """
+
+    __slots__ = ('term',)
+
     is_block_tag = True
     allows_paragraphs = True
 
@@ -1475,6 +1585,9 @@ class List(Element):
     Sourrounds list items so that they appear as list.  Make sure that the
     children are list items.
     """
+
+    __slots__ = ('type',)
+
     is_block_tag = True
 
     def __init__(self, type, children=None, id=None, style=None, class_=None):
@@ -1514,6 +1627,9 @@ class ListItem(Element):
     """
     Marks the children as list item.  Use in conjunction with list.
     """
+
+    __slots__ = ()
+
     is_block_tag = True
     allows_paragraphs = True
 
@@ -1541,6 +1657,9 @@ class Box(Element):
     A dialog like object.  Usually renders to a layer with one headline and
     a second layer for the contents.
     """
+
+    __slots__ = ('title', 'align', 'valign')
+
     is_block_tag = True
     allows_paragraphs = True
 
@@ -1580,6 +1699,9 @@ class Layer(Element):
     Like a box but without headline and an nested content section.  Translates
     into a plain old HTML div or something comparable.
     """
+
+    __slots__ = ()
+
     is_block_tag = True
     allows_paragraphs = True
 
@@ -1595,6 +1717,9 @@ class Table(Element):
     """
     A simple table.  This can only contain table rows.
     """
+
+    __slots__ = ()
+
     is_block_tag = True
 
     def __init__(self, children=None, id=None, style=None, class_=None):
@@ -1626,6 +1751,9 @@ class TableRow(Element):
     A row in a table.  Only contained in a table and the only children
     nodes supported are table cells and headers.
     """
+
+    __slots__ = ()
+
     is_block_tag = True
 
     def __init__(self, children=None, id=None, style=None, class_=None):
@@ -1649,6 +1777,9 @@ class TableCell(Element):
     """
     Only contained in a table row and renders to a table cell.
     """
+
+    __slots__ = ('colspan', 'rowspan', 'align', 'valign')
+
     is_block_tag = True
     _html_tag = 'td'
 
@@ -1695,6 +1826,9 @@ class TableHeader(TableCell):
     """
     Exactly like a table cell but renders to <th>
     """
+
+    __slots__ = ()
+
     _html_tag = 'th'
 
 
@@ -1703,6 +1837,8 @@ class TableHeadSection(Element):
     Roughtly translates into a `<thead>` or similar thing.
     """
 
+    __slots__ = ()
+
     def prepare_html(self):
         yield build_html_tag('thead', style=self.style,
                              id=self.id, class_=self.class_)
@@ -1716,6 +1852,8 @@ class TableBodySection(Element):
     Roughtly translates into a `<tbody>` or similar thing.
     """
 
+    __slots__ = ()
+
     def prepare_html(self):
         yield build_html_tag('tbody', style=self.style,
                              id=self.id, class_=self.class_)
@@ -8,12 +8,18 @@
     :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
     :license: GNU GPL, see LICENSE for more details.
 """
-from inyoka.wiki.acl import MultiPrivilegeTest, PRIV_READ
+from hashlib import sha1
+from inyoka.wiki.acl import MultiPrivilegeTest, PRIV_READ, GROUP_OWNER
 from inyoka.wiki.models import Revision, Page
+from inyoka.wiki.storage import storage
 from inyoka.utils.urls import url_for, href
 from inyoka.utils.search import search, SearchAdapter
 
 
+#: increase to reindex all pages with the next index run
+INDEX_VERSION = 1
+
+
 class WikiSearchAuthDecider(object):
     """Decides whetever a user can display a search result or not."""
 
@@ -28,16 +34,26 @@ class WikiSearchAdapter(SearchAdapter):
     type_id = 'w'
     auth_decider = WikiSearchAuthDecider
 
-    def extract_data(self, rev):
+    def get_decider_key(self, user):
+        # the privileges only depend on the groups mentioned in the acl
+        # unless there are rules for the user or for page owners.
+        subjects = set(rule[1] for rule in storage.acl)
+        if user.username in subjects or (not user.is_anonymous and
+                                         '@' + GROUP_OWNER in subjects):
+            return SearchAdapter.get_decider_key(self, user)
+        return u','.join(sorted(group.name for group in user.get_groups()
+                                if '@' + group.name in subjects))
+
+    def extract_data(self, rev, render=True):
         return {'title': rev.page.name,
-                'user': rev.user or u'Anonymer Benutzer',
+                'user': rev.user and rev.user.username or u'Anonymer Benutzer',
                 'date': rev.change_date,
                 'url': url_for(rev.page),
                 'component': u'Wiki',
                 'group': u'Wiki',
                 'group_url': href('wiki'),
                 'highlight': True,
-                'text': rev.rendered_text,
+                'text': render and rev.rendered_text or None,
                 'hidden': rev.deleted,
                 'user_url': url_for(rev.user)}
 
@@ -55,22 +71,65 @@ class WikiSearchAdapter(SearchAdapter):
 
         return [self.extract_data(rev) for rev in revisions]
 
+    def get_fingerprint(self, rev):
+        """
+        Everything the index of a page depends on.  The text of a revision
+        never changes, so its hash represents the text.
+        """
+        return '%d:%s:%s:%d:%d' % (INDEX_VERSION, rev.text.hash,
+            sha1(rev.page.name.encode('utf-8')).hexdigest(),
+            rev.deleted, rev.attachment_id or 0)
+
     def store(self, page_id):
-        rev = Revision.objects.select_related('page', 'text') \
+        rev = Revision.objects.select_related('page', 'user', 'text',
+                                              'attachment') \
                 .filter(page__id=page_id).latest()
+        # most queued pages were only saved because of their metadata or
+        # links pointing to them, skip them if nothing we index changed.
+        fingerprint = self.get_fingerprint(rev)
+        if search.get_fingerprint('w', rev.page.id) == fingerprint:
+            return
+        # index the text without the markup
+        text = rev.text.find_meta()['text']
+        display = None
+        if self.store_display:
+            display = self.extract_data(rev, render=False)
+            display['text'] = text
+        if rev.attachment_id:
+            self._store_attachment(rev, text, fingerprint, display)
+            return
         search.store(component='w',
                      uid=rev.page.id,
                      title=rev.page.name,
                      user=rev.user_id,
                      date=rev.change_date,
                      auth=rev.page.name,
-                     text=rev.text.value,
-                     category=rev.attachment_id and '__attachment__' or None)
+                     text=text,
+                     fingerprint=fingerprint,
+                     display=display)
+
+    def _store_attachment(self, rev, description, fingerprint, display):
+        parent, filename = (u'/' + rev.page.name).rsplit(u'/', 1)
+        text = [description, parent.strip(u'/')]
+        try:
+            text.append(rev.attachment.mimetype.replace(u'/', u' '))
+        except (IOError, OSError):
+            pass
+        search.store(component='w',
+                     uid=rev.page.id,
+                     title=filename,
+                     user=rev.user_id,
+                     date=rev.change_date,
+                     auth=rev.page.name,
+                     text=[x for x in text if x],
+                     category='__attachment__',
+                     fingerprint=fingerprint,
+                     display=display)
 
     def get_doc_ids(self):
         pages = Page.objects.values_list('id', flat=True).order_by()
-        for row in pages:
-            yield row[0]
+        for id in pages:
+            yield id
 
 
 search.register(WikiSearchAdapter())
@@ -19,7 +19,7 @@ from inyoka.utils.http import HttpResponse
 from inyoka.utils.services import SimpleDispatcher
 from inyoka.wiki.utils import get_smilies
 from inyoka.wiki.parser import parse, RenderContext
-from inyoka.wiki.models import Page
+from inyoka.wiki.models import Page, page_completion
 
 
 def on_get_smilies(request):
@@ -27,6 +27,13 @@ def on_get_smilies(request):
     return get_smilies()
 
 
+def on_get_pagename_autocompletion(request):
+    names = page_completion.complete(request.GET.get('q', ''), 11)
+    if len(names) > 10:
+        names[10] = '...'
+    return names
+
+
 def on_render_preview(request):
     """Render some preview text."""
     page = None
@@ -42,4 +49,5 @@ def on_render_preview(request):
 
 dispatcher = SimpleDispatcher(
     get_smilies=on_get_smilies,
+    get_pagename_autocompletion=on_get_pagename_autocompletion,
     render_preview=on_render_preview)
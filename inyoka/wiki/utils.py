@@ -42,11 +42,15 @@ def debug_repr(obj):
     A function that does a debug repr for an object.  This is used by all the
     `nodes`, `macros` and `parsers` so that we get a debuggable ast.
     """
+    if hasattr(obj, '__dict__'):
+        attributes = obj.__dict__
+    else:
+        attributes = getattr(obj, '__getstate__', dict)()
     return '%s.%s(%s)' % (
         obj.__class__.__module__.rsplit('.', 1)[-1],
         obj.__class__.__name__,
         ', '.join('%s=%r' % (key, value)
-        for key, value in sorted(getattr(obj, '__dict__', {}).items())
+        for key, value in sorted(attributes.items())
         if not key.startswith('_')))
 
 
@@ -141,6 +145,35 @@ def quote_text(text, author=None, item_url=None):
     ) or u''
 
 
+def collect_dependents(pages, get_embedders, limit, max_depth):
+    """
+    Collect the pages that embed one of `pages`, transitively.
+    `get_embedders` is called with a set of page names and returns the
+    names of the pages embedding one of them.  The walk stops after
+    `max_depth` levels or if more than `limit` pages are collected.
+    Cycles are walked only once.
+
+    Return a set of the collected page names (including `pages`) and
+    whether the walk was cut short.
+    """
+    seen = set(pages)
+    level = seen
+    depth = 0
+    while level:
+        embedders = set(get_embedders(level)) - seen
+        if not embedders:
+            break
+        if depth >= max_depth:
+            return seen, True
+        if len(seen) + len(embedders) > limit:
+            seen.update(sorted(embedders)[:max(0, limit - len(seen))])
+            return seen, True
+        seen.update(embedders)
+        level = embedders
+        depth += 1
+    return seen, False
+
+
 class ArgumentCollector(type):
     """
     Metaclass for classes that accept arguments.
@@ -29,6 +29,8 @@ dbname = os.environ.get('INYOKA_TEST_DATABASE', 'inyoka_test')
 settings.DATABASE_NAME = dbname
 instance_dir = os.tempnam()
 settings.MEDIA_ROOT = os.path.join(instance_dir, 'media')
+settings.MAIL_BACKEND = 'file'
+settings.MAIL_FILE_PATH = os.path.join(instance_dir, 'mails')
 os.mkdir(instance_dir)
 
 # now run the migrations
@@ -0,0 +1,130 @@
+#-*- coding: utf-8 -*-
+"""
+    test_utils_cache
+    ~~~~~~~~~~~~~~~~
+
+    Tests for the cache layers in `inyoka.utils.cache`.
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+import time
+from werkzeug.contrib.cache import SimpleCache
+from inyoka.utils.cache import ProcessCache, RequestCache, CacheNamespace, \
+     get_or_create, update_cached, cache
+from inyoka.utils.local import local, local_manager
+
+
+def test_process_cache_generations():
+    real = SimpleCache()
+    cache = RequestCache(real, ProcessCache({'forum/slugs': 300}))
+    cache.set('forum/slugs', {1: 'foo'})
+    # remove the value behind the back of the process cache
+    real.delete('forum/slugs')
+    assert cache.get('forum/slugs') == {1: 'foo'}
+    assert cache.process_cache.get_stats()['forum/slugs'] == (1, 0)
+    # a delete bumps the generation and drops the process copy
+    cache.set('forum/slugs', {1: 'foo'})
+    cache.delete('forum/slugs')
+    assert real.get('generation/forum/slugs') == 1
+    assert cache.get('forum/slugs') is None
+
+
+def test_process_cache_lru():
+    cache = ProcessCache({'wiki/': 300}, max_items=10)
+    for x in xrange(11):
+        cache.set('wiki/%d' % x, 'wiki/', 0, x)
+    assert cache.get('wiki/0', 'wiki/', 0) is None
+    assert cache.get('wiki/10', 'wiki/', 0) == 10
+    # other generations are treated as missing
+    assert cache.get('wiki/10', 'wiki/', 1) is None
+
+
+def test_process_cache_copy():
+    cache = ProcessCache({'forum/forums/': 300}, ['forum/forums/'])
+    value = {'name': 'foo'}
+    cache.set('forum/forums/foo', 'forum/forums/', 0, value)
+    copy = cache.get('forum/forums/foo', 'forum/forums/', 0)
+    assert copy == value and copy is not value
+
+
+def test_cache_namespace():
+    ns = CacheNamespace('forum/topics')
+    key = ns.key(1, 2)
+    assert key.startswith('forum/topics/1/') and key.endswith('/2')
+    assert ns.key(1, 2) == key
+    other = ns.key(2, 2)
+    ns.invalidate(1)
+    assert ns.key(1, 2) != key
+    assert ns.key(2, 2) == other
+    # an evicted counter does not restart at an old generation
+    cache.delete('ns/forum/topics/3')
+    ns.invalidate(3)
+    assert cache.get('ns/forum/topics/3') > int(time.time()) - 5
+
+
+def test_get_or_create():
+    calls = []
+    def creator():
+        calls.append(1)
+        return len(calls)
+    assert get_or_create('test/fill', creator, 300) == 1
+    assert get_or_create('test/fill', creator, 300) == 1
+    # a soft expired value is refreshed by the lock holder
+    cache.set('test/fill', (1, time.time() - 1), 300)
+    assert get_or_create('test/fill', creator, 300) == 2
+    # but the others get the stale value while the lock is held
+    cache.set('test/fill', (2, time.time() - 1), 300)
+    cache.add('test/fill/__lock', 1, 30)
+    assert get_or_create('test/fill', creator, 300) == 2
+    assert len(calls) == 2
+    cache.delete('test/fill/__lock')
+    # raw values of older versions are treated as missing
+    for value in (u'<feed/>', (u'foo', 42)):
+        cache.set('test/fill', value, 300)
+        assert get_or_create('test/fill', creator, 300) == len(calls)
+    assert len(calls) == 4
+
+
+def test_update_cached():
+    update_cached('test/update', lambda v: v + 1)
+    assert cache.get('test/update') is None
+    cache.set('test/update', 1)
+    update_cached('test/update', lambda v: v + 1)
+    assert cache.get('test/update') == 2
+    # a concurrent update drops the value and the one of the lock holder
+    def updater(value):
+        cache.set('test/update', 2)
+        update_cached('test/update', lambda v: v + 1)
+        assert cache.get('test/update') is None
+        return value + 1
+    update_cached('test/update', updater)
+    assert cache.get('test/update') is None
+    assert cache.get('test/update/__dirty') is None
+    assert cache.get('test/update/__lock') is None
+    # also when the lock is held by get_or_create
+    def creator():
+        update_cached('test/fill', lambda v: v)
+        return 1
+    cache.delete('test/fill')
+    assert get_or_create('test/fill', creator) == 1
+    assert cache.get('test/fill') is None
+
+
+def test_request_cache_batched():
+    real = SimpleCache()
+    cache = RequestCache(real, ProcessCache({'forum/slugs': 300}))
+    local.cache = {}
+    try:
+        cache.set_many({'a': 1, 'b': 2, 'forum/slugs': 3})
+        real.delete_many('a', 'forum/slugs')
+        real.set('c', 4)
+        # `a` only exists in the thread local cache, `forum/slugs` in the
+        # process cache and `c` only in the real cache
+        assert cache.get_dict('a', 'b', 'c', 'd', 'forum/slugs') == \
+            {'a': 1, 'b': 2, 'c': 4, 'd': None, 'forum/slugs': 3}
+        assert cache.get_many('c', 'a', 'd') == [4, 1, None]
+        cache.delete_many('a', 'c', 'forum/slugs')
+        assert cache.get_many('a', 'c', 'forum/slugs') == [None, None, None]
+    finally:
+        local_manager.cleanup()
@@ -0,0 +1,61 @@
+#-*- coding: utf-8 -*-
+"""
+    test_utils_completion
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Tests for the autocompletion prefix index.
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+from inyoka.utils.completion import PrefixIndex
+
+
+NAMES = [u'Foo', u'foobar', u'Fob', u'fnord', u'Bar baz', u'Ärger']
+
+
+def test_prefix_index():
+    loaded = []
+    def _load(shard):
+        loaded.append(shard)
+        return [name for name in NAMES if name.lower().startswith(shard)]
+    index = PrefixIndex('test/names', _load)
+
+    assert index.complete(u'f') == []
+    assert index.complete(u'FO') == [u'Fob', u'Foo', u'foobar']
+    assert index.complete(u'foo', 1) == [u'Foo']
+    assert index.complete(u'bar ') == [u'Bar baz']
+    assert index.complete(u'är') == [u'Ärger']
+    assert index.complete(u'fn') == [u'fnord']
+    # every shard is loaded once
+    assert loaded == [u'fo', u'ba', u'är', u'fn']
+
+    index.add(u'Fooo')
+    index.remove(u'foobar')
+    index.remove(u'missing')
+    assert index.complete(u'foo') == [u'Foo', u'Fooo']
+    # names of shards that are not loaded are picked up by the loader
+    index.add(u'Xylophon')
+    assert index.complete(u'xy') == []
+    assert len(loaded) == 5
+
+
+def test_split_shards():
+    loaded = []
+    names = list(NAMES)
+    def _load(shard):
+        loaded.append(shard)
+        return [name for name in names if name.lower().startswith(shard)]
+    index = PrefixIndex('test/split', _load, max_shard_size=2)
+
+    assert index.complete(u'fo') == []
+    assert index.complete(u'foo') == [u'Foo', u'foobar']
+    assert index.complete(u'fob') == [u'Fob']
+    assert loaded == [u'fo', u'foo', u'fob']
+
+    # a shard that grows too big is split when it is loaded again
+    names.append(u'Fooo')
+    index.add(u'Fooo')
+    assert index.complete(u'foo') == []
+    assert index.complete(u'fooo') == [u'Fooo']
+    assert index.complete(u'foob') == [u'foobar']
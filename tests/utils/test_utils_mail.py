@@ -0,0 +1,54 @@
+#-*- coding: utf-8 -*-
+"""
+    test_utils_mail
+    ~~~~~~~~~~~~~~~
+
+    Tests for sending mails with `inyoka.utils.mail`.
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+from __future__ import with_statement
+import os
+import shutil
+import tempfile
+from email import message_from_string
+from inyoka.conf import settings
+from inyoka.utils.mail import send_mail, send_mass_mail, mail_session
+
+
+def _sent_mails(path):
+    mails = []
+    for name in sorted(os.listdir(path)):
+        f = open(os.path.join(path, name))
+        try:
+            mails.append(message_from_string(f.read()))
+        finally:
+            f.close()
+    return mails
+
+
+def test_send_mass_mail():
+    old_backend, old_path = settings.MAIL_BACKEND, settings.MAIL_FILE_PATH
+    settings.MAIL_BACKEND = 'file'
+    settings.MAIL_FILE_PATH = tempfile.mkdtemp()
+    try:
+        assert send_mass_mail([
+            (u'Grüße', u'Hallo Welt', 'system@example.com',
+             ['a@example.com', 'b@example.com', 'c@example.invalid']),
+            (u'Test', u'foo', 'system@example.com', ['c@example.com']),
+        ]) == 3
+        mails = _sent_mails(settings.MAIL_FILE_PATH)
+        assert [m['To'] for m in mails] == \
+            ['a@example.com', 'b@example.com', 'c@example.com']
+        assert mails[0]['From'] == 'system@example.com'
+        assert mails[0].get_payload(decode=True) == 'Hallo Welt'
+
+        with mail_session() as backend:
+            send_mail(u'Test', u'bar', 'system@example.com', ['d@example.com'])
+            with mail_session() as inner:
+                assert inner is backend
+        assert len(_sent_mails(settings.MAIL_FILE_PATH)) == 4
+    finally:
+        shutil.rmtree(settings.MAIL_FILE_PATH)
+        settings.MAIL_BACKEND, settings.MAIL_FILE_PATH = old_backend, old_path
@@ -0,0 +1,42 @@
+#-*- coding: utf-8 -*-
+"""
+    test_utils_search
+    ~~~~~~~~~~~~~~~~~
+
+    Tests for the search results.
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+import xapian
+from cPickle import dumps, loads
+from inyoka.utils.search import SearchAdapter, SearchResult
+
+
+class _Adapter(SearchAdapter):
+    type_id = 't'
+
+    def recv_multi(self, docids):
+        # document 3 was deleted from the database but not from the index
+        return [id == 2 and {'title': u'loaded'} or None for id in docids]
+
+
+def test_search_result_missing_documents():
+    database = xapian.inmemory_open()
+    for id, payload in (1, dumps({'title': u'stored'})), (2, ''), (3, ''):
+        doc = xapian.Document()
+        doc.add_term('foo')
+        doc.add_value(0, 't:%d' % id)
+        doc.set_data(payload)
+        database.add_document(doc)
+    query = xapian.Query('foo')
+    enquire = xapian.Enquire(database)
+    enquire.set_query(query)
+    enquire.set_docid_order(enquire.ASCENDING)
+    mset = enquire.get_mset(0, 10)
+
+    result = SearchResult(mset, enquire, query, 1, 10, {'t': _Adapter()})
+    assert [doc['title'] for doc in result.results] == [u'stored', u'loaded']
+    # the results are cached
+    result = loads(dumps(result, 2))
+    assert [doc['title'] for doc in result.results] == [u'stored', u'loaded']
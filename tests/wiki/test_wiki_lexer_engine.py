@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+    test_wiki_lexer_engine
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Compares the token streams of the lexer with the ones of the old lexer
+    engine that tried every rule at every position.
+
+    :copyright: (c) 2007-2010 by the Inyoka Team, see AUTHORS for more details.
+    :license: GNU GPL, see LICENSE for more details.
+"""
+import random
+from inyoka.wiki.parser.lexer import Lexer, escape
+
+
+class ReferenceLexer(Lexer):
+    """The lexer with the engine before the scanner."""
+
+    def tokenize_block(self, string, _escape_hint=None):
+        escaped = False
+        pos = 0
+        end = len(string)
+        stack = [(None, 'everything')]
+        rule_cache = self.get_state_rules()
+        text_buffer = []
+        add_text = text_buffer.append
+        flatten = u''.join
+
+        while pos < end:
+            state = stack[-1][1]
+            for rule in rule_cache[state]:
+                m = rule.match(string, pos)
+                if m is not None:
+                    if escaped or _escape_hint is not None:
+                        add_text(m.group())
+                        pos = m.end()
+                        if _escape_hint is not None:
+                            _escape_hint.append(m.start())
+                        escaped = False
+                        break
+                    if text_buffer:
+                        text = flatten(text_buffer)
+                        if text:
+                            yield 'text', text
+                        del text_buffer[:]
+                    if rule.enter is not None:
+                        stack.append((rule.enter + '_end', rule.enter))
+                        yield rule.enter + '_begin', m.group()
+                    elif rule.silententer is not None:
+                        stack.append((None, rule.silententer))
+                    if callable(rule.token):
+                        for item in rule.token(m):
+                            yield item
+                    elif rule.token is not None:
+                        yield rule.token, m.group()
+                    pos = m.end()
+                    for x in xrange(rule.leave):
+                        announce, item = stack.pop()
+                        if announce is not None:
+                            yield announce, m.group()
+                    if rule.switch:
+                        announce, item = stack.pop()
+                        if announce is not None:
+                            stack.append((announce, rule.switch))
+                    break
+            else:
+                escaped = self._add_char(add_text, string, pos, string[pos],
+                                         escaped)
+                pos += 1
+
+        if escaped:
+            add_text('\\')
+        if text_buffer:
+            text = flatten(text_buffer)
+            if text:
+                yield 'text', text
+        for announce, item in reversed(stack):
+            if announce is not None:
+                yield announce, u''
+
+
+FRAGMENTS = [
+    u"''", u"'''", u'__', u'`', u'``', u'--(', u')--', u'~-(', u')-~',
+    u'~+(', u')+~', u',,(', u'),,', u'^^(', u')^^', u'((', u'))',
+    u'[[Inhaltsverzeichnis]]', u'[[Anker(foo)]]', u'[[Bild(a.png, 20)]]',
+    u'[[Vorlage(Baustelle, "Text, mit Komma", x=1) ]]', u'[[Foo',
+    u'[@Befehl(sudo apt-get install foo) @]', u'[@Foo(', u')]',
+    u'[color=red]', u'[/color]', u'[size=12]', u'[/size]', u'[font=Arial]',
+    u'[/font]', u'[mod=foo]', u'[/mod]', u'[edit=bar]', u'[/edit]',
+    u'[raw]\'\'raw\'\'[/raw]', u'[mark]', u'[/mark]', u'\\\\\n', u'\\\\',
+    u'\\', u'\\\\\\', u'\\[', u"\\''", u'<!-- comment -->', u'<!--',
+    u'[1]', u'[http://example.com/]', u'[http://example.com/ Beispiel]',
+    u'[:Seite:]', u'[:Seite:Titel]', u'[wikipedia:Ubuntu:]', u'[:Seite#a:',
+    u'http://ubuntuusers.de/foo/bar.html', u'mailto:foo@bar.org',
+    u'irc://irc.freenode.net/ubuntu', u'(http://example.com)', u']',
+    u'\n## Kommentar\n', u'\n#tag: foo, "bar, baz"\n', u'\n= Titel =\n',
+    u'\n=== ~+(Groß)+~ ===\n', u'\n Begriff:: Erklärung\n',
+    u'\n||<-2 rowclass="x"> a || b ||\n', u'\n|| a ||\n|| b || c ||\n',
+    u'\n * Punkt\n', u'\n 1. eins\n', u'\n  - zwei\n',
+    u'{{|<title="Box">', u'{{|', u'|}}', u'{{{', u'}}}', u'{{{#!code python\n',
+    u'{{{#!vorlage Hinweis\n', u'\n' + u'<' * 40 + u'\n', u'\n' + u'=' * 40
+    + u'\n', u'\n' + u'>' * 40 + u'\n', u'\n----\n', u'\n> zitat\n',
+    u'\n>> tiefer\n', u'Text', u'Häuser und Straßen', u' ', u'  ', u'\n',
+    u'\n\n', u'\t', u'foo bar baz', u'a:b', u'(', u')', u'"', u"'", u',',
+    u'=', u'<', u'>', u'|', u'#', u'::', u'[', u'x=1'
+]
+
+PAGES = [
+    u"''foo'''bar'''baz'' und __unterstrichen__ `code` ``esc`code`ped``",
+    u"''abcde '''fett''' und '''fett''' abcde''",
+    u'= Überschrift =\n\n[[Inhaltsverzeichnis(2)]]\n\nText mit '
+    u'[:Seite:Link] und [http://example.com/ extern].\n\n== Unter ==\n'
+    u' * eins\n * zwei\n  * drei\n',
+    u'{{{#!code python\ndef foo():\n    return "}}"\n}}}\nDanach.',
+    u'{{{\nroh \'\'nicht fett\'\' [mark]markiert[/mark]\n}}}',
+    u'||<:> a || b ||\n||<-2 style="color: red"> c ||\n',
+    u'{{|<class="box">\nInhalt mit \'\'\'fett\'\'\'\n|}}',
+    u'> foo\n>> \'\'\'bar\n>> bar\'\'\'\n> foo\n{{{\n> kein zitat\n}}}',
+    u'#tag: a, b\n#X-Link: "Seite"\nText\\\\\nnach Umbruch',
+    u'\\[[Makro]] \\\\\\[:x:] \\``code`` ende\\',
+    u'<' * 40 + u'\nmine\n' + u'=' * 40 + u'\ntheirs\n' + u'>' * 40,
+    u'[[Vorlage(Befehl, "sudo apt-get install ubuntu-restricted-extras")]]',
+    u'Fußnote((mit ((Verschachtelung)) und [1]))',
+    u'[mod=foo]Moderation [edit=bar]Bearbeitung[/edit][/mod]',
+    u'Siehe http://wiki.ubuntuusers.de/Startseite?action=edit#anker, '
+    u'oder mailto:foo@example.com.',
+]
+
+
+def make_corpus(count=300, seed=0):
+    """Return a list of random markup snippets and some handwritten pages."""
+    rnd = random.Random(seed)
+    corpus = list(PAGES)
+    for x in xrange(count):
+        corpus.append(u''.join(rnd.choice(FRAGMENTS) for y in
+                               xrange(rnd.randint(1, 40))))
+    return corpus
+
+
+def test_token_streams():
+    lexer = Lexer()
+    reference = ReferenceLexer()
+    for text in make_corpus():
+        assert list(lexer.tokenize(text)) == list(reference.tokenize(text)), \
+            repr(text)
+        assert list(lexer.tokenize_block(text)) == \
+            list(reference.tokenize_block(text)), repr(text)
+
+
+def test_escape():
+    reference = ReferenceLexer()
+    for text in make_corpus(100, 1):
+        assert escape(text) == reference.escape(text), repr(text)
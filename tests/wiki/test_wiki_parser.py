@@ -8,7 +8,9 @@
     :copyright: Copyright 2007 by Armin Ronacher.
     :license: GNU GPL.
 """
-from inyoka.wiki.parser import Parser, nodes
+from cPickle import loads, dumps
+from inyoka.wiki.parser import Parser, StackExhaused, MAXIMUM_DEPTH, \
+     nodes, parse as parse_markup
 
 
 def parse(code):
@@ -209,3 +211,40 @@ def test_external_links():
         nodes.Link('http://example.org', [nodes.Text(':blub:')]),
         nodes.Link('?action=edit')
     ])
+
+
+def test_deep_nesting():
+    """Nodes nested too deep are converted into text."""
+    depth = MAXIMUM_DEPTH + 50
+    markup = u'((' * depth + u'foo' + u'))' * depth
+    tree = parse(markup)
+    node = tree
+    for x in xrange(MAXIMUM_DEPTH):
+        assert node.children[0].__class__ is nodes.Footnote
+        node = node.children[0]
+    assert node.children == [nodes.Text('foo')]
+    # the recursive walkers cope with the deepest tree
+    assert tree.text == u'foo'
+    assert u'foo' in u''.join(tree.prepare_html())
+    assert loads(dumps(tree, 2)) == tree
+    assert parse(u'((' * 250 + u'x' + u'))' * 250).text == u'x'
+
+    parser = Parser(u'((foo))', transformers=[])
+    parser.parse()
+    assert not parser.depth_exceeded
+    try:
+        parse_markup(markup, catch_stack_errors=False, transformers=[])
+    except StackExhaused:
+        pass
+    else:
+        raise AssertionError('StackExhaused not raised')
+
+
+def test_node_slots():
+    """Nodes have no dict but compare and pickle by their slots."""
+    tree = parse("[:foo:bar] ''baz'' [http://example.org]")
+    for node in tree.query.all:
+        assert not hasattr(node, '__dict__')
+    for protocol in 0, 2:
+        assert loads(dumps(tree, protocol)) == tree
+    assert tree != parse("[:foo:bar] ''baz'' [http://example.com]")
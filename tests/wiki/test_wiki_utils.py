@@ -9,6 +9,9 @@
     :license: GNU GPL.
 """
 from inyoka.utils.text import join_pagename, normalize_pagename
+from inyoka.wiki.utils import collect_dependents
+from inyoka.wiki.models import PageIndex, dump_instructions, \
+     load_instructions
 
 
 def test_join_pagename():
@@ -27,3 +30,45 @@ def test_normalize_pagename():
     assert n("Foo Bar") == "Foo_Bar"
     assert n("/Foo_Bar/") == "Foo_Bar"
     assert n("Foo%Bar?#") == "FooBar"
+
+
+def test_page_index():
+    index = PageIndex([(u'Foo', False, False), (u'Foo/Bild.png', False, True),
+                       (u'Gelöscht', True, False)])
+    assert index.pages == frozenset([u'Foo'])
+    loaded = PageIndex.loads(index.dumps())
+    assert loaded.objects == index.objects
+    assert loaded.flags[u'Foo/Bild.png'] == (False, True)
+    renamed = loaded.changed(u'Bar', False, False, u'Foo')
+    assert renamed.pages == frozenset([u'Bar'])
+    assert renamed.changed(None, False, False, u'Bar').pages == frozenset()
+    assert PageIndex.loads(PageIndex([]).dumps()).objects == []
+
+
+def test_instructions():
+    for instructions in ('!html\0short', '!html\0' + 'long text ' * 100):
+        data = dump_instructions(instructions)
+        assert load_instructions(data) == instructions
+    assert len(dump_instructions('!html\0' + 'x' * 1000)) < 100
+    assert load_instructions(None) is None
+    # instructions of another version are compiled again
+    assert load_instructions('0-!html\0short') is None
+
+
+def test_collect_dependents():
+    # page -> pages embedding it
+    graph = {'A': ['B', 'C'], 'B': ['D'], 'C': ['D', 'A'], 'D': ['E'],
+             'X': ['Y%d' % x for x in xrange(10)]}
+    calls = []
+    def _get_embedders(names):
+        calls.append(set(names))
+        return [e for name in names for e in graph.get(name, ())]
+
+    pages, truncated = collect_dependents(['A'], _get_embedders, 100, 10)
+    assert pages == set('ABCDE') and not truncated
+    # the cycle A -> C -> A is walked once
+    assert calls == [set('A'), set('BC'), set('D'), set('E')]
+    assert collect_dependents(['A'], _get_embedders, 100, 1) == \
+        (set('ABC'), True)
+    pages, truncated = collect_dependents(['X'], _get_embedders, 5, 10)
+    assert len(pages) == 5 and truncated